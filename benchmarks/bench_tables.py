@@ -0,0 +1,81 @@
+"""
+Inventory of a metadata-heavy file: parameter, level and time range names
+
+Compares the text inventory (`wgrib -s`), per-record lookups through the
+extension and the vectorized TableRegistry lookups on a synthetic file of
+tiny records spread over many tables, levels and time ranges.
+
+    python benchmarks/bench_tables.py [--records N] [--repeat R]
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import wgrib  # noqa: E402
+from wgrib import wgrib as _wgrib  # noqa: E402
+from wgrib.tables import TableRegistry  # noqa: E402
+
+from synthetic import metadata_file  # noqa: E402
+
+
+def text_inventory(path):
+    out, err = wgrib.call_wgrib(['wgrib', path, '-s'])
+    return out.splitlines()
+
+
+def per_record(records):
+    '''What an uncached lookup loop costs: one C call per record and key'''
+    return [(_wgrib.param_name(r.center, r.subcenter, r.table, r.process,
+                               r.kpds5)[0],
+             _wgrib.level_text(r.kpds6, r.kpds7, r.center),
+             _wgrib.time_text(r.time_range, r.p1, r.p2, r.time_unit))
+            for r in records]
+
+
+def registry_cold(records):
+    registry = TableRegistry()
+    return registry.params(records), registry.levels(records), \
+        registry.time_ranges(records)
+
+
+def registry_warm(records, registry=TableRegistry()):
+    return registry.params(records), registry.levels(records), \
+        registry.time_ranges(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = metadata_file(os.path.join(tmp, 'metadata.grb'), args.records)
+        records = wgrib.scan(path)
+        registry_warm(records)
+        cases = [('text_inventory', lambda: text_inventory(path)),
+                 ('per_record_lookup', lambda: per_record(records)),
+                 ('registry_cold', lambda: registry_cold(records)),
+                 ('registry_warm', lambda: registry_warm(records))]
+        results = {'records': len(records)}
+        for name, func in cases:
+            seconds = min(timeit.repeat(func, number=1, repeat=args.repeat))
+            results[name] = seconds
+            print('{:20s} {:8.3f} s  {:10.0f} records/s'.format(
+                name, seconds, len(records) / seconds), file=sys.stderr)
+        print(json.dumps(results, indent=1, sort_keys=True))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
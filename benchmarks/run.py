@@ -0,0 +1,214 @@
+"""
+Offline benchmark suite
+
+Times scanning (seek_grib and the mmap scanner), text inventories (which
+call_wgrib captures in memory), the descriptor capture of wgrib/lib.py,
+BDS_unpack over bit widths, bitmaps, spherical harmonics and ECMWF large
+records, reductions and the -ieee/-bin/-grib dumps, on synthetic files
+written to a temporary directory (see synthetic.py).  Results go to
+stdout (or --output) as JSON, one entry per case with records/s and MB/s
+of GRIB data; --compare reports the change against an earlier result and
+exits with status 1 when a case slowed down by more than --tolerance.
+
+    python benchmarks/run.py --output new.json [--quick] [--filter decode]
+    python benchmarks/run.py --compare base.json
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import wgrib  # noqa: E402
+from wgrib import lib  # noqa: E402
+
+from synthetic import grid_file  # noqa: E402
+
+MB = float(1 << 20)
+
+# name -> grid_file() arguments; counts are scaled down by --quick
+FILES = {
+    'tiny': dict(count=100000, nx=2, ny=2, n_bits=8, variants=64),
+    'inventory': dict(count=20000, nx=2, ny=2, n_bits=8, variants=64),
+    'bits1': dict(count=32, n_bits=1),
+    'bits8': dict(count=32, n_bits=8),
+    'bits12': dict(count=32, n_bits=12),
+    'bits16': dict(count=32, n_bits=16),
+    'bits24': dict(count=32, n_bits=24),
+    'bits32': dict(count=32, n_bits=32),
+    'bitmap50': dict(count=32, n_bits=12, bitmap=0.5),
+    'bitmap95': dict(count=32, n_bits=12, bitmap=0.95),
+    'harmonic': dict(count=32, n_bits=16, truncation=213),
+    'ec_large': dict(count=2, nx=3000, ny=3000, n_bits=8, ec_large=True),
+}
+
+
+def _scan(path):
+    return len(wgrib.scan(path))
+
+
+def _scan_mmap(path):
+    with wgrib.GribFile(path, index=False) as grb:
+        return len(grb)
+
+
+def _inventory(option):
+    def run(path):
+        out, err = wgrib.call_wgrib(['wgrib', path, option])
+        return out.count('\n')
+    return run
+
+
+def _capture_fd(path):
+    '''wgrib/lib.py capture through a pipe on the stdout descriptor'''
+    out, err = lib.grab_output(lib.wgrib)('wgrib', path, '-s')
+    return out.count('\n')
+
+
+def _decode(path):
+    with wgrib.GribFile(path, index=False) as grb:
+        for record in grb:
+            grb.read(record)
+        return len(grb)
+
+
+def _decode_threaded(path):
+    '''_decode with every field split over one thread per CPU'''
+    previous = wgrib.set_unpack_threads(0, 0)
+    try:
+        return _decode(path)
+    finally:
+        wgrib.set_unpack_threads(*previous)
+
+
+def _reduce(axis):
+    def run(path):
+        with wgrib.GribFile(path, index=False) as grb:
+            wgrib.reduce(grb, ('min', 'max', 'mean', 'std'), axis=axis)
+            return len(grb)
+    return run
+
+
+def _dump(option, tmp):
+    def run(path):
+        out = os.path.join(tmp, 'dump')
+        out, err = wgrib.call_wgrib(['wgrib', path, '-d', 'all', option,
+                                     '-o', out])
+        return out.count('\n')
+    return run
+
+
+def cases(tmp):
+    '''(name, file, function of the path returning the records done)'''
+    yield 'scan', 'tiny', _scan
+    yield 'scan_mmap', 'tiny', _scan_mmap
+    yield 'inventory_s', 'inventory', _inventory('-s')
+    yield 'inventory_v', 'inventory', _inventory('-v')
+    yield 'capture_fd', 'inventory', _capture_fd
+    for name in sorted(FILES):
+        if name not in ('tiny', 'inventory'):
+            yield 'decode_' + name, name, _decode
+    yield 'decode_threaded', 'ec_large', _decode_threaded
+    yield 'reduce_record', 'bits12', _reduce('record')
+    yield 'reduce_time', 'bits12', _reduce('time')
+    for option in ('ieee', 'bin', 'grib'):
+        yield 'dump_' + option, 'bits12', _dump('-' + option, tmp)
+
+
+def run(args):
+    tmp = tempfile.mkdtemp()
+    results = []
+    try:
+        paths = {}
+        for name, file, func in cases(tmp):
+            if args.filter and not any(f in name for f in args.filter):
+                continue
+            if file not in paths:
+                spec = dict(FILES[file])
+                if args.quick:
+                    spec['count'] = max(1, spec['count'] // 20)
+                paths[file] = grid_file(os.path.join(tmp, file + '.grb'),
+                                        **spec)
+            path = paths[file]
+            records = func(path)
+            seconds = min(timeit.repeat(lambda: func(path), number=1,
+                                        repeat=args.repeat))
+            size = os.path.getsize(path)
+            results.append({
+                'name': name,
+                'file': file,
+                'records': records,
+                'bytes': size,
+                'seconds': seconds,
+                'records_per_s': records / seconds,
+                'mb_per_s': size / MB / seconds,
+            })
+            print('{:16s} {:8.4f} s {:12.0f} records/s {:9.1f} MB/s'.format(
+                name, seconds, records / seconds, size / MB / seconds),
+                file=sys.stderr)
+    finally:
+        shutil.rmtree(tmp)
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'quick': args.quick,
+        'results': results,
+    }
+
+
+def compare(base, new, tolerance):
+    '''Prints the change of every case, returns the names of regressions'''
+    old = dict((r['name'], r) for r in base['results'])
+    slower = []
+    print('{:16s} {:>14s} {:>14s} {:>8s}'.format(
+        'case', 'base rec/s', 'new rec/s', 'change'), file=sys.stderr)
+    for r in new['results']:
+        b = old.get(r['name'])
+        if b is None:
+            continue
+        change = r['records_per_s'] / b['records_per_s'] - 1
+        flag = ''
+        if change < -tolerance:
+            slower.append(r['name'])
+            flag = '  SLOWER'
+        print('{:16s} {:14.0f} {:14.0f} {:+7.1%}{}'.format(
+            r['name'], b['records_per_s'], r['records_per_s'], change, flag),
+            file=sys.stderr)
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--quick', action='store_true',
+                        help='files 20 times smaller')
+    parser.add_argument('--filter', action='append',
+                        help='only cases whose name contains this')
+    parser.add_argument('--output', help='JSON results file (default stdout)')
+    parser.add_argument('--compare', help='JSON results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='slowdown reported as a regression (0.1 = 10%%)')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    else:
+        print(json.dumps(results, indent=1, sort_keys=True))
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(json.load(f), results, args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Synthetic GRIB (edition 1) files for the benchmarks
+
+Messages are built from scratch (simple packing of 0 to 32 bit values on
+a regular lat/lon grid, optionally with a bitmap, or of spherical harmonic
+coefficients), so the benchmarks need no downloaded data.  Messages can
+use the ECMWF encoding of the length of records over 8 MB.
+"""
+from __future__ import print_function, unicode_literals
+
+import random
+import struct
+
+import numpy
+
+
+def _u3(value):
+    return struct.pack('>I', value)[1:]
+
+
+def _s3(value):
+    return _u3(abs(value) | (0x800000 if value < 0 else 0))
+
+
+def _s2(value):
+    return struct.pack('>H', abs(value) | (0x8000 if value < 0 else 0))
+
+
+def _ibm(value):
+    '''IBM single precision float (reference value)'''
+    if value == 0:
+        return b'\0\0\0\0'
+    sign = 0x80 if value < 0 else 0
+    value, exponent = abs(value), 64
+    while value >= 1:
+        value /= 16.0
+        exponent += 1
+    while value < 1 / 16.0:
+        value *= 16.0
+        exponent -= 1
+    mantissa = min(int(value * 16777216), 16777215)
+    return struct.pack('>B', sign | exponent) + _u3(mantissa)
+
+
+def _pack_bits(values, n_bits, block=1 << 16):
+    '''Big-endian n_bits packing of non-negative integers'''
+    values = numpy.asarray(values, dtype=numpy.uint64)
+    if n_bits == 0 or values.size == 0:
+        return b''
+    shifts = numpy.arange(n_bits - 1, -1, -1, dtype=numpy.uint64)
+    bits = numpy.empty((values.size, n_bits), dtype=numpy.uint8)
+    for i in range(0, values.size, block):
+        bits[i:i + block] = (values[i:i + block, None] >> shifts) & 1
+    return numpy.packbits(bits.reshape(-1)).tobytes()
+
+
+def message(nx=4, ny=3, n_bits=12, center=7, subcenter=0, table=2,
+            process=81, kpds5=11, kpds6=100, kpds7=500, date=(2020, 1, 1, 0),
+            time_unit=1, p1=0, p2=0, time_range=0, bitmap=None, seed=0,
+            values=None, truncation=None, ec_large=False):
+    '''One GRIB message as bytes
+
+    `bitmap` is a density in (0, 1) or None for no bitmap; `values` the
+    packed integers (random when None).  With `truncation` T the record
+    holds the (T + 1) * (T + 2) real spherical harmonic coefficients of a
+    triangular truncation instead of a grid.  `ec_large` encodes the
+    length as ECMWF does for records over 8 MB (not for centers 7 and 54,
+    which wgrib assumes never use it).
+    '''
+    if ec_large and center in (7, 54):
+        raise ValueError('wgrib ignores the ECMWF length of center {}'.format(
+            center))
+    rng = numpy.random.RandomState(seed)
+    npts = nx * ny
+    if truncation is not None:
+        npts = (truncation + 1) * (truncation + 2) - 1  # less (0, 0) real
+        bitmap = None
+    mask = None
+    if bitmap is not None:
+        mask = rng.random_sample(npts) < bitmap
+        npts = int(mask.sum())
+    if values is None:
+        values = rng.randint(0, 1 << n_bits, size=npts, dtype=numpy.int64) \
+            if n_bits else numpy.zeros(npts, dtype=numpy.int64)
+
+    year, month, day, hour = date
+    pds = bytearray(28)
+    pds[0:3] = _u3(28)
+    pds[3] = table
+    pds[4] = center
+    pds[5] = process
+    pds[6] = 255
+    pds[7] = 128 | (64 if mask is not None else 0)
+    pds[8] = kpds5
+    pds[9] = kpds6
+    pds[10:12] = struct.pack('>H', kpds7)
+    pds[12:17] = bytearray([(year - 1) % 100 + 1, month, day, hour, 0])
+    pds[17:21] = bytearray([time_unit, p1, p2, time_range])
+    pds[24] = (year - 1) // 100 + 1
+    pds[25] = subcenter
+
+    gds = bytearray(32)
+    gds[0:3] = _u3(32)
+    gds[4] = 255
+    if truncation is not None:
+        gds[5] = 50
+        gds[6:8] = gds[8:10] = gds[10:12] = struct.pack('>H', truncation)
+        gds[12] = gds[13] = 1
+    else:
+        gds[6:8] = struct.pack('>H', nx)
+        gds[8:10] = struct.pack('>H', ny)
+        gds[10:13] = _s3(ny * 1000)
+        gds[16] = 128
+        gds[17:20] = _s3(1000)
+        gds[20:23] = _s3((nx - 1) * 1000)
+        gds[23:25] = _s2(1000)
+        gds[25:27] = _s2(1000)
+
+    bms = b''
+    if mask is not None:
+        bits = numpy.packbits(mask).tobytes()
+        unused = 8 * len(bits) - mask.size
+        if len(bits) % 2:
+            bits += b'\0'
+            unused += 8
+        bms = _u3(6 + len(bits)) + struct.pack('>BH', unused, 0) + bits
+
+    data = _pack_bits(values, n_bits)
+    unused = 8 * len(data) - npts * n_bits
+    flags = 0
+    if truncation is not None:
+        data = _ibm(1.5) + data  # real part of the (0, 0) coefficient
+        flags = 128
+    if (11 + len(data)) % 2:
+        data += b'\0'
+        unused += 8
+    bds = _u3(11 + len(data)) + struct.pack('>B', flags | (unused & 15)) + \
+        _s2(-2) + _ibm(273.5) + struct.pack('>B', n_bits) + data
+
+    if ec_large:
+        # length in units of 120 bytes, the BDS length gives the rest
+        total = 8 + len(pds) + len(gds) + len(bms) + len(bds) + 4
+        units = -(-(total - 4) // 120)
+        bds = _u3(units * 120 + 4 - total) + bds[3:]
+        body = bytes(pds) + bytes(gds) + bms + bds + b'7777'
+        return b'GRIB' + _u3(0x800000 | units) + b'\x01' + body
+    body = bytes(pds) + bytes(gds) + bms + bds + b'7777'
+    return b'GRIB' + _u3(8 + len(body)) + b'\x01' + body
+
+
+def grid_file(path, count=100, nx=360, ny=181, n_bits=12, bitmap=None,
+              truncation=None, ec_large=False, center=None, variants=8,
+              seed=0):
+    '''Writes `count` records of one grid, returns path
+
+    `variants` different messages (parameter, level and data) are built
+    and repeated with the forecast hour changing from record to record,
+    so files of 100k records are written quickly.  The other arguments
+    are those of message().
+    '''
+    if center is None:
+        center = 98 if ec_large else 7
+    templates = [bytearray(message(
+        nx=nx, ny=ny, n_bits=n_bits, center=center, table=2 if center == 7
+        else 128, kpds5=(11, 33, 34, 52, 7, 1, 39, 61)[i % 8],
+        kpds7=(1000, 850, 700, 500, 300, 250, 200, 100)[i // 8 % 8],
+        bitmap=bitmap, seed=seed + i, truncation=truncation,
+        ec_large=ec_large)) for i in range(min(variants, count))]
+    p1 = 8 + 18  # message offset of the forecast time
+    with open(path, 'wb') as f:
+        for i in range(count):
+            template = templates[i % len(templates)]
+            template[p1] = i // len(templates) % 256
+            f.write(template)
+    return path
+
+
+# (center, subcenter, table, process) of the tables used for metadata files
+_TABLES = [(7, 0, 2, 81), (7, 0, 2, 96), (7, 1, 2, 80), (7, 0, 129, 96),
+           (7, 0, 130, 96), (98, 0, 128, 1), (98, 0, 140, 1),
+           (98, 0, 228, 1), (78, 0, 2, 1), (78, 0, 201, 1)]
+_LEVELS = [(1, 0), (100, 1000), (100, 850), (100, 500), (100, 250),
+           (105, 2), (105, 10), (106, 256 * 30), (107, 9950), (112, 10),
+           (200, 0), (212, 0), (8, 0), (102, 0)]
+_TIMES = [(0, 0, 0), (10, 0, 0), (4, 0, 6), (3, 0, 6), (2, 6, 12),
+          (113, 0, 6), (123, 0, 24)]
+
+
+def metadata_file(path, count=100000, seed=0):
+    '''Writes `count` tiny (2x2) records covering many parameter tables,
+    levels and time ranges, so an inventory is dominated by table lookups'''
+    rng = random.Random(seed)
+    with open(path, 'wb') as f:
+        for i in range(count):
+            center, subcenter, table, process = rng.choice(_TABLES)
+            kpds6, kpds7 = rng.choice(_LEVELS)
+            time_range, p1, p2 = rng.choice(_TIMES)
+            p1 = (p1 + 6 * rng.randrange(20)) % 256
+            f.write(message(nx=2, ny=2, n_bits=8, center=center,
+                            subcenter=subcenter, table=table, process=process,
+                            kpds5=rng.randrange(1, 256), kpds6=kpds6,
+                            kpds7=kpds7, p1=p1, p2=p2, time_range=time_range,
+                            seed=i))
+    return path
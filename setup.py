@@ -103,9 +103,10 @@ if 'build_ext' in sys.argv and not isWindows() and not os.path.isdir(here + '/sr
 
 # build c extensions
 grib_ext = Extension('wgrib.wgrib', sources=[path.join('src', 'wgrib.c'), path.join('src', 'pywgrib.c')],
+                     depends=[path.join('src', 'wgrib.h')],
                      define_macros=[('GRIB_MAIN', 'wgrib')] + 
                                     ([('MS_WIN64', 1)] if isWindows() and BITS == 64 else []), 
-                     libraries=[] if isWindows() else ['m'])
+                     libraries=[] if isWindows() else ['m', 'pthread'])
 extensions = [grib_ext]
 
 # build native executables - have to get hands a little dirty
@@ -132,13 +133,13 @@ if 'build_ext' in sys.argv:
         try:
             grib_objs = cc.compile(list(map(fix_path, grib_sources)), output_dir=gettempdir())
             cc.link_executable(grib_objs, grib_exe, 
-                            libraries=[] if isWindows() else ['m'],
+                            libraries=[] if isWindows() else ['m', 'pthread'],
                             output_dir=fix_path(path.join(here, 'scripts')))
             libgrib_objs = cc.compile(list(map(fix_path, grib_sources)), 
                                     macros=[('GRIB_MAIN', 'wgrib')], 
                                     output_dir=gettempdir())
             cc.link_shared_lib(libgrib_objs, grib_exe,
-                            libraries=[] if isWindows() else ['m'],
+                            libraries=[] if isWindows() else ['m', 'pthread'],
                             output_dir=fix_path(path.join(here, 'wgrib')),
                             extra_postargs=['/DLL', '/INCLUDE:wgrib', '/EXPORT:wgrib'] if isWindows() else ['-fPIC'])
         except LinkError as err:
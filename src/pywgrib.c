@@ -1,14 +1,27 @@
 /* Dumb Python C extension wrapper around wgrib */
-#include <stdlib.h>
 #include <Python.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "wgrib.h"
+
+#if PY_MAJOR_VERSION >= 3
+#define READ_BUFFER "y*"
+#else
+#define READ_BUFFER "s*"
+#endif
 
 // forward declare wgrib entry point
 int wgrib(int argc, char **argv);
 
+/* context for the parameter table lookups, only used with the GIL held */
+static struct wgrib_ctx table_ctx;
 
-static const char *convertToCharArray(PyObject *py_val) {
+
+static const char *convertToCharArray(PyObject *py_val, PyObject **owner) {
     /* Performs naive conversion of python utf8/byte string to char array
-    Returns pointer to 
+    Returns pointer to the string held by *owner, a new bytes object the
+    caller must release once it is done with the string (NULL on error)
     */
     PyObject *s = NULL;
     const char *converted_string = NULL;
@@ -26,9 +39,69 @@ static const char *convertToCharArray(PyObject *py_val) {
     if (s) {
         converted_string = PyBytes_AsString(s);
     }
+    *owner = s;
     return converted_string;
 }
 
+static void releaseCharArrays(PyObject **owners, Py_ssize_t n) {
+    /* releases the owners of n strings of convertToCharArray and the array */
+    Py_ssize_t i;
+
+    for (i = 0; i < n; i++)
+        Py_XDECREF(owners[i]);
+    free(owners);
+}
+
+/* Text sinks: the wgrib.c print functions write to a FILE *, which is
+ * backed by memory where open_memstream is available.
+ */
+struct text_sink {
+    FILE *file;
+    char *buf;
+    size_t size;
+};
+
+static int text_sink_open(struct text_sink *sink)
+{
+    sink->buf = NULL;
+    sink->size = 0;
+#ifdef _WIN32
+    sink->file = tmpfile();
+#else
+    sink->file = open_memstream(&sink->buf, &sink->size);
+#endif
+    if (sink->file == NULL) {
+        PyErr_SetFromErrno(PyExc_IOError);
+        return -1;
+    }
+    return 0;
+}
+
+static PyObject *text_sink_close(struct text_sink *sink)
+{
+    /* Closes the sink and returns its contents as a str */
+    PyObject *text = NULL;
+
+#ifdef _WIN32
+    long size;
+
+    fflush(sink->file);
+    size = ftell(sink->file);
+    if (size >= 0 && (sink->buf = (char *)malloc(size + 1)) != NULL) {
+        rewind(sink->file);
+        sink->size = fread(sink->buf, 1, size, sink->file);
+    }
+    fclose(sink->file);
+#else
+    fclose(sink->file);
+#endif
+    if (sink->buf == NULL)
+        return PyErr_NoMemory();
+    text = PyUnicode_DecodeLatin1(sink->buf, (Py_ssize_t)sink->size, NULL);
+    free(sink->buf);
+    return text;
+}
+
 static PyObject *
 system_call(PyObject *self, PyObject *args)
 {
@@ -49,8 +122,11 @@ py_main(PyObject *self, PyObject *args)
 
     char **argv = (char **)calloc(sizeof(char*), (unsigned long)argc+1);
     const char **argv_const = (const char**) argv;
+    PyObject **owners = (PyObject **)calloc(sizeof(PyObject *), (unsigned long)argc+1);
 
-    if (argv == NULL) {
+    if (argv == NULL || owners == NULL) {
+        free(argv);
+        free(owners);
         if(!PyErr_Occurred()) 
             PyErr_SetString(PyExc_MemoryError, "Unable to allocate memory");
         return NULL;
@@ -59,25 +135,826 @@ py_main(PyObject *self, PyObject *args)
     for (unsigned int i=0; i < argc; i++) {
         //char *arg = NULL;
         PyObject *item = PyTuple_GetItem(args, i);
-        if (!item) {
+        if (item)
+            argv[i] = (char *)convertToCharArray(item, &owners[i]);
+        if (!item || !argv[i]) {
+            free(argv);
+            releaseCharArrays(owners, argc);
             return NULL;
         }
-        argv[i] = (char *)convertToCharArray(item);
     }
 
     /* assign and parse string representing commands */
 
+    Py_BEGIN_ALLOW_THREADS
     retval = wgrib(argc, argv_const);
+    Py_END_ALLOW_THREADS
 
     /* clean up */
     free(argv);
+    releaseCharArrays(owners, argc);
 
     return PyLong_FromSsize_t(retval);
     Py_RETURN_NONE;
 }
 
+static PyObject *
+run_captured(struct wgrib_ctx *ctx, PyObject *args, Py_ssize_t first)
+{
+    /* wgrib_run on args[first:] with output to memory, returns (code, out, err) */
+    Py_ssize_t i, argc = PyTuple_Size(args) - first;
+    char **argv;
+    PyObject **owners;
+    struct text_sink out, err;
+    PyObject *out_text, *err_text;
+    int retval;
+
+    argv = (char **)calloc(argc + 1, sizeof(char *));
+    owners = (PyObject **)calloc(argc + 1, sizeof(PyObject *));
+    if (argv == NULL || owners == NULL) {
+        free(argv);
+        free(owners);
+        return PyErr_NoMemory();
+    }
+    for (i = 0; i < argc; i++) {
+        argv[i] = (char *)convertToCharArray(PyTuple_GET_ITEM(args, first + i),
+                                             &owners[i]);
+        if (argv[i] == NULL) {
+            free(argv);
+            releaseCharArrays(owners, argc);
+            return NULL;
+        }
+    }
+    if (text_sink_open(&out) != 0) {
+        free(argv);
+        releaseCharArrays(owners, argc);
+        return NULL;
+    }
+    if (text_sink_open(&err) != 0) {
+        fclose(out.file);
+        free(out.buf);
+        free(argv);
+        releaseCharArrays(owners, argc);
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    ctx->out = out.file;
+    ctx->err = err.file;
+    retval = wgrib_run(ctx, (int)argc, argv);
+    ctx->out = stdout;
+    ctx->err = stderr;
+    Py_END_ALLOW_THREADS
+    free(argv);
+    releaseCharArrays(owners, argc);
+
+    out_text = text_sink_close(&out);
+    err_text = text_sink_close(&err);
+    if (out_text == NULL || err_text == NULL) {
+        Py_XDECREF(out_text);
+        Py_XDECREF(err_text);
+        return NULL;
+    }
+    return Py_BuildValue("iNN", retval, out_text, err_text);
+}
+
+static PyObject *
+py_capture(PyObject *self, PyObject *args)
+{
+    /* main() with stdout/stderr written to memory, returns (code, out, err) */
+    struct wgrib_ctx ctx;
+    PyObject *result;
+
+    wgrib_ctx_init(&ctx);
+    result = run_captured(&ctx, args, 0);
+    wgrib_ctx_free(&ctx);
+    return result;
+}
+
+/* Contexts and input files kept by wgrib.Session, as capsules */
+
+#define CONTEXT_CAPSULE "wgrib.context"
+#define INPUT_CAPSULE "wgrib.input"
+
+static void context_destructor(PyObject *capsule)
+{
+    struct wgrib_ctx *ctx = (struct wgrib_ctx *)PyCapsule_GetPointer(capsule, CONTEXT_CAPSULE);
+
+    if (ctx != NULL) {
+        wgrib_ctx_free(ctx);
+        free(ctx);
+    }
+}
+
+static void input_destructor(PyObject *capsule)
+{
+    FILE *input = (FILE *)PyCapsule_GetPointer(capsule, INPUT_CAPSULE);
+
+    if (input != NULL)
+        fclose(input);
+}
+
+static PyObject *
+py_context(PyObject *self, PyObject *args)
+{
+    /* New wgrib_ctx, freed with the returned capsule */
+    struct wgrib_ctx *ctx;
+    PyObject *capsule;
+
+    if ((ctx = (struct wgrib_ctx *)malloc(sizeof(struct wgrib_ctx))) == NULL)
+        return PyErr_NoMemory();
+    wgrib_ctx_init(ctx);
+    if ((capsule = PyCapsule_New(ctx, CONTEXT_CAPSULE, context_destructor)) == NULL) {
+        wgrib_ctx_free(ctx);
+        free(ctx);
+    }
+    return capsule;
+}
+
+static PyObject *
+py_context_stats(PyObject *self, PyObject *args)
+{
+    /* Reuse counters of a context */
+    PyObject *capsule;
+    struct wgrib_ctx *ctx;
+
+    if (!PyArg_ParseTuple(args, "O", &capsule))
+        return NULL;
+    if ((ctx = (struct wgrib_ctx *)PyCapsule_GetPointer(capsule, CONTEXT_CAPSULE)) == NULL)
+        return NULL;
+    return Py_BuildValue("{s:l,s:l,s:l,s:l,s:l,s:l}",
+                         "runs", ctx->n_runs,
+                         "buffer_allocs", ctx->buffer_allocs,
+                         "buffer_reuses", ctx->buffer_reuses,
+                         "buffer_size", ctx->buffer_size,
+                         "table_loads", ctx->table_loads,
+                         "table_reuses", ctx->table_reuses);
+}
+
+static PyObject *
+py_open_input(PyObject *self, PyObject *args)
+{
+    /* grib file opened for wgrib_run, closed with the returned capsule */
+    const char *path;
+    FILE *input;
+    PyObject *capsule;
+
+    if (!PyArg_ParseTuple(args, "s", &path))
+        return NULL;
+    if ((input = fopen(path, "rb")) == NULL) {
+        PyErr_SetFromErrnoWithFilename(PyExc_IOError, path);
+        return NULL;
+    }
+    if ((capsule = PyCapsule_New(input, INPUT_CAPSULE, input_destructor)) == NULL)
+        fclose(input);
+    return capsule;
+}
+
+static PyObject *
+py_run(PyObject *self, PyObject *args)
+{
+    /* run(context, input or None, *argv): main() reusing the context's
+     * buffer and tables, returns (code, out, err).  A context must not be
+     * used by two threads at once.
+     */
+    struct wgrib_ctx *ctx;
+    FILE *input = NULL;
+    PyObject *result;
+
+    if (PyTuple_Size(args) < 2) {
+        PyErr_SetString(PyExc_TypeError, "run() needs a context and an input");
+        return NULL;
+    }
+    ctx = (struct wgrib_ctx *)PyCapsule_GetPointer(PyTuple_GET_ITEM(args, 0), CONTEXT_CAPSULE);
+    if (ctx == NULL)
+        return NULL;
+    if (PyTuple_GET_ITEM(args, 1) != Py_None) {
+        input = (FILE *)PyCapsule_GetPointer(PyTuple_GET_ITEM(args, 1), INPUT_CAPSULE);
+        if (input == NULL)
+            return NULL;
+    }
+
+    ctx->input = input;
+    result = run_captured(ctx, args, 2);
+    ctx->input = NULL;
+    return result;
+}
+
+static PyObject *
+py_scan(PyObject *self, PyObject *args)
+{
+    /* Inventory of a grib file as a bytearray of struct grib_record */
+    const char *path;
+    FILE *input;
+    struct wgrib_ctx ctx;
+    struct grib_record *records;
+    long n;
+    PyObject *result;
+
+    if (!PyArg_ParseTuple(args, "s", &path))
+        return NULL;
+
+    if ((input = fopen(path, "rb")) == NULL) {
+        PyErr_SetFromErrnoWithFilename(PyExc_IOError, path);
+        return NULL;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    wgrib_ctx_init(&ctx);
+    n = scan_grib_file(&ctx, input, &records);
+    wgrib_ctx_free(&ctx);
+    fclose(input);
+    Py_END_ALLOW_THREADS
+
+    if (n == -1)
+        return PyErr_NoMemory();
+    if (n < 0) {
+        PyErr_Format(PyExc_IOError, "bad grib record in %s", path);
+        return NULL;
+    }
+
+    result = PyByteArray_FromStringAndSize((const char *)records,
+                                           n * sizeof(struct grib_record));
+    free(records);
+    return result;
+}
+
+static PyObject *
+py_scan_buffer(PyObject *self, PyObject *args)
+{
+    /* scan() for a grib file held in a buffer object (i.e. mmap) */
+    Py_buffer view;
+    struct wgrib_ctx ctx;
+    struct grib_record *records;
+    long n;
+    PyObject *result;
+
+    if (!PyArg_ParseTuple(args, READ_BUFFER, &view))
+        return NULL;
+
+    Py_BEGIN_ALLOW_THREADS
+    wgrib_ctx_init(&ctx);
+    n = scan_grib_mem(&ctx, (unsigned char *)view.buf, (size_t)view.len, &records);
+    wgrib_ctx_free(&ctx);
+    Py_END_ALLOW_THREADS
+    PyBuffer_Release(&view);
+
+    if (n == -1)
+        return PyErr_NoMemory();
+    if (n < 0) {
+        PyErr_SetString(PyExc_IOError, "bad or truncated grib record");
+        return NULL;
+    }
+
+    result = PyByteArray_FromStringAndSize((const char *)records,
+                                           n * sizeof(struct grib_record));
+    free(records);
+    return result;
+}
+
+static PyObject *
+py_record_info(PyObject *self, PyObject *args)
+{
+    /* struct grib_record for the grib message at the start of a buffer */
+    Py_buffer view;
+    struct wgrib_ctx ctx;
+    struct grib_record info;
+    int status;
+
+    if (!PyArg_ParseTuple(args, READ_BUFFER, &view))
+        return NULL;
+
+    wgrib_ctx_init(&ctx);
+    status = grib_message_info(&ctx, (unsigned char *)view.buf, (size_t)view.len, &info);
+    wgrib_ctx_free(&ctx);
+    PyBuffer_Release(&view);
+
+    if (status) {
+        PyErr_SetString(PyExc_ValueError, "not a complete grib message");
+        return NULL;
+    }
+    return PyByteArray_FromStringAndSize((const char *)&info, sizeof(info));
+}
+
+static PyObject *
+py_message_length(PyObject *self, PyObject *args)
+{
+    /* length of the grib message at the start of a buffer holding only
+     * its first bytes: 0 if more are needed, -1 if it is not grib 1 */
+    Py_buffer view;
+    struct wgrib_ctx ctx;
+    long length;
+
+    if (!PyArg_ParseTuple(args, READ_BUFFER, &view))
+        return NULL;
+
+    wgrib_ctx_init(&ctx);
+    length = grib_header_length(&ctx, (unsigned char *)view.buf, (size_t)view.len);
+    wgrib_ctx_free(&ctx);
+    PyBuffer_Release(&view);
+    return PyLong_FromLong(length);
+}
+
+static PyObject *
+py_unpack(PyObject *self, PyObject *args)
+{
+    /* Decodes the grib message at the start of a buffer into a float32
+     * buffer, points missing from the bitmap are set to `missing`.
+     * The GIL is released while unpacking.
+     */
+    Py_buffer msg, out;
+    double missing = Py_NAN;
+    struct wgrib_ctx ctx;
+    struct grib_unpack u;
+    int status;
+
+    if (!PyArg_ParseTuple(args, READ_BUFFER "w*|d", &msg, &out, &missing))
+        return NULL;
+
+    wgrib_ctx_init(&ctx);
+    status = grib_unpack_setup(&ctx, (unsigned char *)msg.buf, (size_t)msg.len, &u);
+    wgrib_ctx_free(&ctx);
+    if (status == 0 && (size_t)out.len < u.nxny * sizeof(float))
+        status = 3;
+
+    if (status) {
+        PyBuffer_Release(&msg);
+        PyBuffer_Release(&out);
+        if (status == 1)
+            PyErr_SetString(PyExc_ValueError, "not a complete grib message");
+        else if (status == 2)
+            PyErr_SetString(PyExc_NotImplementedError, "cannot decode complex packed fields");
+        else
+            PyErr_SetString(PyExc_ValueError, "output buffer too small");
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    grib_unpack(&u, (float *)out.buf, (float)missing);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&msg);
+    PyBuffer_Release(&out);
+    return PyLong_FromLong(u.nxny);
+}
+
+static PyObject *
+py_unpack_window(PyObject *self, PyObject *args)
+{
+    /* Decodes the points (j0 + sj*k, i0 + si*l), k < nj, l < ni, of a grid
+     * of rows of nx points into a float32 buffer of nj*ni.  Returns None
+     * if the packing can only be decoded whole (see unpack).
+     */
+    Py_buffer msg, out;
+    double missing = Py_NAN;
+    long nx, j0, nj, sj, i0, ni, si;
+    struct wgrib_ctx ctx;
+    struct grib_unpack u;
+    int status;
+
+    if (!PyArg_ParseTuple(args, READ_BUFFER "w*lllllll|d", &msg, &out, &nx,
+                          &j0, &nj, &sj, &i0, &ni, &si, &missing))
+        return NULL;
+
+    wgrib_ctx_init(&ctx);
+    status = grib_unpack_setup(&ctx, (unsigned char *)msg.buf, (size_t)msg.len, &u);
+    wgrib_ctx_free(&ctx);
+    if (status == 0 && (nj < 0 || ni < 0 ||
+                        (size_t)out.len < (size_t)(nj * ni) * sizeof(float)))
+        status = 3;
+
+    if (status == 0) {
+        Py_BEGIN_ALLOW_THREADS
+        status = grib_unpack_window(&u, nx, j0, nj, sj, i0, ni, si,
+                                    (float *)out.buf, (float)missing);
+        Py_END_ALLOW_THREADS
+        if (status == 1)
+            status = 4;
+    }
+
+    PyBuffer_Release(&msg);
+    PyBuffer_Release(&out);
+    switch (status) {
+    case 0:
+        return PyLong_FromLong(nj * ni);
+    case 1:
+        PyErr_SetString(PyExc_ValueError, "not a complete grib message");
+        return NULL;
+    case 2:
+        Py_RETURN_NONE;
+    case 3:
+        PyErr_SetString(PyExc_ValueError, "output buffer too small");
+        return NULL;
+    default:
+        PyErr_SetString(PyExc_ValueError, "window outside the grid");
+        return NULL;
+    }
+}
+
+static PyObject *
+py_unpack_threads(PyObject *self, PyObject *args)
+{
+    /* unpack_threads([threads, min_points]): unpack() splits fields of at
+     * least min_points points over `threads` native threads (1 = never),
+     * 0 and -1 leave them unchanged.  Returns the previous
+     * (threads, min_points) */
+    int threads = 0;
+    long min_points = -1;
+    PyObject *previous;
+
+    if (!PyArg_ParseTuple(args, "|il", &threads, &min_points))
+        return NULL;
+    if (threads < 0 || min_points < -1) {
+        PyErr_SetString(PyExc_ValueError, "threads and min_points must be positive");
+        return NULL;
+    }
+    previous = Py_BuildValue("(il)", wgrib_unpack_threads, wgrib_unpack_min_points);
+    if (threads > 0)
+        wgrib_unpack_threads = threads < WGRIB_MAX_THREADS ? threads : WGRIB_MAX_THREADS;
+    if (min_points >= 0)
+        wgrib_unpack_min_points = min_points;
+    return previous;
+}
+
+static int
+reduce_buffer(PyObject *obj, Py_buffer *view, Py_ssize_t size, int flags,
+              void **ptr)
+{
+    /* *ptr = the buffer of obj holding at least size bytes, NULL for None */
+    *ptr = NULL;
+    view->obj = NULL;
+    if (obj == Py_None)
+        return 0;
+    if (PyObject_GetBuffer(obj, view, flags) != 0)
+        return -1;
+    if (view->len < size) {
+        PyBuffer_Release(view);
+        view->obj = NULL;
+        PyErr_SetString(PyExc_ValueError, "accumulator too small");
+        return -1;
+    }
+    *ptr = view->buf;
+    return 0;
+}
+
+static PyObject *
+py_unpack_reduce(PyObject *self, PyObject *args)
+{
+    /* unpack_reduce(message, per_point, count, mean, m2, min, max, hist,
+     * edges) folds the values of a grib message into accumulators (see
+     * struct grib_reduce): int64 count, float64 mean, m2, min, max, int64
+     * hist and float64 edges, None if not wanted, holding one element or,
+     * with per_point, one per grid point.  The GIL is released.
+     */
+    Py_buffer msg, views[7];
+    PyObject *objs[7];
+    void *ptrs[7];
+    Py_ssize_t points, sizes[7];
+    struct wgrib_ctx ctx;
+    struct grib_unpack u;
+    struct grib_reduce r;
+    int per_point, status, i, got;
+
+    if (!PyArg_ParseTuple(args, READ_BUFFER "iOOOOOOO", &msg, &per_point,
+                          &objs[0], &objs[1], &objs[2], &objs[3], &objs[4],
+                          &objs[5], &objs[6]))
+        return NULL;
+
+    wgrib_ctx_init(&ctx);
+    status = grib_unpack_setup(&ctx, (unsigned char *)msg.buf, (size_t)msg.len, &u);
+    wgrib_ctx_free(&ctx);
+    if (status) {
+        PyBuffer_Release(&msg);
+        if (status == 1)
+            PyErr_SetString(PyExc_ValueError, "not a complete grib message");
+        else
+            PyErr_SetString(PyExc_NotImplementedError, "cannot decode complex packed fields");
+        return NULL;
+    }
+    if (objs[0] == Py_None || (objs[2] != Py_None && objs[1] == Py_None) ||
+            (objs[5] == Py_None) != (objs[6] == Py_None)) {
+        PyBuffer_Release(&msg);
+        PyErr_SetString(PyExc_ValueError, "count is required, m2 needs mean, hist needs edges");
+        return NULL;
+    }
+
+    memset(&r, 0, sizeof(r));
+    r.per_point = per_point != 0;
+    points = per_point ? u.nxny : 1;
+    if (objs[6] != Py_None) {
+        if (reduce_buffer(objs[6], &views[6], 2 * sizeof(double),
+                          PyBUF_C_CONTIGUOUS, &ptrs[6]) != 0) {
+            PyBuffer_Release(&msg);
+            return NULL;
+        }
+        r.n_edges = (int)(views[6].len / sizeof(double));
+    }
+    for (i = 0; i < 6; i++)
+        sizes[i] = points * sizeof(double);
+    sizes[5] = points * (r.n_edges > 1 ? r.n_edges - 1 : 0) * sizeof(long long);
+    for (i = 0; i < 6; i++) {
+        if (reduce_buffer(objs[i], &views[i], sizes[i],
+                          PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS, &ptrs[i]) != 0)
+            break;
+    }
+    if (i == 6) {
+        r.count = (long long *)ptrs[0];
+        r.mean = (double *)ptrs[1];
+        r.m2 = (double *)ptrs[2];
+        r.min = (double *)ptrs[3];
+        r.max = (double *)ptrs[4];
+        r.hist = (long long *)ptrs[5];
+        r.edges = (double *)ptrs[6];
+        Py_BEGIN_ALLOW_THREADS
+        status = grib_unpack_reduce(&u, &r);
+        Py_END_ALLOW_THREADS
+        if (status == 2)
+            PyErr_SetString(PyExc_NotImplementedError, "cannot reduce spectral fields with a bitmap");
+        else if (status)
+            PyErr_NoMemory();
+    }
+    got = i;
+    for (i = 0; i < got; i++) {
+        if (views[i].obj != NULL)
+            PyBuffer_Release(&views[i]);
+    }
+    if (objs[6] != Py_None)
+        PyBuffer_Release(&views[6]);
+    PyBuffer_Release(&msg);
+    if (got < 6 || status)
+        return NULL;
+    return PyLong_FromLong(u.nxny);
+}
+
+static PyObject *
+py_latlon_grid(PyObject *self, PyObject *args)
+{
+    /* (nx, ny, la1, lo1, la2, lo2, dx, dy, scan) of a lat/lon grid in
+     * millidegrees, None for other grids */
+    Py_buffer msg;
+    struct wgrib_ctx ctx;
+    struct grib_latlon g;
+    int status;
+
+    if (!PyArg_ParseTuple(args, READ_BUFFER, &msg))
+        return NULL;
+
+    wgrib_ctx_init(&ctx);
+    status = grib_latlon_grid(&ctx, (unsigned char *)msg.buf, (size_t)msg.len, &g);
+    wgrib_ctx_free(&ctx);
+    PyBuffer_Release(&msg);
+
+    if (status)
+        Py_RETURN_NONE;
+    return Py_BuildValue("iiiiiiiii", g.nx, g.ny, g.la1, g.lo1, g.la2, g.lo2,
+                         g.dx, g.dy, g.scan);
+}
+
+static void
+fake_pds(unsigned char *pds, int center, int subcenter, int table, int process,
+         int kpds5)
+{
+    /* minimal 28 byte PDS holding the keys Parm_Table looks at */
+    memset(pds, 0, 28);
+    pds[2] = 28;
+    pds[3] = (unsigned char)table;
+    pds[4] = (unsigned char)center;
+    pds[5] = (unsigned char)process;
+    pds[8] = (unsigned char)kpds5;
+    pds[25] = (unsigned char)subcenter;
+}
+
+static PyObject *
+py_param_name(PyObject *self, PyObject *args)
+{
+    /* (name, comment) of a parameter from the built-in/user tables */
+    int center, subcenter, table, process, kpds5;
+    unsigned char pds[28];
+
+    if (!PyArg_ParseTuple(args, "iiiii", &center, &subcenter, &table,
+                          &process, &kpds5))
+        return NULL;
+
+    fake_pds(pds, center, subcenter, table, process, kpds5);
+    return Py_BuildValue("ss", k5toa(&table_ctx, pds), k5_comments(&table_ctx, pds));
+}
+
+static PyObject *
+py_param_table(PyObject *self, PyObject *args)
+{
+    /* (table id, names, comments, builtin) of a whole parameter table,
+     * the id is the same for keys sharing a built-in table and None for
+     * the user table (gribtab); builtin is false for the user table and
+     * for the NCEP opn table used when no table matches */
+    int center, subcenter, table, process, i;
+    unsigned char pds[28];
+    const struct ParmTable *parms;
+    PyObject *names, *comments, *id;
+    int builtin;
+
+    if (!PyArg_ParseTuple(args, "iiii", &center, &subcenter, &table, &process))
+        return NULL;
+
+    fake_pds(pds, center, subcenter, table, process, 0);
+    parms = param_table(&table_ctx, pds);
+    builtin = parms != table_ctx.parm_table_user && !table_ctx.parm_table_default;
+
+    names = PyTuple_New(256);
+    comments = PyTuple_New(256);
+    if (names == NULL || comments == NULL)
+        goto fail;
+    for (i = 0; i < 256; i++) {
+        PyObject *name = Py_BuildValue("s", parms[i].name);
+        PyObject *comment = Py_BuildValue("s", parms[i].comment);
+        PyTuple_SET_ITEM(names, i, name);
+        PyTuple_SET_ITEM(comments, i, comment);
+        if (name == NULL || comment == NULL)
+            goto fail;
+    }
+    if (parms == table_ctx.parm_table_user) {
+        Py_INCREF(Py_None);
+        id = Py_None;
+    }
+    else {
+        id = PyLong_FromVoidPtr((void *)parms);
+        if (id == NULL)
+            goto fail;
+    }
+    return Py_BuildValue("NNNN", id, names, comments, PyBool_FromLong(builtin));
+
+fail:
+    Py_XDECREF(names);
+    Py_XDECREF(comments);
+    return NULL;
+}
+
+static PyObject *
+py_level_text(PyObject *self, PyObject *args)
+{
+    /* levels() description of kpds6/kpds7, as in the inventory */
+    int kpds6, kpds7, center, verbose = 0;
+    struct text_sink sink;
+
+    if (!PyArg_ParseTuple(args, "iii|i", &kpds6, &kpds7, &center, &verbose))
+        return NULL;
+    if (text_sink_open(&sink) != 0)
+        return NULL;
+    levels(sink.file, kpds6, kpds7, center, verbose);
+    return text_sink_close(&sink);
+}
+
+static PyObject *
+py_time_text(PyObject *self, PyObject *args)
+{
+    /* PDStimes() description of a time range, as in the inventory */
+    int time_range, p1, p2, time_unit;
+    struct text_sink sink;
+
+    if (!PyArg_ParseTuple(args, "iiii", &time_range, &p1, &p2, &time_unit))
+        return NULL;
+    if (text_sink_open(&sink) != 0)
+        return NULL;
+    PDStimes(sink.file, time_range, p1, p2, time_unit);
+    return text_sink_close(&sink);
+}
+
+/* names of enum wgrib_phase */
+static const char *phase_names[WGRIB_NPHASES] = {
+    "seek", "echack", "read", "scan", "inventory", "unpack", "write"
+};
+
+static PyObject *record_hook = NULL;
+
+static PyObject *
+py_stats(PyObject *self, PyObject *args)
+{
+    /* counters of the instrumentation as a dict */
+    struct wgrib_stats copy = wgrib_stats;
+    PyObject *dict, *value;
+    char key[32];
+    int i, status = 0;
+
+    if ((dict = Py_BuildValue("{s:O,s:L,s:L,s:L,s:L,s:L,s:L,s:L}",
+            "enabled", WGRIB_LOAD(wgrib_stats_enabled) ? Py_True : Py_False,
+            "bytes_read", copy.bytes_read,
+            "bytes_written", copy.bytes_written,
+            "records", copy.records,
+            "records_scanned", copy.records_scanned,
+            "fields", copy.fields,
+            "values", copy.values,
+            "buffer_reallocs", copy.buffer_reallocs)) == NULL)
+        return NULL;
+    for (i = 0; i < WGRIB_NPHASES && status == 0; i++) {
+        sprintf(key, "%s_ns", phase_names[i]);
+        value = PyLong_FromLongLong(copy.ns[i]);
+        status = value == NULL || PyDict_SetItemString(dict, key, value);
+        Py_XDECREF(value);
+        if (status == 0) {
+            sprintf(key, "%s_calls", phase_names[i]);
+            value = PyLong_FromLongLong(copy.calls[i]);
+            status = value == NULL || PyDict_SetItemString(dict, key, value);
+            Py_XDECREF(value);
+        }
+    }
+    if (status != 0) {
+        Py_DECREF(dict);
+        return NULL;
+    }
+    return dict;
+}
+
+static PyObject *
+py_stats_reset(PyObject *self, PyObject *args)
+{
+    wgrib_stats_reset();
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+py_stats_enable(PyObject *self, PyObject *args)
+{
+    /* stats_enable(flag): turns the counters on or off, returns the old state */
+    int enable, previous = WGRIB_LOAD(wgrib_stats_enabled);
+
+    if (!PyArg_ParseTuple(args, "i", &enable))
+        return NULL;
+    WGRIB_STORE(wgrib_stats_enabled, enable != 0);
+    return PyBool_FromLong(previous);
+}
+
+static void
+call_record_hook(const struct wgrib_trace *trace)
+{
+    /* called by wgrib_run after each record, maybe without the GIL */
+    PyGILState_STATE gil = PyGILState_Ensure();
+    PyObject *hook = record_hook, *result;
+
+    if (hook != NULL) {
+        Py_INCREF(hook);
+        result = PyObject_CallFunction(hook, "lkl(LLLLLLL)",
+            trace->count, trace->pos, trace->len_grib,
+            trace->ns[0], trace->ns[1], trace->ns[2], trace->ns[3],
+            trace->ns[4], trace->ns[5], trace->ns[6]);
+        if (result == NULL)
+            PyErr_WriteUnraisable(hook);
+        Py_XDECREF(result);
+        Py_DECREF(hook);
+    }
+    PyGILState_Release(gil);
+}
+
+static PyObject *
+py_set_record_hook(PyObject *self, PyObject *args)
+{
+    /* set_record_hook(func or None): func(number, offset, length, ns)
+     * after each record of main()/capture()/run(), ns being the time of
+     * every phase in that record.  Returns the previous hook */
+    PyObject *hook, *previous;
+
+    if (!PyArg_ParseTuple(args, "O", &hook))
+        return NULL;
+    if (hook != Py_None && !PyCallable_Check(hook)) {
+        PyErr_SetString(PyExc_TypeError, "hook must be callable or None");
+        return NULL;
+    }
+    previous = record_hook ? record_hook : Py_None;
+    if (hook == Py_None) {
+        WGRIB_STORE(wgrib_record_hook, NULL);
+        record_hook = NULL;
+    }
+    else {
+        Py_INCREF(hook);
+        record_hook = hook;
+        WGRIB_STORE(wgrib_record_hook, call_record_hook);
+    }
+    if (previous == Py_None)
+        Py_INCREF(previous);
+    return previous;
+}
+
 static PyMethodDef Methods[] = {
     {"main", py_main, METH_VARARGS, "wgrib main() python wrapper"},
+    {"capture", py_capture, METH_VARARGS, "main() returning (exit code, stdout, stderr)"},
+    {"context", py_context, METH_VARARGS, "new wgrib context for run()"},
+    {"context_stats", py_context_stats, METH_VARARGS, "reuse counters of a context"},
+    {"open_input", py_open_input, METH_VARARGS, "open a grib file for run()"},
+    {"run", py_run, METH_VARARGS, "capture() reusing a context and an open input"},
+    {"scan", py_scan, METH_VARARGS, "inventory of a grib file as packed records"},
+    {"scan_buffer", py_scan_buffer, METH_VARARGS, "scan() of a grib file held in a buffer"},
+    {"record_info", py_record_info, METH_VARARGS, "packed record for a grib message in a buffer"},
+    {"message_length", py_message_length, METH_VARARGS, "length of a grib message from its first bytes"},
+    {"unpack", py_unpack, METH_VARARGS, "decode a grib message into a float32 buffer"},
+    {"unpack_window", py_unpack_window, METH_VARARGS, "decode a strided window of a grib message"},
+    {"unpack_threads", py_unpack_threads, METH_VARARGS, "threads and size threshold of threaded unpacking"},
+    {"unpack_reduce", py_unpack_reduce, METH_VARARGS, "fold a grib message into min/max/mean/histogram accumulators"},
+    {"latlon_grid", py_latlon_grid, METH_VARARGS, "lat/lon grid of a grib message"},
+    {"param_name", py_param_name, METH_VARARGS, "(name, comment) of a grib parameter"},
+    {"param_table", py_param_table, METH_VARARGS, "(id, names, comments) of a grib parameter table"},
+    {"level_text", py_level_text, METH_VARARGS, "description of a grib level"},
+    {"time_text", py_time_text, METH_VARARGS, "description of a grib time range"},
+    {"stats", py_stats, METH_NOARGS, "instrumentation counters as a dict"},
+    {"stats_reset", py_stats_reset, METH_NOARGS, "zero the instrumentation counters"},
+    {"stats_enable", py_stats_enable, METH_VARARGS, "turn the instrumentation on or off"},
+    {"set_record_hook", py_set_record_hook, METH_VARARGS, "function called after each record of main()"},
     {"system_call", system_call, METH_VARARGS, "system() wrapper"},
     {NULL, NULL, 0, NULL}
 };
@@ -135,6 +1012,8 @@ initwgrib(void)
 
     if (module == NULL)
         INITERROR;
+    wgrib_ctx_init(&table_ctx);
+    PyModule_AddIntConstant(module, "RECORD_SIZE", sizeof(struct grib_record));
     struct module_state *st = GETSTATE(module);
 
     st->error = PyErr_NewException("wgrib.RuntimeError", NULL, NULL);
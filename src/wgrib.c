@@ -4,6 +4,15 @@
 #include <stddef.h>
 #include <math.h>
 #include <float.h>
+#include <time.h>
+#ifdef _WIN32
+#define WIN32_LEAN_AND_MEAN
+#define NOMINMAX
+#include <windows.h>
+#else
+#include <pthread.h>
+#endif
+#include "wgrib.h"
 /* 
  * version 1.2.1 of grib headers  w. ebisuzaki 
  *         1.2.2 added access to spectral reference value l. kornblueh
@@ -13,7 +22,7 @@
 #define INT2(a,b)   ((1-(int) ((unsigned) (a & 0x80) >> 6)) * (int) (((a & 0x7f) << 8) + b))
 #endif
 
-#define BDS_LEN(bds)		(ec_large_grib ? len_ec_bds : ((int) ((bds[0]<<16)+(bds[1]<<8)+bds[2])) )
+#define BDS_LEN(bds)		(ctx->ec_large_grib ? ctx->len_ec_bds : ((int) ((bds[0]<<16)+(bds[1]<<8)+bds[2])) )
 
 #define BDS_Flag(bds)		(bds[3])
 
@@ -85,15 +94,9 @@
 
 /* cnames.c */
 /* then default values */
-char *k5toa(unsigned char *pds);
-char *k5_comments(unsigned char *pds);
-int setup_user_table(int center, int subcenter, int ptable);
+int setup_user_table(struct wgrib_ctx *ctx, int center, int subcenter, int ptable);
 
 
-struct ParmTable {
-	/* char *name, *comment; */
-	char *name, *comment;
-};
 /* version 1.4.5 of grib headers  w. ebisuzaki */
 /* this version is incomplete */
 /* 5/00 - dx/dy or di/dj controlled by bit 1 of resolution byte */
@@ -286,19 +289,19 @@ struct ParmTable {
 
 enum Def_NCEP_Table {rean, opn, rean_nowarn, opn_nowarn};
 
-unsigned char *seek_grib(FILE *file, unsigned long *pos, long *len_grib, 
-        unsigned char *buffer, unsigned int buf_len);
+unsigned char *seek_grib(struct wgrib_ctx *ctx, FILE *file, unsigned long *pos,
+        long *len_grib, unsigned char *buffer, unsigned int buf_len);
 
 int read_grib(FILE *file, long pos, long len_grib, unsigned char *buffer);
 
-long echack(FILE *file, long pos, long len_grib);
+long echack(struct wgrib_ctx *ctx, FILE *file, long pos, long len_grib);
 
 double ibm2flt(unsigned char *ibm);
  
 void BDS_unpack(float *flt, unsigned char *bds, unsigned char *bitmap,
         int n_bits, int n, double ref, double scale);
 
-int BDS_NValues(unsigned char *bds);
+int BDS_NValues(struct wgrib_ctx *ctx, unsigned char *bds);
 
 double int_power(double x, int y);
 
@@ -307,31 +310,33 @@ int flt2ieee(float x, unsigned char *ieee);
 int wrtieee(float *array, int n, int header, FILE *output);
 int wrtieee_header(unsigned int n, FILE *output);
 
-void levels(int, int, int, int verbose);
+void levels(FILE *out, int, int, int, int verbose);
  
-void PDStimes(int time_range, int p1, int p2, int time_unit);
+void PDStimes(FILE *out, int time_range, int p1, int p2, int time_unit);
 
 int missing_points(unsigned char *bitmap, int n);
 
-void EC_ext(unsigned char *pds, char *prefix, char *suffix, int verbose);
+void EC_ext(FILE *out, unsigned char *pds, char *prefix, char *suffix, int verbose);
 
-int GDS_grid(unsigned char *gds, unsigned char *bds, int *nx, int *ny, 
+int GDS_grid(struct wgrib_ctx *ctx, unsigned char *gds, unsigned char *bds, int *nx, int *ny, 
              long int *nxny);
 
-void GDS_prt_thin_lon(unsigned char *gds);
+void GDS_prt_thin_lon(FILE *out, unsigned char *gds);
 
-void GDS_winds(unsigned char *gds, int verbose);
+void GDS_winds(FILE *out, unsigned char *gds, int verbose);
 
-int PDS_date(unsigned char *pds, int option, int verf_time);
+int PDS_date(struct wgrib_ctx *ctx, unsigned char *pds, int option, int verf_time);
 
-int add_time(int *year, int *month, int *day, int *hour, int dtime, int unit);
+int add_time(struct wgrib_ctx *ctx, int *year, int *month, int *day, int *hour,
+	int dtime, int unit);
 
-int verf_time(unsigned char *pds, int *year, int *month, int *day, int *hour);
+int verf_time(struct wgrib_ctx *ctx, unsigned char *pds, int *year, int *month,
+	int *day, int *hour);
 
-void print_pds(unsigned char *pds, int print_PDS, int print_PDS10, int verbose);
-void print_gds(unsigned char *gds, int print_GDS, int print_GDS10, int verbose);
+void print_pds(FILE *out, unsigned char *pds, int print_PDS, int print_PDS10, int verbose);
+void print_gds(FILE *out, unsigned char *gds, int print_GDS, int print_GDS10, int verbose);
 
-void ensemble(unsigned char *pds, int mode);
+void ensemble(struct wgrib_ctx *ctx, unsigned char *pds, int mode);
 /* version 3.4 of grib headers  w. ebisuzaki */
 /* this version is incomplete */
 /* add center DWD    Helmut P. Frank */
@@ -486,27 +491,106 @@ void ensemble(unsigned char *pds, int mode);
 #ifndef DEF_T62_NCEP_TABLE
 #define DEF_T62_NCEP_TABLE	rean
 #endif
-enum Def_NCEP_Table def_ncep_table = DEF_T62_NCEP_TABLE;
-int minute = 0;
-int ncep_ens = 0;
-int cmc_eq_ncep = 0;
-extern int ec_large_grib, len_ec_bds;
 
 
+/*
+ * instrumentation (see wgrib.h)
+ *
+ * probes read the clock only while wgrib_stats_enabled is set, a phase
+ * that started with the stats off (t0 == 0) is not counted.  Counters
+ * are updated atomically where the compiler allows it
+ */
+
+int wgrib_stats_enabled = 0;
+struct wgrib_stats wgrib_stats;
+void (*wgrib_record_hook)(const struct wgrib_trace *trace) = NULL;
+
+#ifdef __GNUC__
+#define STATS_ATOMIC_ADD(x, n)	__atomic_fetch_add(&(x), (long long) (n), __ATOMIC_RELAXED)
+#else
+#define STATS_ATOMIC_ADD(x, n)	((x) += (long long) (n))
+#endif
+#define STATS_ADD(field, n)	do { if (WGRIB_LOAD(wgrib_stats_enabled)) \
+	STATS_ATOMIC_ADD(wgrib_stats.field, n); } while (0)
+#define STATS_CLOCK()		(WGRIB_LOAD(wgrib_stats_enabled) ? wgrib_clock() : 0)
+
+long long wgrib_clock(void) {
+#ifdef _WIN32
+    LARGE_INTEGER t, f;
+
+    QueryPerformanceCounter(&t);
+    QueryPerformanceFrequency(&f);
+    return (long long) (t.QuadPart * (1e9 / f.QuadPart));
+#else
+    struct timespec t;
+
+    clock_gettime(CLOCK_MONOTONIC, &t);
+    return t.tv_sec * 1000000000LL + t.tv_nsec;
+#endif
+}
+
+void wgrib_stats_reset(void) {
+    memset(&wgrib_stats, 0, sizeof(wgrib_stats));
+}
+
+/* ends a phase started at t0, adding its time to trace[phase] too */
+static void stats_phase(int phase, long long t0, long long *trace) {
+    long long dt;
+
+    if (t0 == 0) return;
+    dt = wgrib_clock() - t0;
+    STATS_ATOMIC_ADD(wgrib_stats.ns[phase], dt);
+    STATS_ATOMIC_ADD(wgrib_stats.calls[phase], 1);
+    if (trace != NULL) trace[phase] += dt;
+}
+
 #ifndef GRIB_MAIN
 #define GRIB_MAIN main
 #endif
 
 int GRIB_MAIN(int argc, char **argv) {
 
-    unsigned char *buffer;
+    return wgrib_main(argc, argv, stdout, stderr);
+}
+
+/*
+ * wgrib_main: the wgrib command, writing the inventory/diagnostics to out
+ * and messages to err instead of stdout/stderr
+ *
+ * returns the exit code of the command
+ */
+
+int wgrib_main(int argc, char **argv, FILE *out, FILE *err) {
+
+    struct wgrib_ctx ctx;
+    int return_code;
+
+    wgrib_ctx_init(&ctx);
+    ctx.out = out;
+    ctx.err = err;
+    return_code = wgrib_run(&ctx, argc, argv);
+    wgrib_ctx_free(&ctx);
+    return return_code;
+}
+
+/*
+ * wgrib_run: the wgrib command with the streams, input file, record buffer
+ * and user parameter table of ctx, which are kept for the next run
+ *
+ * ctx->input (if not NULL) is read instead of opening the file named in argv
+ * returns the exit code of the command
+ */
+
+int wgrib_run(struct wgrib_ctx *ctx, int argc, char **argv) {
+
+    unsigned char *buffer = NULL;
     float *array;
     double temp, rmin, rmax;
     int i, nx, ny, file_arg;
     long int len_grib, nxny, buffer_size, n_dump, count = 1;
     long unsigned pos = 0;
     unsigned char *msg, *pds, *gds, *bms, *bds, *pointer;
-    FILE *input, *dump_file = NULL;
+    FILE *input = NULL, *dump_file = NULL;
     char line[2000];
     enum {BINARY, TEXT, IEEE, GRIB, NONE} output_type = NONE;
     enum {DUMP_ALL, DUMP_RECORD, DUMP_POSITION, DUMP_LIST, INVENTORY} 
@@ -518,44 +602,54 @@ int GRIB_MAIN(int argc, char **argv) {
     int print_GDS = 0, print_GDS10 = 0, print_PDS = 0, print_PDS10 = 0;
     char *dump_file_name = "dump", open_parm[3];
     int return_code = 0;
+    struct wgrib_trace trace;
+    void (*record_hook)(const struct wgrib_trace *trace);
+    long long t0;
+    long wpos = 0;
+
+    /* options and once-per-run warnings only last for one run */
+    ctx->minute = ctx->ncep_ens = ctx->cmc_eq_ncep = 0;
+    ctx->warn_grib2 = ctx->missing_count = ctx->reanal_opn_count = ctx->msg_count = 0;
+    ctx->def_ncep_table = DEF_T62_NCEP_TABLE;
+    ctx->n_runs++;
 
     if (argc == 1) {
-	fprintf(stderr, "\nPortable Grib decoder for %s etc.\n",
-	    (def_ncep_table == opn_nowarn || def_ncep_table == opn) ?
+	fprintf(ctx->err, "\nPortable Grib decoder for %s etc.\n",
+	    (ctx->def_ncep_table == opn_nowarn || ctx->def_ncep_table == opn) ?
 	    "NCEP Operations" : "NCEP/NCAR Reanalysis");
-	fprintf(stderr, "   it slices, dices    %s\n", VERSION);
-	fprintf(stderr, "   usage: %s [grib file] [options]\n\n", argv[0]);
-
-	fprintf(stderr, "Inventory/diagnostic-output selections\n");
-	fprintf(stderr, "   -s/-v                   short/verbose inventory\n");
-	fprintf(stderr, "   -V                      diagnostic output (not inventory)\n");
-	fprintf(stderr, "   (none)                  regular inventory\n");
-
-	fprintf(stderr, " Options\n");
-	fprintf(stderr, "   -PDS/-PDS10             print PDS in hex/decimal\n");
-	fprintf(stderr, "   -GDS/-GDS10             print GDS in hex/decimal\n");
-	fprintf(stderr, "   -verf                   print forecast verification time\n");
-	fprintf(stderr, "   -ncep_opn/-ncep_rean    default T62 NCEP grib table\n");
-	fprintf(stderr, "   -4yr                    print year using 4 digits\n");
-	fprintf(stderr, "   -min                    print minutes\n");
-	fprintf(stderr, "   -ncep_ens               ensemble info encoded in ncep format\n");
-
-	fprintf(stderr, "Decoding GRIB selection\n");
-	fprintf(stderr, "   -d [record number|all]  decode record number\n");
-	fprintf(stderr, "   -p [byte position]      decode record at byte position\n");
-	fprintf(stderr, "   -i                      decode controlled by stdin (inventory list)\n");
-	fprintf(stderr, "   (none)                  no decoding\n");
-
-	fprintf(stderr, " Options\n");
-	fprintf(stderr, "   -text/-ieee/-grib/-bin  convert to text/ieee/grib/bin (default)\n");
-	fprintf(stderr, "   -nh/-h                  output will have no headers/headers (default)\n");
-	fprintf(stderr, "   -dwdgrib                output dwd headers, grib (do not append)\n");
-	fprintf(stderr, "   -H                      output will include PDS and GDS (-bin/-ieee only)\n");
-	fprintf(stderr, "   -append                 append to output file\n");
-	fprintf(stderr, "   -o [file]               output file name, 'dump' is default\n");
-	fprintf(stderr, " Misc\n");
-	fprintf(stderr, "   -cmc [file]             use NCEP tables for CMC (dangerous)\n");
-	exit(8);
+	fprintf(ctx->err, "   it slices, dices    %s\n", VERSION);
+	fprintf(ctx->err, "   usage: %s [grib file] [options]\n\n", argv[0]);
+
+	fprintf(ctx->err, "Inventory/diagnostic-output selections\n");
+	fprintf(ctx->err, "   -s/-v                   short/verbose inventory\n");
+	fprintf(ctx->err, "   -V                      diagnostic output (not inventory)\n");
+	fprintf(ctx->err, "   (none)                  regular inventory\n");
+
+	fprintf(ctx->err, " Options\n");
+	fprintf(ctx->err, "   -PDS/-PDS10             print PDS in hex/decimal\n");
+	fprintf(ctx->err, "   -GDS/-GDS10             print GDS in hex/decimal\n");
+	fprintf(ctx->err, "   -verf                   print forecast verification time\n");
+	fprintf(ctx->err, "   -ncep_opn/-ncep_rean    default T62 NCEP grib table\n");
+	fprintf(ctx->err, "   -4yr                    print year using 4 digits\n");
+	fprintf(ctx->err, "   -min                    print minutes\n");
+	fprintf(ctx->err, "   -ncep_ens               ensemble info encoded in ncep format\n");
+
+	fprintf(ctx->err, "Decoding GRIB selection\n");
+	fprintf(ctx->err, "   -d [record number|all]  decode record number\n");
+	fprintf(ctx->err, "   -p [byte position]      decode record at byte position\n");
+	fprintf(ctx->err, "   -i                      decode controlled by stdin (inventory list)\n");
+	fprintf(ctx->err, "   (none)                  no decoding\n");
+
+	fprintf(ctx->err, " Options\n");
+	fprintf(ctx->err, "   -text/-ieee/-grib/-bin  convert to text/ieee/grib/bin (default)\n");
+	fprintf(ctx->err, "   -nh/-h                  output will have no headers/headers (default)\n");
+	fprintf(ctx->err, "   -dwdgrib                output dwd headers, grib (do not append)\n");
+	fprintf(ctx->err, "   -H                      output will include PDS and GDS (-bin/-ieee only)\n");
+	fprintf(ctx->err, "   -append                 append to output file\n");
+	fprintf(ctx->err, "   -o [file]               output file name, 'dump' is default\n");
+	fprintf(ctx->err, " Misc\n");
+	fprintf(ctx->err, "   -cmc [file]             use NCEP tables for CMC (dangerous)\n");
+	{ return_code = 8; goto done; }
     }
     file_arg = 0;
     for (i = 1; i < argc; i++) {
@@ -625,7 +719,7 @@ int GRIB_MAIN(int argc, char **argv) {
 	    continue;
         }
 	if (strcmp(argv[i],"-cmc") == 0) {
-	    cmc_eq_ncep = 1;
+	    ctx->cmc_eq_ncep = 1;
 	    continue;
         }
 	if (strcmp(argv[i],"-d") == 0) {
@@ -666,11 +760,11 @@ int GRIB_MAIN(int argc, char **argv) {
 	    continue;
 	}
 	if (strcmp(argv[i],"-ncep_opn") == 0) {
-	    def_ncep_table = opn_nowarn;
+	    ctx->def_ncep_table = opn_nowarn;
 	    continue;
 	}
 	if (strcmp(argv[i],"-ncep_rean") == 0) {
-	    def_ncep_table = rean_nowarn;
+	    ctx->def_ncep_table = rean_nowarn;
 	    continue;
 	}
 	if (strcmp(argv[i],"-o") == 0) {
@@ -679,37 +773,50 @@ int GRIB_MAIN(int argc, char **argv) {
 	    continue;
 	}
 	if (strcmp(argv[i],"--v") == 0) {
-	    printf("wgrib: %s\n", VERSION);
-	    exit(0);
+	    fprintf(ctx->out, "wgrib: %s\n", VERSION);
+	    { return_code = 0; goto done; }
 	}
 	if (strcmp(argv[i],"-min") == 0) {
-	    minute = 1;
+	    ctx->minute = 1;
 	    continue;
 	}
 	if (strcmp(argv[i],"-ncep_ens") == 0) {
-	    ncep_ens = 1;
+	    ctx->ncep_ens = 1;
 	    continue;
 	}
 	if (file_arg == 0) {
 	    file_arg = i;
 	}
 	else {
-	    fprintf(stderr,"argument: %s ????\n", argv[i]);
+	    fprintf(ctx->err,"argument: %s ????\n", argv[i]);
 	}
     }
     if (file_arg == 0) {
-	fprintf(stderr,"no GRIB file to process\n");
-	exit(8);
+	fprintf(ctx->err,"no GRIB file to process\n");
+	{ return_code = 8; goto done; }
+    }
+    if (ctx->input != NULL) {
+	input = ctx->input;
     }
-    if ((input = fopen(argv[file_arg],"rb")) == NULL) {
-        fprintf(stderr,"could not open file: %s\n", argv[file_arg]);
-        exit(7);
+    else if ((input = fopen(argv[file_arg],"rb")) == NULL) {
+        fprintf(ctx->err,"could not open file: %s\n", argv[file_arg]);
+        { return_code = 7; goto done; }
     }
 
-    if ((buffer = (unsigned char *) malloc(BUFF_ALLOC0)) == NULL) {
-	fprintf(stderr,"not enough memory\n");
+    if (ctx->buffer != NULL) {
+	/* reuse the (possibly grown) buffer of the last run */
+	buffer = ctx->buffer;
+	buffer_size = ctx->buffer_size;
+	ctx->buffer = NULL;
+	ctx->buffer_reuses++;
+    }
+    else {
+	if ((buffer = (unsigned char *) malloc(BUFF_ALLOC0)) == NULL) {
+	    fprintf(ctx->err,"not enough memory\n");
+	}
+	buffer_size = BUFF_ALLOC0;
+	ctx->buffer_allocs++;
     }
-    buffer_size = BUFF_ALLOC0;
 
     /* open output file */
     if (mode != INVENTORY) {
@@ -717,18 +824,20 @@ int GRIB_MAIN(int argc, char **argv) {
 	if (output_type == TEXT) open_parm[1] = '\0';
 
 	if ((dump_file = fopen(dump_file_name,open_parm)) == NULL) {
-	    fprintf(stderr,"could not open dump file\n");
-	    exit(8);
+	    fprintf(ctx->err,"could not open dump file\n");
+	    { return_code = 8; goto done; }
         }
 	if (header == dwd && output_type == GRIB) wrtieee_header(0, dump_file);
     }
 
     /* skip dump - 1 records */
     for (i = 1; i < dump; i++) {
-	msg = seek_grib(input, &pos, &len_grib, buffer, MSEEK);
+	t0 = STATS_CLOCK();
+	msg = seek_grib(ctx, input, &pos, &len_grib, buffer, MSEEK);
+	stats_phase(WGRIB_SEEK, t0, NULL);
 	if (msg == NULL) {
-	    fprintf(stderr, "ran out of data or bad file\n");
-	    exit(8);
+	    fprintf(ctx->err, "ran out of data or bad file\n");
+	    { return_code = 8; goto done; }
 	}
 	pos += len_grib;
     }
@@ -741,32 +850,39 @@ int GRIB_MAIN(int argc, char **argv) {
 	    if (fgets(line,sizeof(line), stdin) == NULL) break;
             line[sizeof(line) - 1] = 0;
             if (sscanf(line,"%ld:%lu:", &count, &pos) != 2) {
-		fprintf(stderr,"bad input from stdin\n");
-                fprintf(stderr,"   %s\n", line);
-	        exit(8);
+		fprintf(ctx->err,"bad input from stdin\n");
+                fprintf(ctx->err,"   %s\n", line);
+	        { return_code = 8; goto done; }
 	    }
 	}
 
-	msg = seek_grib(input, &pos, &len_grib, buffer, MSEEK);
+	memset(trace.ns, 0, sizeof(trace.ns));
+	t0 = STATS_CLOCK();
+	msg = seek_grib(ctx, input, &pos, &len_grib, buffer, MSEEK);
+	stats_phase(WGRIB_SEEK, t0, trace.ns);
 	if (msg == NULL) {
 	    if (mode == INVENTORY || mode == DUMP_ALL) break;
-	    fprintf(stderr,"missing GRIB record(s)\n");
-	    exit(8);
+	    fprintf(ctx->err,"missing GRIB record(s)\n");
+	    { return_code = 8; goto done; }
 	}
 
         /* read all whole grib record */
         if (len_grib + msg - buffer > buffer_size) {
             buffer_size = len_grib + msg - buffer + 1000;
             buffer = (unsigned char *) realloc((void *) buffer, buffer_size);
+	    ctx->buffer_allocs++;
+	    STATS_ADD(buffer_reallocs, 1);
             if (buffer == NULL) {
-                fprintf(stderr,"ran out of memory\n");
-                exit(8);
+                fprintf(ctx->err,"ran out of memory\n");
+                { return_code = 8; goto done; }
             }
         }
+	t0 = STATS_CLOCK();
         if (read_grib(input, pos, len_grib, buffer) == 0) {
-                fprintf(stderr,"error, could not read to end of record %ld\n",count);
-                exit(8);
+                fprintf(ctx->err,"error, could not read to end of record %ld\n",count);
+                { return_code = 8; goto done; }
 	}
+	stats_phase(WGRIB_READ, t0, trace.ns);
 
 	/* parse grib message */
 
@@ -774,27 +890,27 @@ int GRIB_MAIN(int argc, char **argv) {
         pds = (msg + 8);
         pointer = pds + PDS_LEN(pds);
 #ifdef DEBUG
-	printf("LEN_GRIB= 0x%x\n", len_grib);
-	printf("PDS_LEN= 0x%x: at 0x%x\n", PDS_LEN(pds),pds-msg);
+	fprintf(ctx->out, "LEN_GRIB= 0x%x\n", len_grib);
+	fprintf(ctx->out, "PDS_LEN= 0x%x: at 0x%x\n", PDS_LEN(pds),pds-msg);
 #endif
         if (PDS_HAS_GDS(pds)) {
             gds = pointer;
             pointer += GDS_LEN(gds);
 #ifdef DEBUG
-	    printf("GDS_LEN= 0x%x: at 0x%x\n", GDS_LEN(gds), gds-msg);
+	    fprintf(ctx->out, "GDS_LEN= 0x%x: at 0x%x\n", GDS_LEN(gds), gds-msg);
 #endif
         }
         else {
             gds = NULL;
         }
 #ifdef DEBUG
-        printf("Has BMS=%d\n", PDS_HAS_BMS(pds));
+        fprintf(ctx->out, "Has BMS=%d\n", PDS_HAS_BMS(pds));
 #endif
         if (PDS_HAS_BMS(pds)) {
             bms = pointer;
             pointer += BMS_LEN(bms);
 #ifdef DEBUG
-	    printf("BMS_LEN= 0x%x: at 0x%x\n", BMS_LEN(bms),bms-msg);
+	    fprintf(ctx->out, "BMS_LEN= 0x%x: at 0x%x\n", BMS_LEN(bms),bms-msg);
 #endif
         }
         else {
@@ -806,29 +922,29 @@ int GRIB_MAIN(int argc, char **argv) {
 
 
 #ifdef DEBUG
-	printf("BDS_LEN= 0x%x\n", BDS_LEN(bds));
-	printf("END_LEN= 0x%x: at 0x%x\n", 4,pointer-msg);
+	fprintf(ctx->out, "BDS_LEN= 0x%x\n", BDS_LEN(bds));
+	fprintf(ctx->out, "END_LEN= 0x%x: at 0x%x\n", 4,pointer-msg);
 #endif
 	if (pointer-msg+4 != len_grib) {
-	    fprintf(stderr,"Len of grib message is inconsistent.\n");
+	    fprintf(ctx->err,"Len of grib message is inconsistent.\n");
 	}
 
         /* end section - "7777" in ascii */
         if (pointer[0] != 0x37 || pointer[1] != 0x37 ||
             pointer[2] != 0x37 || pointer[3] != 0x37) {
-            fprintf(stderr,"\n\n    missing end section\n");
-            fprintf(stderr, "%2x %2x %2x %2x\n", pointer[0], pointer[1], 
+            fprintf(ctx->err,"\n\n    missing end section\n");
+            fprintf(ctx->err, "%2x %2x %2x %2x\n", pointer[0], pointer[1], 
 		pointer[2], pointer[3]);
 #ifdef DEBUG
-	    printf("ignoring missing end section\n");
+	    fprintf(ctx->out, "ignoring missing end section\n");
 #else
-	    exit(8);
+	    { return_code = 8; goto done; }
 #endif
         }
 
 	/* figure out size of array */
 	if (gds != NULL) {
-	    GDS_grid(gds, bds, &nx, &ny, &nxny);
+	    GDS_grid(ctx, gds, bds, &nx, &ny, &nxny);
 	}
 	else if (bms != NULL) {
 	    nxny = nx = BMS_nxny(bms);
@@ -837,11 +953,11 @@ int GRIB_MAIN(int argc, char **argv) {
 	else {
 	    if (BDS_NumBits(bds) == 0) {
                 nxny = nx = 1;
-                fprintf(stderr,"Missing GDS, constant record .. cannot "
+                fprintf(ctx->err,"Missing GDS, constant record .. cannot "
                     "determine number of data points\n");
 	    }
 	    else {
-	        nxny = nx = BDS_NValues(bds);
+	        nxny = nx = BDS_NValues(ctx, bds);
 	    }
 	    ny = 1;
 	}
@@ -850,14 +966,14 @@ int GRIB_MAIN(int argc, char **argv) {
 	/* this grib check only works for simple packing */
 	/* turn off if harmonic */
 	    if (BDS_NumBits(bds) != 0) {
-	        i = BDS_NValues(bds);
+	        i = BDS_NValues(ctx, bds);
 	        if (bms != NULL) {
 	            i += missing_points(BMS_bitmap(bms),nxny);
 	        }
 	        if (i != nxny) {
-	            fprintf(stderr,"grib header at record %ld: two values of nxny %ld %d\n",
+	            fprintf(ctx->err,"grib header at record %ld: two values of nxny %ld %d\n",
 			count,nxny,i);
-		    fprintf(stderr,"   LEN %d DataStart %d UnusedBits %d #Bits %d nxny %ld\n",
+		    fprintf(ctx->err,"   LEN %d DataStart %d UnusedBits %d #Bits %d nxny %ld\n",
 			BDS_LEN(bds), BDS_DataStart(bds),BDS_UnusedBits(bds),
 			BDS_NumBits(bds), nxny);
 		    return_code = 15;
@@ -869,74 +985,75 @@ int GRIB_MAIN(int argc, char **argv) {
         }
 #endif
  
+	t0 = STATS_CLOCK();
         if (verbose <= 0) {
-	    printf("%ld:%lu:d=", count, pos);
-	    PDS_date(pds,year_4,v_time);
-	    printf(":%s:", k5toa(pds));
+	    fprintf(ctx->out, "%ld:%lu:d=", count, pos);
+	    PDS_date(ctx, pds,year_4,v_time);
+	    fprintf(ctx->out, ":%s:", k5toa(ctx, pds));
 
-            if (verbose == 0) printf("kpds5=%d:kpds6=%d:kpds7=%d:TR=%d:P1=%d:P2=%d:TimeU=%d:",
+            if (verbose == 0) fprintf(ctx->out, "kpds5=%d:kpds6=%d:kpds7=%d:TR=%d:P1=%d:P2=%d:TimeU=%d:",
 	        PDS_PARAM(pds),PDS_KPDS6(pds),PDS_KPDS7(pds),
 	        PDS_TimeRange(pds),PDS_P1(pds),PDS_P2(pds),
                 PDS_ForecastTimeUnit(pds));
-	    levels(PDS_KPDS6(pds), PDS_KPDS7(pds),PDS_Center(pds),verbose); printf(":");
-	    PDStimes(PDS_TimeRange(pds),PDS_P1(pds),PDS_P2(pds),
+	    levels(ctx->out, PDS_KPDS6(pds), PDS_KPDS7(pds),PDS_Center(pds),verbose); fprintf(ctx->out, ":");
+	    PDStimes(ctx->out, PDS_TimeRange(pds),PDS_P1(pds),PDS_P2(pds),
                 PDS_ForecastTimeUnit(pds));
-	    if (PDS_Center(pds) == ECMWF) EC_ext(pds,"",":",verbose);
-	    ensemble(pds, verbose);
-	    printf("NAve=%d",PDS_NumAve(pds));
-	    if (print_PDS || print_PDS10) print_pds(pds, print_PDS, print_PDS10, verbose);
-	    if (gds && (print_GDS || print_GDS10)) print_gds(gds, print_GDS, print_GDS10, verbose);
-            printf("\n");
+	    if (PDS_Center(pds) == ECMWF) EC_ext(ctx->out, pds,"",":",verbose);
+	    ensemble(ctx, pds, verbose);
+	    fprintf(ctx->out, "NAve=%d",PDS_NumAve(pds));
+	    if (print_PDS || print_PDS10) print_pds(ctx->out, pds, print_PDS, print_PDS10, verbose);
+	    if (gds && (print_GDS || print_GDS10)) print_gds(ctx->out, gds, print_GDS, print_GDS10, verbose);
+            fprintf(ctx->out, "\n");
        }
        else if (verbose == 1) {
-	    printf("%ld:%lu:D=", count, pos);
-            PDS_date(pds, 1, v_time);
-	    printf(":%s:", k5toa(pds));
-	    levels(PDS_KPDS6(pds), PDS_KPDS7(pds), PDS_Center(pds),verbose); printf(":");
-            printf("kpds=%d,%d,%d:",
+	    fprintf(ctx->out, "%ld:%lu:D=", count, pos);
+            PDS_date(ctx, pds, 1, v_time);
+	    fprintf(ctx->out, ":%s:", k5toa(ctx, pds));
+	    levels(ctx->out, PDS_KPDS6(pds), PDS_KPDS7(pds), PDS_Center(pds),verbose); fprintf(ctx->out, ":");
+            fprintf(ctx->out, "kpds=%d,%d,%d:",
 	        PDS_PARAM(pds),PDS_KPDS6(pds),PDS_KPDS7(pds));
-	    PDStimes(PDS_TimeRange(pds),PDS_P1(pds),PDS_P2(pds),
+	    PDStimes(ctx->out, PDS_TimeRange(pds),PDS_P1(pds),PDS_P2(pds),
                 PDS_ForecastTimeUnit(pds));
-	    if (PDS_Center(pds) == ECMWF) EC_ext(pds,"",":",verbose);
-	    ensemble(pds, verbose);
-	    GDS_winds(gds, verbose);
-            printf("\"%s", k5_comments(pds));
-	    if (print_PDS || print_PDS10) print_pds(pds, print_PDS, print_PDS10, verbose);
-	    if (gds && (print_GDS || print_GDS10)) print_gds(gds, print_GDS, print_GDS10, verbose);
-            printf("\n");
+	    if (PDS_Center(pds) == ECMWF) EC_ext(ctx->out, pds,"",":",verbose);
+	    ensemble(ctx, pds, verbose);
+	    GDS_winds(ctx->out, gds, verbose);
+            fprintf(ctx->out, "\"%s", k5_comments(ctx, pds));
+	    if (print_PDS || print_PDS10) print_pds(ctx->out, pds, print_PDS, print_PDS10, verbose);
+	    if (gds && (print_GDS || print_GDS10)) print_gds(ctx->out, gds, print_GDS, print_GDS10, verbose);
+            fprintf(ctx->out, "\n");
 	}
         else if (verbose == 2) {
-	    printf("rec %ld:%lu:date ", count, pos);
-	    PDS_date(pds, 1, v_time);
-	    printf(" %s kpds5=%d kpds6=%d kpds7=%d levels=(%d,%d) grid=%d ", 
-	        k5toa(pds), PDS_PARAM(pds), PDS_KPDS6(pds), PDS_KPDS7(pds), 
+	    fprintf(ctx->out, "rec %ld:%lu:date ", count, pos);
+	    PDS_date(ctx, pds, 1, v_time);
+	    fprintf(ctx->out, " %s kpds5=%d kpds6=%d kpds7=%d levels=(%d,%d) grid=%d ", 
+	        k5toa(ctx, pds), PDS_PARAM(pds), PDS_KPDS6(pds), PDS_KPDS7(pds), 
                 PDS_LEVEL1(pds), PDS_LEVEL2(pds), PDS_Grid(pds));
-	        levels(PDS_KPDS6(pds),PDS_KPDS7(pds),PDS_Center(pds),verbose);
+	        levels(ctx->out, PDS_KPDS6(pds),PDS_KPDS7(pds),PDS_Center(pds),verbose);
 
-	    printf(" ");
-	    if (PDS_Center(pds) == ECMWF) EC_ext(pds,""," ",verbose);
-	    ensemble(pds, verbose);
-	    PDStimes(PDS_TimeRange(pds),PDS_P1(pds),PDS_P2(pds),
+	    fprintf(ctx->out, " ");
+	    if (PDS_Center(pds) == ECMWF) EC_ext(ctx->out, pds,""," ",verbose);
+	    ensemble(ctx, pds, verbose);
+	    PDStimes(ctx->out, PDS_TimeRange(pds),PDS_P1(pds),PDS_P2(pds),
                  PDS_ForecastTimeUnit(pds));
 	    if (bms != NULL) 
-		printf(" bitmap: %d undef", missing_points(BMS_bitmap(bms),nxny));
-            printf("\n  %s=%s\n", k5toa(pds), k5_comments(pds));
+		fprintf(ctx->out, " bitmap: %d undef", missing_points(BMS_bitmap(bms),nxny));
+            fprintf(ctx->out, "\n  %s=%s\n", k5toa(ctx, pds), k5_comments(ctx, pds));
 	
-            printf("  timerange %d P1 %d P2 %d TimeU %d  nx %d ny %d GDS grid %d "
+            fprintf(ctx->out, "  timerange %d P1 %d P2 %d TimeU %d  nx %d ny %d GDS grid %d "
 		"num_in_ave %d missing %d\n", 
 	        PDS_TimeRange(pds),PDS_P1(pds),PDS_P2(pds), 
                 PDS_ForecastTimeUnit(pds), nx, ny, 
                 gds == NULL ? -1 : GDS_DataType(gds), 
                 PDS_NumAve(pds), PDS_NumMissing(pds));
 
-	    printf("  center %d subcenter %d process %d Table %d", 
+	    fprintf(ctx->out, "  center %d subcenter %d process %d Table %d", 
 		PDS_Center(pds),PDS_Subcenter(pds),PDS_Model(pds),
                 PDS_Vsn(pds));
-	    GDS_winds(gds, verbose);
-	    printf("\n");
+	    GDS_winds(ctx->out, gds, verbose);
+	    fprintf(ctx->out, "\n");
 
 	    if (gds && GDS_LatLon(gds) && nx != -1) 
-		printf("  latlon: lat  %f to %f by %f  nxny %ld\n"
+		fprintf(ctx->out, "  latlon: lat  %f to %f by %f  nxny %ld\n"
                        "          long %f to %f by %f, (%d x %d) scan %d "
                        "mode %d bdsgrid %d\n",
 		  0.001*GDS_LatLon_La1(gds), 0.001*GDS_LatLon_La2(gds),
@@ -945,7 +1062,7 @@ int GRIB_MAIN(int argc, char **argv) {
 	    	  nx, ny, GDS_LatLon_scan(gds), GDS_LatLon_mode(gds),
 		  BDS_Grid(bds));
 	    else if (gds && GDS_LatLon(gds) && nx == -1) {
-		printf("  thinned latlon: lat  %f to %f by %f  nxny %ld\n"
+		fprintf(ctx->out, "  thinned latlon: lat  %f to %f by %f  nxny %ld\n"
                        "          long %f to %f, %ld grid pts   (%d x %d) scan %d"
 			" mode %d bdsgrid %d\n",
 		  0.001*GDS_LatLon_La1(gds), 0.001*GDS_LatLon_La2(gds),
@@ -953,10 +1070,10 @@ int GRIB_MAIN(int argc, char **argv) {
 		  0.001*GDS_LatLon_Lo2(gds),
 	    	  nxny, nx, ny, GDS_LatLon_scan(gds), GDS_LatLon_mode(gds),
 		  BDS_Grid(bds));
-		  GDS_prt_thin_lon(gds);
+		  GDS_prt_thin_lon(ctx->out, gds);
 	    }
 	    else if (gds && GDS_Gaussian(gds) && nx != -1)
-		printf("  gaussian: lat  %f to %f\n"
+		fprintf(ctx->out, "  gaussian: lat  %f to %f\n"
                        "            long %f to %f by %f, (%d x %d) scan %d"
 			" mode %d bdsgrid %d\n",
 		  0.001*GDS_LatLon_La1(gds), 0.001*GDS_LatLon_La2(gds),
@@ -965,17 +1082,17 @@ int GRIB_MAIN(int argc, char **argv) {
 	    	  nx, ny, GDS_LatLon_scan(gds), GDS_LatLon_mode(gds),
 		  BDS_Grid(bds));
 	    else if (gds && GDS_Gaussian(gds) && nx == -1) {
-		printf("  thinned gaussian: lat  %f to %f\n"
+		fprintf(ctx->out, "  thinned gaussian: lat  %f to %f\n"
                        "          long %f to %f, %ld grid pts   (%d x %d) scan %d"
 			" mode %d bdsgrid %d\n",
 		  0.001*GDS_LatLon_La1(gds), 0.001*GDS_LatLon_La2(gds),
 		  0.001*GDS_LatLon_Lo1(gds), 0.001*GDS_LatLon_Lo2(gds),
 	    	  nxny, nx, ny, GDS_LatLon_scan(gds), GDS_LatLon_mode(gds),
 		  BDS_Grid(bds));
-		  GDS_prt_thin_lon(gds);
+		  GDS_prt_thin_lon(ctx->out, gds);
 	    }
 	    else if (gds && GDS_Polar(gds))
-		printf("  polar stereo: Lat1 %f Long1 %f Orient %f\n"
+		fprintf(ctx->out, "  polar stereo: Lat1 %f Long1 %f Orient %f\n"
 			"     %s pole (%d x %d) Dx %d Dy %d scan %d mode %d\n",
 		    0.001*GDS_Polar_La1(gds),0.001*GDS_Polar_Lo1(gds),
 		    0.001*GDS_Polar_Lov(gds),
@@ -983,7 +1100,7 @@ int GRIB_MAIN(int argc, char **argv) {
 		    GDS_Polar_Dx(gds),GDS_Polar_Dy(gds),
 		    GDS_Polar_scan(gds), GDS_Polar_mode(gds));
 	    else if (gds && GDS_Lambert(gds))
-		printf("  Lambert Conf: Lat1 %f Lon1 %f Lov %f\n"
+		fprintf(ctx->out, "  Lambert Conf: Lat1 %f Lon1 %f Lov %f\n"
                        "      Latin1 %f Latin2 %f LatSP %f LonSP %f\n"
                        "      %s (%d x %d) Dx %f Dy %f scan %d mode %d\n",
                      0.001*GDS_Lambert_La1(gds),0.001*GDS_Lambert_Lo1(gds),
@@ -996,7 +1113,7 @@ int GRIB_MAIN(int argc, char **argv) {
                      GDS_Lambert_scan(gds), GDS_Lambert_mode(gds));
 	    else if (gds && GDS_Albers(gds))
 		/* Albers equal area has same parameters as Lambert conformal */
-		printf("  Albers Equal-Area: Lat1 %f Lon1 %f Lov %f\n"
+		fprintf(ctx->out, "  Albers Equal-Area: Lat1 %f Lon1 %f Lov %f\n"
                        "      Latin1 %f Latin2 %f LatSP %f LonSP %f\n"
                        "      %s (%d x %d) Dx %f Dy %f scan %d mode %d\n",
                      0.001*GDS_Lambert_La1(gds),0.001*GDS_Lambert_Lo1(gds),
@@ -1008,7 +1125,7 @@ int GRIB_MAIN(int argc, char **argv) {
                      0.001*GDS_Lambert_dx(gds), 0.001*GDS_Lambert_dy(gds),
                      GDS_Lambert_scan(gds), GDS_Lambert_mode(gds));
 	    else if (gds && GDS_Mercator(gds))
-		printf("  Mercator: lat  %f to %f by %f km  nxny %ld\n"
+		fprintf(ctx->out, "  Mercator: lat  %f to %f by %f km  nxny %ld\n"
                        "          long %f to %f by %f km, (%d x %d) scan %d"
 			" mode %d Latin %f bdsgrid %d\n",
 		  0.001*GDS_Merc_La1(gds), 0.001*GDS_Merc_La2(gds),
@@ -1017,7 +1134,7 @@ int GRIB_MAIN(int argc, char **argv) {
 	    	  nx, ny, GDS_Merc_scan(gds), GDS_Merc_mode(gds), 
 		  0.001*GDS_Merc_Latin(gds), BDS_Grid(bds));
 	    else if (gds && GDS_ssEgrid(gds))
-		printf("  Semi-staggered Arakawa E-Grid: lat0 %f lon0 %f nxny %d\n"
+		fprintf(ctx->out, "  Semi-staggered Arakawa E-Grid: lat0 %f lon0 %f nxny %d\n"
                        "    dLat %f dLon %f (%d x %d) scan %d mode %d\n",
 		  0.001*GDS_ssEgrid_La1(gds), 0.001*GDS_ssEgrid_Lo1(gds), 
                   GDS_ssEgrid_n(gds)*GDS_ssEgrid_n_dum(gds), 
@@ -1025,7 +1142,7 @@ int GRIB_MAIN(int argc, char **argv) {
                   GDS_ssEgrid_Lo2(gds), GDS_ssEgrid_La2(gds),
                   GDS_ssEgrid_scan(gds), GDS_ssEgrid_mode(gds));
             else if (gds && GDS_ss2dEgrid(gds))
-                printf("  Semi-staggered Arakawa E-Grid (2D): lat0 %f lon0 %f nxny %d\n"
+                fprintf(ctx->out, "  Semi-staggered Arakawa E-Grid (2D): lat0 %f lon0 %f nxny %d\n"
                        "    dLat %f dLon %f (tlm0d %f tph0d %f) scan %d mode %d\n",
                    0.001*GDS_ss2dEgrid_La1(gds), 0.001*GDS_ss2dEgrid_Lo1(gds),
                    GDS_ss2dEgrid_nx(gds)*GDS_ss2dEgrid_ny(gds),
@@ -1033,7 +1150,7 @@ int GRIB_MAIN(int argc, char **argv) {
                    0.001*GDS_ss2dEgrid_Lo2(gds), 0.001*GDS_ss2dEgrid_La2(gds),
                    GDS_ss2dEgrid_scan(gds), GDS_ss2dEgrid_mode(gds));
             else if (gds && GDS_ss2dBgrid(gds))
-                printf("  Semi-staggered Arakawa B-Grid (2D): lat0 %f lon0 %f nxny %d\n"
+                fprintf(ctx->out, "  Semi-staggered Arakawa B-Grid (2D): lat0 %f lon0 %f nxny %d\n"
                        "    dLat %f dLon %f (tlm0d %f tph0d %f) scan %d mode %d\n",
                    0.001*GDS_ss2dBgrid_La1(gds), 0.001*GDS_ss2dBgrid_Lo1(gds),
                    GDS_ss2dBgrid_nx(gds)*GDS_ss2dBgrid_ny(gds),
@@ -1041,7 +1158,7 @@ int GRIB_MAIN(int argc, char **argv) {
                    0.001*GDS_ss2dBgrid_Lo2(gds), 0.001*GDS_ss2dBgrid_La2(gds),
                    GDS_ss2dBgrid_scan(gds), GDS_ss2dBgrid_mode(gds)); 
 	    else if (gds && GDS_fEgrid(gds)) 
-		printf("  filled Arakawa E-Grid: lat0 %f lon0 %f nxny %d\n"
+		fprintf(ctx->out, "  filled Arakawa E-Grid: lat0 %f lon0 %f nxny %d\n"
                        "    dLat %f dLon %f (%d x %d) scan %d mode %d\n",
 		  0.001*GDS_fEgrid_La1(gds), 0.001*GDS_fEgrid_Lo1(gds), 
                   GDS_fEgrid_n(gds)*GDS_fEgrid_n_dum(gds), 
@@ -1049,7 +1166,7 @@ int GRIB_MAIN(int argc, char **argv) {
                   GDS_fEgrid_Lo2(gds), GDS_fEgrid_La2(gds),
                   GDS_fEgrid_scan(gds), GDS_fEgrid_mode(gds));
 	    else if (gds && GDS_RotLL(gds))
-		printf("  rotated LatLon grid  lat %f to %f  lon %f to %f\n"
+		fprintf(ctx->out, "  rotated LatLon grid  lat %f to %f  lon %f to %f\n"
 		       "    nxny %ld  (%d x %d)  dx %d dy %d  scan %d  mode %d\n"
 		       "    transform: south pole lat %f lon %f  rot angle %f\n", 
 		   0.001*GDS_RotLL_La1(gds), 0.001*GDS_RotLL_La2(gds), 
@@ -1060,27 +1177,32 @@ int GRIB_MAIN(int argc, char **argv) {
 		   0.001*GDS_RotLL_LaSP(gds), 0.001*GDS_RotLL_LoSP(gds),
 		   GDS_RotLL_RotAng(gds) );
 	    else if (gds && GDS_Gnomonic(gds))
-		printf("  Gnomonic grid\n");
+		fprintf(ctx->out, "  Gnomonic grid\n");
 	    else if (gds && GDS_Harmonic(gds))
-		printf("  Harmonic (spectral):  pentagonal spectral truncation: nj %d nk %d nm %d\n",
+		fprintf(ctx->out, "  Harmonic (spectral):  pentagonal spectral truncation: nj %d nk %d nm %d\n",
 		       GDS_Harmonic_nj(gds), GDS_Harmonic_nk(gds),
 		       GDS_Harmonic_nm(gds));
 		if (gds && GDS_Harmonic_type(gds) == 1)
-		  printf("  Associated Legendre polynomials\n");
+		  fprintf(ctx->out, "  Associated Legendre polynomials\n");
             else if (gds && GDS_Triangular(gds))
-                printf("  Triangular grid:  nd %d ni %d (= 2^%d x 3^%d)\n",
+                fprintf(ctx->out, "  Triangular grid:  nd %d ni %d (= 2^%d x 3^%d)\n",
 		    GDS_Triangular_nd(gds), GDS_Triangular_ni(gds), 
                     GDS_Triangular_ni2(gds), GDS_Triangular_ni3(gds) );
 	    if (print_PDS || print_PDS10) 
-                print_pds(pds, print_PDS, print_PDS10, verbose);
+                print_pds(ctx->out, pds, print_PDS, print_PDS10, verbose);
 	    if (gds && (print_GDS || print_GDS10)) 
-                 print_gds(gds, print_GDS, print_GDS10, verbose);
+                 print_gds(ctx->out, gds, print_GDS, print_GDS10, verbose);
 	}
+	stats_phase(WGRIB_INVENTORY, t0, trace.ns);
 
 	if (mode != INVENTORY && output_type == GRIB) {
+		t0 = STATS_CLOCK();
+		if (t0) wpos = ftell(dump_file);
 	        if (header == dwd) wrtieee_header((int) len_grib, dump_file);
 	        fwrite((void *) msg, sizeof(char), len_grib, dump_file);
 	        if (header == dwd) wrtieee_header((int) len_grib, dump_file);
+		if (t0) STATS_ADD(bytes_written, ftell(dump_file) - wpos);
+		stats_phase(WGRIB_WRITE, t0, trace.ns);
 	    n_dump++;
 	}
 
@@ -1088,16 +1210,27 @@ int GRIB_MAIN(int argc, char **argv) {
 	    /* decode numeric data */
  
             if ((array = (float *) malloc(sizeof(float) * nxny)) == NULL) {
-                fprintf(stderr,"memory problems\n");
-                exit(8);
+                fprintf(ctx->err,"memory problems\n");
+                { return_code = 8; goto done; }
             }
 
 	    temp = int_power(10.0, - PDS_DecimalScale(pds));
 
+	    if (BDS_ComplexPacking(bds)) {
+		/* BDS_unpack would exit */
+		fprintf(ctx->err,"*** Cannot decode complex packed fields n=%ld***\n", nxny);
+		free(array);
+		{ return_code = 8; goto done; }
+	    }
+ 	    t0 = STATS_CLOCK();
  	    BDS_unpack(array, bds, BMS_bitmap(bms), BDS_NumBits(bds), nxny,
 			   temp*BDS_RefValue(bds),temp*int_power(2.0, BDS_BinScale(bds)));
+	    stats_phase(WGRIB_UNPACK, t0, trace.ns);
+	    STATS_ADD(fields, 1);
+	    STATS_ADD(values, nxny);
 
 	    if (verbose > 1) {
+		t0 = STATS_CLOCK();
 		rmin = FLT_MAX;
 		rmax = -FLT_MAX;
 	        for (i = 0; i < nxny; i++) {
@@ -1106,13 +1239,16 @@ int GRIB_MAIN(int argc, char **argv) {
 	                rmax = max(rmax,array[i]);
 		    }
 	        }
-	        printf("  min/max data %g %g  num bits %d "
+	        fprintf(ctx->out, "  min/max data %g %g  num bits %d "
 			" BDS_Ref %g  DecScale %d BinScale %d\n", 
 		    rmin, rmax, BDS_NumBits(bds), BDS_RefValue(bds),
 		    PDS_DecimalScale(pds), BDS_BinScale(bds));
+		stats_phase(WGRIB_INVENTORY, t0, trace.ns);
 	    }
 
 	    if (mode != INVENTORY && output_type != GRIB) {
+		t0 = STATS_CLOCK();
+		if (t0) wpos = ftell(dump_file);
 		/* dump code */
 		if (output_PDS_GDS == 1) {
 		    /* insert code here */
@@ -1164,10 +1300,21 @@ int GRIB_MAIN(int argc, char **argv) {
 		        fprintf(dump_file,"%g\n", array[i]);
 		    }
 	        }
+		if (t0) STATS_ADD(bytes_written, ftell(dump_file) - wpos);
+		stats_phase(WGRIB_WRITE, t0, trace.ns);
 	        n_dump++;
 	    }
 	    free(array);
-	    if (verbose > 0) printf("\n");
+	    if (verbose > 0) fprintf(ctx->out, "\n");
+	}
+
+	STATS_ADD(records, 1);
+	record_hook = WGRIB_LOAD(wgrib_record_hook);
+	if (record_hook != NULL) {
+	    trace.count = count;
+	    trace.pos = pos;
+	    trace.len_grib = len_grib;
+	    record_hook(&trace);
 	}
 	    
         pos += len_grib;
@@ -1177,86 +1324,305 @@ int GRIB_MAIN(int argc, char **argv) {
     if (mode != INVENTORY) {
 	if (header == dwd && output_type == GRIB) wrtieee_header(0, dump_file);
 	if (ferror(dump_file)) {
-		fprintf(stderr,"error writing %s\n",dump_file_name);
-		exit(8);
+		fprintf(ctx->err,"error writing %s\n",dump_file_name);
+		{ return_code = 8; goto done; }
 	}
     }
-    fclose(input);
+
+done:
+    if (dump_file != NULL) fclose(dump_file);
+    if (input != NULL && input != ctx->input) fclose(input);
+    if (buffer != NULL) {
+	ctx->buffer = buffer;
+	ctx->buffer_size = buffer_size;
+    }
     return (return_code);
 }
 
-void print_pds(unsigned char *pds, int print_PDS, int print_PDS10, int verbose) {
+/*
+ * grib_sections: find the sections of a complete grib message
+ *
+ * input: msg, start of grib message ("GRIB")
+ *        len_grib, length of grib message
+ * output: *pds, *gds, *bms, *bds (gds and bms are NULL if not present)
+ *
+ * returns 0 if ok, 1 if the message is truncated or missing the end section
+ * nothing is printed
+ */
+
+static int grib_sections(struct wgrib_ctx *ctx, unsigned char *msg, long len_grib,
+	unsigned char **pds, unsigned char **gds, unsigned char **bms, unsigned char **bds) {
+
+    unsigned char *p, *g, *b, *pointer;
+
+    p = msg + 8;
+    pointer = p + PDS_LEN(p);
+    g = NULL;
+    if (PDS_HAS_GDS(p)) {
+	g = pointer;
+	pointer += GDS_LEN(g);
+    }
+    b = NULL;
+    if (PDS_HAS_BMS(p)) {
+	b = pointer;
+	pointer += BMS_LEN(b);
+    }
+    *pds = p;
+    *gds = g;
+    *bms = b;
+    *bds = pointer;
+    if (pointer - msg + 11 > len_grib) return 1;
+    pointer += BDS_LEN(pointer);
+
+    if (pointer - msg + 4 > len_grib) return 1;
+    if (pointer[0] != 0x37 || pointer[1] != 0x37 ||
+	    pointer[2] != 0x37 || pointer[3] != 0x37) return 1;
+    return 0;
+}
+
+/*
+ * grib_nxny: size of the decoded array, same rules as GRIB_MAIN
+ */
+
+static long int grib_nxny(struct wgrib_ctx *ctx, unsigned char *gds,
+	unsigned char *bms, unsigned char *bds, int *nx, int *ny) {
+
+    long int nxny;
+    int i;
+
+    if (gds != NULL) {
+	GDS_grid(ctx, gds, bds, nx, ny, &nxny);
+    }
+    else if (bms != NULL) {
+	nxny = *nx = BMS_nxny(bms);
+	*ny = 1;
+    }
+    else {
+	nxny = *nx = BDS_NumBits(bds) == 0 ? 1 : BDS_NValues(ctx, bds);
+	*ny = 1;
+    }
+#ifdef CHECK_GRIB
+    if (gds && ! GDS_Harmonic(gds) && BDS_NumBits(bds) != 0) {
+	i = BDS_NValues(ctx, bds);
+	if (bms != NULL) i += missing_points(BMS_bitmap(bms), nxny);
+	if (i != nxny) {
+	    nxny = *nx = i;
+	    *ny = 1;
+	}
+    }
+#endif
+    return nxny;
+}
+
+/*
+ * ens_member: ensemble member as printed by ensemble() and EC_ext()
+ * 0 for the control run and for non-ensemble records,
+ * +/-n for NCEP perturbations, n for ECMWF perturbed forecasts
+ */
+
+static int ens_member(struct wgrib_ctx *ctx, unsigned char *pds) {
+
+    if ((PDS_Center(pds) == NMC || ctx->ncep_ens) && PDS_LEN(pds) >= 45 && pds[40] == 1) {
+	if (pds[41] == 2) return -pds[42];
+	if (pds[41] == 3) return pds[42];
+	return 0;
+    }
+    if (PDS_Center(pds) == ECMWF && PDS_EcENS(pds)) return PDS_EcFcstNo(pds);
+    return 0;
+}
+
+/*
+ * grib_record_info: fill *info from a complete grib message
+ *
+ * returns 0 if ok, 1 if the message is not consistent
+ */
+
+static int grib_record_info(struct wgrib_ctx *ctx, unsigned char *msg, long len_grib,
+	unsigned long pos, struct grib_record *info) {
+
+    unsigned char *pds, *gds, *bms, *bds;
+    int nx, ny;
+
+    if (grib_sections(ctx, msg, len_grib, &pds, &gds, &bms, &bds)) return 1;
+
+    /* no uninitialized padding in the rows handed to python */
+    memset(info, 0, sizeof(*info));
+    info->offset = pos;
+    info->length = len_grib;
+    info->date = ((PDS_Year4(pds) * 100LL + PDS_Month(pds)) * 100LL + PDS_Day(pds))
+	* 100LL + PDS_Hour(pds);
+    info->minute = PDS_Minute(pds);
+    info->kpds5 = PDS_KPDS5(pds);
+    info->kpds6 = PDS_KPDS6(pds);
+    info->kpds7 = PDS_KPDS7(pds);
+    info->time_range = PDS_TimeRange(pds);
+    info->p1 = PDS_P1(pds);
+    info->p2 = PDS_P2(pds);
+    info->time_unit = PDS_ForecastTimeUnit(pds);
+    info->center = PDS_Center(pds);
+    info->subcenter = PDS_Subcenter(pds);
+    info->process = PDS_Model(pds);
+    info->table = PDS_Vsn(pds);
+    info->grid = PDS_Grid(pds);
+    info->nxny = grib_nxny(ctx, gds, bms, bds, &nx, &ny);
+    info->nx = nx;
+    info->ny = ny;
+    info->n_bits = BDS_NumBits(bds);
+    info->has_bitmap = bms != NULL;
+    info->gds_offset = gds == NULL ? 0 : gds - msg;
+    info->bms_offset = bms == NULL ? 0 : bms - msg;
+    info->bds_offset = bds - msg;
+    info->bds_length = BDS_LEN(bds);
+    info->member = ens_member(ctx, pds);
+    return 0;
+}
+
+/*
+ * scan_grib_file: inventory of a grib file without any printed output
+ *
+ * input: input, grib file opened for reading
+ * output: *records, malloc'ed array of record information (caller frees)
+ *
+ * returns number of records, -1 if out of memory, -2 if a record is bad
+ */
+
+long scan_grib_file(struct wgrib_ctx *ctx, FILE *input, struct grib_record **records) {
+
+    unsigned char *buffer, *msg;
+    struct grib_record *tmp;
+    long int len_grib, buffer_size, n = 0, n_alloc = 0;
+    long unsigned pos = 0;
+    long status = 0;
+    long long t0;
+
+    *records = NULL;
+    if ((buffer = (unsigned char *) malloc(BUFF_ALLOC0)) == NULL) return -1;
+    buffer_size = BUFF_ALLOC0;
+
+    for (;;) {
+	t0 = STATS_CLOCK();
+	msg = seek_grib(ctx, input, &pos, &len_grib, buffer, MSEEK);
+	stats_phase(WGRIB_SEEK, t0, NULL);
+	if (msg == NULL) break;
+
+        if (len_grib + msg - buffer > buffer_size) {
+            buffer_size = len_grib + msg - buffer + 1000;
+            msg = (unsigned char *) realloc((void *) buffer, buffer_size);
+            if (msg == NULL) {
+		status = -1;
+		break;
+            }
+	    buffer = msg;
+	    STATS_ADD(buffer_reallocs, 1);
+        }
+	t0 = STATS_CLOCK();
+        if (read_grib(input, pos, len_grib, buffer) == 0) {
+	    status = -2;
+	    break;
+	}
+	stats_phase(WGRIB_READ, t0, NULL);
+
+	if (n == n_alloc) {
+	    n_alloc = n_alloc ? 2 * n_alloc : 256;
+	    tmp = (struct grib_record *) realloc((void *) *records,
+		n_alloc * sizeof(struct grib_record));
+	    if (tmp == NULL) {
+		status = -1;
+		break;
+	    }
+	    *records = tmp;
+	}
+	t0 = STATS_CLOCK();
+	if (grib_record_info(ctx, buffer, len_grib, pos, *records + n) != 0) {
+	    status = -2;
+	    break;
+	}
+	stats_phase(WGRIB_SCAN, t0, NULL);
+	STATS_ADD(records_scanned, 1);
+	n++;
+        pos += len_grib;
+    }
+    free(buffer);
+    if (status != 0) {
+	free(*records);
+	*records = NULL;
+	return status;
+    }
+    return n;
+}
+
+void print_pds(FILE *out, unsigned char *pds, int print_PDS, int print_PDS10, int verbose) {
     int i, j;
 
     j = PDS_LEN(pds);
     if (verbose < 2) {
         if (print_PDS && verbose < 2) {
-            printf(":PDS=");
+            fprintf(out, ":PDS=");
             for (i = 0; i < j; i++) {
-                printf("%2.2x", (int) pds[i]);
+                fprintf(out, "%2.2x", (int) pds[i]);
             }
         }
         if (print_PDS10 && verbose < 2) {
-            printf(":PDS10=");
+            fprintf(out, ":PDS10=");
             for (i = 0; i < j; i++) {
-                printf(" %d", (int) pds[i]);
+                fprintf(out, " %d", (int) pds[i]);
             }
         }
     }
     else {
         if (print_PDS) {
-            printf("  PDS(1..%d)=",j);
+            fprintf(out, "  PDS(1..%d)=",j);
             for (i = 0; i < j; i++) {
-                if (i % 20 == 0) printf("\n    %4d:",i+1);
-                printf(" %3.2x", (int) pds[i]);
+                if (i % 20 == 0) fprintf(out, "\n    %4d:",i+1);
+                fprintf(out, " %3.2x", (int) pds[i]);
             }
-            printf("\n");
+            fprintf(out, "\n");
         }
         if (print_PDS10) {
-            printf("  PDS10(1..%d)=",j);
+            fprintf(out, "  PDS10(1..%d)=",j);
             for (i = 0; i < j; i++) {
-                if (i % 20 == 0) printf("\n    %4d:",i+1);
-                printf(" %3d", (int) pds[i]);
+                if (i % 20 == 0) fprintf(out, "\n    %4d:",i+1);
+                fprintf(out, " %3d", (int) pds[i]);
             }
-            printf("\n");
+            fprintf(out, "\n");
         }
     }
 }
 
-void print_gds(unsigned char *gds, int print_GDS, int print_GDS10, int verbose) {
+void print_gds(FILE *out, unsigned char *gds, int print_GDS, int print_GDS10, int verbose) {
     int i, j;
 
     j = GDS_LEN(gds);
     if (verbose < 2) {
         if (print_GDS && verbose < 2) {
-            printf(":GDS=");
+            fprintf(out, ":GDS=");
             for (i = 0; i < j; i++) {
-                printf("%2.2x", (int) gds[i]);
+                fprintf(out, "%2.2x", (int) gds[i]);
             }
         }
         if (print_GDS10 && verbose < 2) {
-            printf(":GDS10=");
+            fprintf(out, ":GDS10=");
             for (i = 0; i < j; i++) {
-                printf(" %d", (int) gds[i]);
+                fprintf(out, " %d", (int) gds[i]);
             }
         }
     }
     else {
         if (print_GDS) {
-            printf("  GDS(1..%d)=",j);
+            fprintf(out, "  GDS(1..%d)=",j);
             for (i = 0; i < j; i++) {
-                if (i % 20 == 0) printf("\n    %4d:",i+1);
-                printf(" %3.2x", (int) gds[i]);
+                if (i % 20 == 0) fprintf(out, "\n    %4d:",i+1);
+                fprintf(out, " %3.2x", (int) gds[i]);
             }
-            printf("\n");
+            fprintf(out, "\n");
         }
         if (print_GDS10) {
-            printf("  GDS10(1..%d)=",j);
+            fprintf(out, "  GDS10(1..%d)=",j);
             for (i = 0; i < j; i++) {
-                if (i % 20 == 0) printf("\n    %4d:",i+1);
-                printf(" %3d", (int) gds[i]);
+                if (i % 20 == 0) fprintf(out, "\n    %4d:",i+1);
+                fprintf(out, " %3d", (int) gds[i]);
             }
-            printf("\n");
+            fprintf(out, "\n");
         }
     }
 }
@@ -1292,19 +1658,18 @@ void print_gds(unsigned char *gds, int print_GDS, int print_GDS10, int verbose)
 /* #define LEN_HEADER_PDS (28+42+100) */
 #define LEN_HEADER_PDS (28+8)
 
-int ec_large_grib = 0,  len_ec_bds;
-
-unsigned char *seek_grib(FILE *file, unsigned long *pos, long *len_grib, 
-        unsigned char *buffer, unsigned int buf_len) {
+unsigned char *seek_grib(struct wgrib_ctx *ctx, FILE *file, unsigned long *pos,
+        long *len_grib, unsigned char *buffer, unsigned int buf_len) {
 
     int i, len;
     long length_grib;
-    static int warn_grib2 = 0;
+    long long t0;
     clearerr(file);
     while ( !feof(file) ) {
 
         if (fseek(file, *pos, SEEK_SET) == -1) break;
 	i = fread(buffer, sizeof (unsigned char), buf_len, file);     
+	STATS_ADD(bytes_read, i);
         if (ferror(file)) break;
         len = i - LEN_HEADER_PDS;
      
@@ -1318,17 +1683,19 @@ unsigned char *seek_grib(FILE *file, unsigned long *pos, long *len_grib,
                             buffer[i+6];
 
 		    /* small records don't have ECMWF hack */
-		    if ((length_grib & 0x800000) == 0) { ec_large_grib = 0; return (buffer + i); }
+		    if ((length_grib & 0x800000) == 0) { ctx->ec_large_grib = 0; return (buffer + i); }
 
 		    /* potential for ECMWF hack */
-		    ec_large_grib = 1;
-		    *len_grib = echack(file, *pos, length_grib);
+		    ctx->ec_large_grib = 1;
+		    t0 = STATS_CLOCK();
+		    *len_grib = echack(ctx, file, *pos, length_grib);
+		    stats_phase(WGRIB_ECHACK, t0, NULL);
                     return (buffer+i);
 		}
 
 		/* grib edition 2 */
 		else if (buffer[i+7] == 2) {
-		    if (warn_grib2++ == 0) fprintf(stderr,"grib2 message ignored (use wgrib2)\n");
+		    if (ctx->warn_grib2++ == 0) fprintf(ctx->err,"grib2 message ignored (use wgrib2)\n");
 		}
 
             }
@@ -1347,7 +1714,7 @@ unsigned char *seek_grib(FILE *file, unsigned long *pos, long *len_grib,
    getting the lengths of the various sections before the bds.  To see if those
    sections are there requires checking the flags in the pds.  */
 
-long echack(FILE *file, long pos, long len_grib) {
+long echack(struct wgrib_ctx *ctx, FILE *file, long pos, long len_grib) {
 
     int gdsflg, bmsflg, center;
     unsigned int pdslen, gdslen, bmslen, bdslen;
@@ -1366,7 +1733,7 @@ long echack(FILE *file, long pos, long len_grib) {
 
     /* know that NCEP and CMC do not use echack */
     if (center == NMC || center == CMC) {
-	ec_large_grib = 0;
+	ctx->ec_large_grib = 0;
         return len_grib;
     }
 
@@ -1400,13 +1767,13 @@ long echack(FILE *file, long pos, long len_grib) {
 
     if (bdslen >= 120) {
 	/* normal record */
-	ec_large_grib = 0;
+	ctx->ec_large_grib = 0;
     }
     else {
         /* ECMWF hack */
         len_grib = (len & 0x7fffff) * 120 - bdslen + 4;
-        len_ec_bds = len_grib - (12 + pdslen + gdslen + bmslen);
-	ec_large_grib = 1;
+        ctx->len_ec_bds = len_grib - (12 + pdslen + gdslen + bmslen);
+	ctx->ec_large_grib = 1;
     }
     return len_grib;
 }
@@ -1476,6 +1843,7 @@ int read_grib(FILE *file, long pos, long len_grib, unsigned char *buffer) {
     }
 
     i = fread(buffer, sizeof (unsigned char), len_grib, file);
+    STATS_ADD(bytes_read, i);
     return (i == len_grib);
 }
 
@@ -1554,7 +1922,6 @@ extern const  struct ParmTable parm_table_ecmwf_200[256];
 extern const  struct ParmTable parm_table_ecmwf_210[256];
 extern const  struct ParmTable parm_table_ecmwf_211[256];
 extern const  struct ParmTable parm_table_ecmwf_228[256];
-extern struct ParmTable parm_table_user[256];
 extern const  struct ParmTable parm_table_dwd_002[256];
 extern const  struct ParmTable parm_table_dwd_201[256];
 extern const  struct ParmTable parm_table_dwd_202[256];
@@ -1563,8 +1930,6 @@ extern const  struct ParmTable parm_table_dwd_204[256];
 extern const  struct ParmTable parm_table_dwd_205[256];
 extern const  struct ParmTable parm_table_cptec_254[256];
 
-extern enum Def_NCEP_Table def_ncep_table;
-extern int cmc_eq_ncep;
 
 /*
  * returns pointer to the parameter table
@@ -1572,21 +1937,21 @@ extern int cmc_eq_ncep;
 
 
 
-static const struct ParmTable *Parm_Table(unsigned char *pds) {
+static const struct ParmTable *Parm_Table(struct wgrib_ctx *ctx, unsigned char *pds) {
 
     int i, center, subcenter, ptable, process;
-    static int missing_count = 0, reanal_opn_count = 0;
 
     center = PDS_Center(pds);
     subcenter = PDS_Subcenter(pds);
     ptable = PDS_Vsn(pds);
 
     /* CMC (54) tables look like NCEP tables */
-    if (center == CMC && cmc_eq_ncep) center = NMC;
+    if (center == CMC && ctx->cmc_eq_ncep) center = NMC;
+    ctx->parm_table_default = 0;
 
 #ifdef P_TABLE_FIRST
-    i = setup_user_table(center, subcenter, ptable);
-    if (i == 1) return &parm_table_user[0];
+    i = setup_user_table(ctx, center, subcenter, ptable);
+    if (i == 1) return &ctx->parm_table_user[0];
 #endif
     /* figure out if NCEP opn or reanalysis */
     if (center == NMC && ptable <= 3) {
@@ -1598,13 +1963,13 @@ static const struct ParmTable *Parm_Table(unsigned char *pds) {
             return &parm_table_ncep_opn[0];
 
 	/* at this point could be either the opn or reanalysis table */
-	if (def_ncep_table == opn_nowarn) return &parm_table_ncep_opn[0];
-	if (def_ncep_table == rean_nowarn) return &parm_table_ncep_reanal[0];
-        if (reanal_opn_count++ == 0) {
-	    fprintf(stderr, "Using NCEP %s table, see -ncep_opn, -ncep_rean options\n",
-               (def_ncep_table == opn) ?  "opn" : "reanalysis");
+	if (ctx->def_ncep_table == opn_nowarn) return &parm_table_ncep_opn[0];
+	if (ctx->def_ncep_table == rean_nowarn) return &parm_table_ncep_reanal[0];
+        if (ctx->reanal_opn_count++ == 0) {
+	    fprintf(ctx->err, "Using NCEP %s table, see -ncep_opn, -ncep_rean options\n",
+               (ctx->def_ncep_table == opn) ?  "opn" : "reanalysis");
 	}
-        return (def_ncep_table == opn) ?  &parm_table_ncep_opn[0] 
+        return (ctx->def_ncep_table == opn) ?  &parm_table_ncep_opn[0] 
 		: &parm_table_ncep_reanal[0];
     }
 
@@ -1656,34 +2021,46 @@ static const struct ParmTable *Parm_Table(unsigned char *pds) {
     }
 
 #ifndef P_TABLE_FIRST
-    i = setup_user_table(center, subcenter, ptable);
-    if (i == 1) return &parm_table_user[0];
+    i = setup_user_table(ctx, center, subcenter, ptable);
+    if (i == 1) return &ctx->parm_table_user[0];
 #endif
 
-    if ((ptable > 3 || (PDS_PARAM(pds)) > 127) && missing_count++ == 0) {
-	fprintf(stderr,
+    if ((ptable > 3 || (PDS_PARAM(pds)) > 127) && ctx->missing_count++ == 0) {
+	fprintf(ctx->err,
             "\nUndefined parameter table (center %d-%d table %d), using NCEP-opn\n",
             center, subcenter, ptable);
     }
+    ctx->parm_table_default = 1;
     return &parm_table_ncep_opn[0];
 }
 
+/*
+ * returns the 256 entry parameter table for the center, subcenter,
+ * table version and process of pds (the user table is overwritten
+ * by the next lookup with other keys)
+ */
+
+const struct ParmTable *param_table(struct wgrib_ctx *ctx, unsigned char *pds) {
+
+    return Parm_Table(ctx, pds);
+}
+
 /*
  * return name field of PDS_PARAM(pds)
  */
 
-char *k5toa(unsigned char *pds) {
+char *k5toa(struct wgrib_ctx *ctx, unsigned char *pds) {
 
-    return (Parm_Table(pds) + PDS_PARAM(pds))->name;
+    return (Parm_Table(ctx, pds) + PDS_PARAM(pds))->name;
 }
 
 /*
  * return comment field of the PDS_PARAM(pds)
  */
 
-char *k5_comments(unsigned char *pds) {
+char *k5_comments(struct wgrib_ctx *ctx, unsigned char *pds) {
 
-    return (Parm_Table(pds) + PDS_PARAM(pds))->comment;
+    return (Parm_Table(ctx, pds) + PDS_PARAM(pds))->comment;
 }
 
 /* 1996				wesley ebisuzaki
@@ -1711,21 +2088,148 @@ static unsigned int mask[] = {0,1,3,7,15,31,63,127,255};
 static unsigned int map_masks[8] = {128, 64, 32, 16, 8, 4, 2, 1};
 static double shift[9] = {1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0, 128.0, 256.0};
 
-void BDS_unpack(float *flt, unsigned char *bds, unsigned char *bitmap,
-	int n_bits, int n, double ref, double scale) {
+/*
+ * unpack kernels: flt[i] = ref + scale*j(i), i = 0..n-1
+ *
+ * j(i) is the i'th n_bits wide integer packed in bits[].  The common
+ * widths get their own loops that compilers can vectorize.  The result is
+ * bit-identical to the original single loop: j is exact in a double, except
+ * that the original code without a bitmap stored j in the float array before
+ * scaling it, so float_j rounds j to float (only matters for n_bits = 25).
+ */
+
+static void unpack_8(float *flt, unsigned char *bits, int n, double ref, double scale) {
+    int i;
+    for (i = 0; i < n; i++) {
+	flt[i] = ref + scale*bits[i];
+    }
+}
+
+static void unpack_12(float *flt, unsigned char *bits, int n, double ref, double scale) {
+    int i;
+    for (i = 0; i + 1 < n; i += 2, bits += 3) {
+	flt[i] = ref + scale*((bits[0] << 4) | (bits[1] >> 4));
+	flt[i+1] = ref + scale*(((bits[1] & 15) << 8) | bits[2]);
+    }
+    if (i < n) flt[i] = ref + scale*((bits[0] << 4) | (bits[1] >> 4));
+}
+
+static void unpack_16(float *flt, unsigned char *bits, int n, double ref, double scale) {
+    int i;
+    for (i = 0; i < n; i++) {
+	flt[i] = ref + scale*((bits[2*i] << 8) | bits[2*i+1]);
+    }
+}
+
+static void unpack_24(float *flt, unsigned char *bits, int n, double ref, double scale) {
+    int i;
+    for (i = 0; i < n; i++) {
+	flt[i] = ref + scale*((bits[3*i] << 16) | (bits[3*i+1] << 8) | bits[3*i+2]);
+    }
+}
+
+/* any n_bits <= 32, the first integer starting skip bits into bits[0] */
+static void unpack_bits(float *flt, unsigned char *bits, int n_bits, int n,
+	double ref, double scale, int float_j, int skip) {
+
+    int i, t_bits = 0;
+    unsigned long long tbits = 0, jmask, j;
+
+    jmask = (1ULL << n_bits) - 1;
+    if (skip && n > 0) {
+	tbits = *bits++ & (0xff >> skip);
+	t_bits = 8 - skip;
+    }
+    for (i = 0; i < n; i++) {
+	while (t_bits < n_bits) {
+	    tbits = (tbits << 8) | *bits++;
+	    t_bits += 8;
+	}
+	t_bits -= n_bits;
+	j = (tbits >> t_bits) & jmask;
+	flt[i] = float_j ? ref + scale*(float) j : ref + scale*j;
+    }
+}
+
+static void unpack_kernel(float *flt, unsigned char *bits, int n_bits, int n,
+	double ref, double scale, int float_j) {
+
+    switch (n_bits) {
+	case 8:  unpack_8(flt, bits, n, ref, scale); break;
+	case 12: unpack_12(flt, bits, n, ref, scale); break;
+	case 16: unpack_16(flt, bits, n, ref, scale); break;
+	case 24: unpack_24(flt, bits, n, ref, scale); break;
+	default: unpack_bits(flt, bits, n_bits, n, ref, scale, float_j, 0); break;
+    }
+}
+
+/* unpack_kernel of the integers starting at bit `bit` of bits[] */
+static void unpack_at(float *flt, unsigned char *bits, unsigned long long bit,
+	int n_bits, int n, double ref, double scale, int float_j) {
+
+    bits += bit >> 3;
+    if ((bit & 7) == 0) unpack_kernel(flt, bits, n_bits, n, ref, scale, float_j);
+    else unpack_bits(flt, bits, n_bits, n, ref, scale, float_j, (int) (bit & 7));
+}
+
+/*
+ * expand_bitmap: spread the n_defined values at flt[n-n_defined..n-1]
+ * over flt[0..n-1] following the bitmap, undefined points set to missing
+ *
+ * whole bitmap bytes of 0 or 255 are handled at once.  Reading is never
+ * behind writing so the expansion can be done in place.
+ */
+
+static void expand_bitmap(float *flt, unsigned char *bitmap, int n, int n_defined,
+	float missing) {
+
+    int i, k, bit;
+    float *src;
+    unsigned int bbits;
+
+    src = flt + (n - n_defined);
+    for (i = 0; i + 8 <= n; i += 8) {
+	bbits = *bitmap++;
+	if (bbits == 255) {
+	    for (k = 0; k < 8; k++) flt[i+k] = src[k];
+	    src += 8;
+	}
+	else if (bbits == 0) {
+	    for (k = 0; k < 8; k++) flt[i+k] = missing;
+	}
+	else {
+	    for (k = 0; k < 8; k++) {
+		flt[i+k] = (bbits & map_masks[k]) ? *src++ : missing;
+	    }
+	}
+    }
+    if (i < n) {
+	bbits = *bitmap;
+	for (bit = 0; i < n; i++, bit++) {
+	    flt[i] = (bbits & map_masks[bit]) ? *src++ : missing;
+	}
+    }
+}
+
+/*
+ * BDS_unpack_fill: BDS_unpack with undefined values set to missing
+ */
+
+static void BDS_unpack_fill(float *flt, unsigned char *bds, unsigned char *bitmap,
+	int n_bits, int n, double ref, double scale, float missing) {
 
     unsigned char *bits;
 
-    int i, mask_idx, t_bits, c_bits, j_bits;
-    unsigned int j, map_mask, tbits, jmask, bbits;
+    int n_defined, c_bits, j_bits;
+    unsigned int j, map_mask;
     double jj;
 
 
     if (BDS_ComplexPacking(bds)) {
 	fprintf(stderr,"*** Cannot decode complex packed fields n=%d***\n", n);
 	exit(8);
-	for (i = 0; i < n; i++) {
-	    *flt++ = UNDEFINED;
+	for (; n > 0; n--) {
+	    *flt++ = missing;
 	}
 	return;
     }
@@ -1740,51 +2244,15 @@ void BDS_unpack(float *flt, unsigned char *bds, unsigned char *bitmap,
         bits = bds + 11;  
     }
 
-    tbits = bbits = 0;
-
-    /* assume integer has 32+ bits */
-    if (n_bits <= 25) {
-        jmask = (1 << n_bits) - 1;
-        t_bits = 0;
-
-        if (bitmap) {
-	    for (i = 0; i < n; i++) {
-		/* check bitmap */
-		mask_idx = i & 7;
-		if (mask_idx == 0) bbits = *bitmap++;
-	        if ((bbits & map_masks[mask_idx]) == 0) {
-		    *flt++ = UNDEFINED;
-		    continue;
-	        }
-
-	        while (t_bits < n_bits) {
-	            tbits = (tbits * 256) + *bits++;
-	            t_bits += 8;
-	        }
-	        t_bits -= n_bits;
-	        j = (tbits >> t_bits) & jmask;
-	        *flt++ = ref + scale*j;
-            }
-        }
-        else {
-	    for (i = 0; i < n; i++) {
-		if (n_bits - t_bits > 8) {
-                    tbits = (tbits << 16) | (bits[0] << 8) | (bits[1]);
-		    bits += 2;
-                    t_bits += 16;
-		}
-                while (t_bits < n_bits) {
-                    tbits = (tbits * 256) + *bits++;
-                    t_bits += 8;
-                }
-                t_bits -= n_bits;
-                flt[i] = (tbits >> t_bits) & jmask;
-            }
-	    /* at least this vectorizes :) */
-	    for (i = 0; i < n; i++) {
-		flt[i] = ref + scale*flt[i];
-	    }
-        }
+    if (n_bits <= 32) {
+	if (bitmap) {
+	    n_defined = n - missing_points(bitmap, n);
+	    unpack_kernel(flt + (n - n_defined), bits, n_bits, n_defined, ref, scale, 0);
+	    expand_bitmap(flt, bitmap, n, n_defined, missing);
+	}
+	else {
+	    unpack_kernel(flt, bits, n_bits, n, ref, scale, n_bits == 25);
+	}
     }
     else {
 	/* older unoptimized code, not often used */
@@ -1798,7 +2266,7 @@ void BDS_unpack(float *flt, unsigned char *bds, unsigned char *bitmap,
 		    bitmap++;
 	        }
 	        if (j == 0) {
-		    *flt++ = UNDEFINED;
+		    *flt++ = missing;
 		    continue;
 	        }
 	    }
@@ -1827,6 +2295,12 @@ void BDS_unpack(float *flt, unsigned char *bds, unsigned char *bitmap,
     return;
 }
 
+void BDS_unpack(float *flt, unsigned char *bds, unsigned char *bitmap,
+	int n_bits, int n, double ref, double scale) {
+
+    BDS_unpack_fill(flt, bds, bitmap, n_bits, n, ref, scale, UNDEFINED);
+}
+
 /*
  * convert a float to an ieee single precision number v1.1
  * (big endian)
@@ -1905,12 +2379,51 @@ int flt2ieee(float x, unsigned char *ieee) {
  *     Bob Farquhar
  */
 
-#define BSIZ 1024*4
+#define BSIZ 1024*64
+
+/*
+ * flt2ieee of n floats.  With ieee floats on the host, normal numbers
+ * are copied bit for bit (frexp is exact for them, flt2ieee gives the
+ * same bytes); zeros, subnormals, inf and nan still go through flt2ieee.
+ */
+
+#if FLT_RADIX == 2 && FLT_MANT_DIG == 24 && FLT_MAX_EXP == 128 && FLT_MIN_EXP == -125
+#define IEEE_FLOAT 1
+#endif
+
+static void flt2ieee_n(float *array, int n, unsigned char *ieee) {
+	int i;
+#ifdef IEEE_FLOAT
+	unsigned int u, e;
+
+	if (sizeof(float) == 4 && sizeof(unsigned int) == 4) {
+	    for (i = 0; i < n; i++) {
+		memcpy(&u, array + i, 4);
+		e = (u >> 23) & 255;
+		if (e == 0 || e == 255) {
+		    flt2ieee(array[i], ieee);
+		}
+		else {
+		    ieee[0] = u >> 24;
+		    ieee[1] = (u >> 16) & 255;
+		    ieee[2] = (u >> 8) & 255;
+		    ieee[3] = u & 255;
+		}
+		ieee += 4;
+	    }
+	    return;
+	}
+#endif
+	for (i = 0; i < n; i++) {
+	    flt2ieee(array[i], ieee);
+	    ieee += 4;
+	}
+}
 
 int wrtieee(float *array, int n, int header, FILE *output) {
 
 	unsigned long int l;
-	int i, nbuf;
+	int i, nbuf, m;
 	unsigned char buff[BSIZ];
 	unsigned char h4[4];
 
@@ -1926,13 +2439,15 @@ int wrtieee(float *array, int n, int header, FILE *output) {
 		buff[nbuf++] = h4[1];
 		buff[nbuf++] = h4[0];
 	}
-	for (i = 0; i < n; i++) {
+	for (i = 0; i < n; i += m) {
 		if (nbuf >= BSIZ) {
 		    fwrite(buff, 1, BSIZ, output);
 		    nbuf = 0;
 		}
-		flt2ieee(array[i], buff + nbuf);
-		nbuf += 4;
+		m = (BSIZ - nbuf) / 4;
+		if (m > n - i) m = n - i;
+		flt2ieee_n(array + i, m, buff + nbuf);
+		nbuf += 4 * m;
 	}
 	if (header) {
 		if (nbuf == BSIZ) {
@@ -1971,7 +2486,7 @@ int wrtieee_header(unsigned int n, FILE *output) {
  *
  * levels.c
  *
- * prints out a simple description of kpds6, kpds7
+ * prints a simple description of kpds6, kpds7 to out
  *    (level/layer data)
  *  kpds6 = octet 10 of the PDS
  *  kpds7 = octet 11 and 12 of the PDS
@@ -1991,7 +2506,7 @@ int wrtieee_header(unsigned int n, FILE *output) {
  * v1.2.5 updated table 3/2007 to on388
  */
 
-void levels(int kpds6, int kpds7, int center, int verbose) {
+void levels(FILE *out, int kpds6, int kpds7, int center, int verbose) {
 
 	int o11, o12;
 
@@ -2002,178 +2517,178 @@ void levels(int kpds6, int kpds7, int center, int verbose) {
 
 	switch (kpds6) {
 
-	case 1: printf("sfc");
+	case 1: fprintf(out, "sfc");
 		break;
-	case 2: printf("cld base");
+	case 2: fprintf(out, "cld base");
 		break;
-	case 3: printf("cld top");
+	case 3: fprintf(out, "cld top");
 		break;
-	case 4: printf("0C isotherm");
+	case 4: fprintf(out, "0C isotherm");
 		break;
-	case 5: printf("cond lev");
+	case 5: fprintf(out, "cond lev");
 		break;
-	case 6: printf("max wind lev");
+	case 6: fprintf(out, "max wind lev");
 		break;
-	case 7: printf("tropopause");
+	case 7: fprintf(out, "tropopause");
 		break;
-	case 8: printf("nom. top");
+	case 8: fprintf(out, "nom. top");
 		break;
-	case 9: printf("sea bottom");
+	case 9: fprintf(out, "sea bottom");
 		break;
 	case 200:
-	case 10: printf("atmos col");
+	case 10: fprintf(out, "atmos col");
 		break;
 
 	case 12:
-	case 212: printf("low cld bot");
+	case 212: fprintf(out, "low cld bot");
 		break;
 	case 13:
-	case 213: printf("low cld top");
+	case 213: fprintf(out, "low cld top");
 		break;
 	case 14:
-	case 214: printf("low cld lay");
+	case 214: fprintf(out, "low cld lay");
 		break;
 	case 20: 
-		if (verbose == 2) printf("temp=%fK", kpds7/100.0);
-		else printf("T=%fK", kpds7/100.0);
+		if (verbose == 2) fprintf(out, "temp=%fK", kpds7/100.0);
+		else fprintf(out, "T=%fK", kpds7/100.0);
 		break;
 	case 22:
-	case 222: printf("mid cld bot");
+	case 222: fprintf(out, "mid cld bot");
 		break;
 	case 23:
-	case 223: printf("mid cld top");
+	case 223: fprintf(out, "mid cld top");
 		break;
 	case 24:
-	case 224: printf("mid cld lay");
+	case 224: fprintf(out, "mid cld lay");
 		break;
 	case 32:
-	case 232: printf("high cld bot");
+	case 232: fprintf(out, "high cld bot");
 		break;
 	case 33:
-	case 233: printf("high cld top");
+	case 233: fprintf(out, "high cld top");
 		break;
 	case 34:
-	case 234: printf("high cld lay");
+	case 234: fprintf(out, "high cld lay");
 		break;
 
-	case 201: printf("ocean column");
+	case 201: fprintf(out, "ocean column");
 		break;
-	case 204: printf("high trop freezing lvl");
+	case 204: fprintf(out, "high trop freezing lvl");
 		break;
-	case 206: printf("grid-scale cld bot");
+	case 206: fprintf(out, "grid-scale cld bot");
 		break;
-	case 207: printf("grid-scale cld top");
+	case 207: fprintf(out, "grid-scale cld top");
 		break;
-	case 209: printf("bndary-layer cld bot");
+	case 209: fprintf(out, "bndary-layer cld bot");
 		break;
 	case 210: 
-                if (center == NMC) printf("bndary-layer cld top");
-		else printf("%.2f mb",kpds7*0.01);
+                if (center == NMC) fprintf(out, "bndary-layer cld top");
+		else fprintf(out, "%.2f mb",kpds7*0.01);
 		break;
-	case 211: printf("bndary-layer cld layer");
+	case 211: fprintf(out, "bndary-layer cld layer");
 		break;
-	case 215: printf("cloud ceiling");
+	case 215: fprintf(out, "cloud ceiling");
 		break;
-	case 216: printf("Cb base");
+	case 216: fprintf(out, "Cb base");
 		break;
-	case 217: printf("Cb top");
+	case 217: fprintf(out, "Cb top");
 		break;
-	case 220: printf("planetary boundary layer (from Richardson no.)");
+	case 220: fprintf(out, "planetary boundary layer (from Richardson no.)");
 		break;
 	case 235: if (kpds7 % 10 == 0)
-		printf("%dC ocean isotherm level",kpds7/10);
-		else printf("%.1fC ocean isotherm level",kpds7/10.0);
+		fprintf(out, "%dC ocean isotherm level",kpds7/10);
+		else fprintf(out, "%.1fC ocean isotherm level",kpds7/10.0);
 		break;
-	case 236: printf("%d-%dm ocean layer",o11*10,o12*10);
+	case 236: fprintf(out, "%d-%dm ocean layer",o11*10,o12*10);
 		break;
-	case 237: printf("ocean mixed layer bot");
+	case 237: fprintf(out, "ocean mixed layer bot");
 		break;
-	case 238: printf("ocean isothermal layer bot");
+	case 238: fprintf(out, "ocean isothermal layer bot");
 		break;
-	case 239: printf("sfc-26C ocean layer");
+	case 239: fprintf(out, "sfc-26C ocean layer");
 		break;
-	case 240: printf("ocean mixed layer");
+	case 240: fprintf(out, "ocean mixed layer");
 		break;
-	case 241: printf("ordered sequence of data");
+	case 241: fprintf(out, "ordered sequence of data");
 		break;
-	case 242: printf("convect-cld bot");
+	case 242: fprintf(out, "convect-cld bot");
 		break;
-	case 243: printf("convect-cld top");
+	case 243: fprintf(out, "convect-cld top");
 		break;
-	case 244: printf("convect-cld layer");
+	case 244: fprintf(out, "convect-cld layer");
 		break;
-	case 245: printf("lowest level of wet bulb zero");
+	case 245: fprintf(out, "lowest level of wet bulb zero");
 		break;
-	case 246: printf("max e-pot-temp lvl");
+	case 246: fprintf(out, "max e-pot-temp lvl");
 		break;
-	case 247: printf("equilibrium lvl");
+	case 247: fprintf(out, "equilibrium lvl");
 		break;
-	case 248: printf("shallow convect-cld bot");
+	case 248: fprintf(out, "shallow convect-cld bot");
 		break;
-	case 249: printf("shallow convect-cld top");
+	case 249: fprintf(out, "shallow convect-cld top");
 		break;
-	case 251: printf("deep convect-cld bot");
+	case 251: fprintf(out, "deep convect-cld bot");
 		break;
-	case 252: printf("deep convect-cld top");
+	case 252: fprintf(out, "deep convect-cld top");
 		break;
-	case 253: printf("lowest bottom level of supercooled liequid water layer");
+	case 253: fprintf(out, "lowest bottom level of supercooled liequid water layer");
 		break;
-	case 254: printf("highest top level of supercooled liquid water layer");
+	case 254: fprintf(out, "highest top level of supercooled liquid water layer");
 		break;
-	case 100: printf("%d mb",kpds7);
+	case 100: fprintf(out, "%d mb",kpds7);
 	 	break;
-	case 101: printf("%d-%d mb",o11*10,o12*10);
+	case 101: fprintf(out, "%d-%d mb",o11*10,o12*10);
 	 	break;
-	case 102: printf("MSL");
+	case 102: fprintf(out, "MSL");
 	 	break;
-	case 103: printf("%d m above MSL",kpds7);
+	case 103: fprintf(out, "%d m above MSL",kpds7);
 	 	break;
-	case 104: printf("%d-%d m above msl",o11*100,o12*100);
+	case 104: fprintf(out, "%d-%d m above msl",o11*100,o12*100);
 	 	break;
-	case 105: printf("%d m above gnd",kpds7);
+	case 105: fprintf(out, "%d m above gnd",kpds7);
 	 	break;
-	case 106: printf("%d-%d m above gnd",o11*100,o12*100);
+	case 106: fprintf(out, "%d-%d m above gnd",o11*100,o12*100);
 	 	break;
-	case 107: printf("sigma=%.4f",kpds7/10000.0);
+	case 107: fprintf(out, "sigma=%.4f",kpds7/10000.0);
 	 	break;
-	case 108: printf("sigma %.2f-%.2f",o11/100.0,o12/100.0);
+	case 108: fprintf(out, "sigma %.2f-%.2f",o11/100.0,o12/100.0);
 	 	break;
-	case 109: printf("hybrid lev %d",kpds7);
+	case 109: fprintf(out, "hybrid lev %d",kpds7);
 	 	break;
-	case 110: printf("hybrid %d-%d",o11,o12);
+	case 110: fprintf(out, "hybrid %d-%d",o11,o12);
 	 	break;
-	case 111: printf("%d cm down",kpds7);
+	case 111: fprintf(out, "%d cm down",kpds7);
 	 	break;
-	case 112: printf("%d-%d cm down",o11,o12);
+	case 112: fprintf(out, "%d-%d cm down",o11,o12);
 	 	break;
 	case 113: 
-		if (verbose == 2) printf("pot-temp=%dK",kpds7);
-		else printf("%dK",kpds7);
+		if (verbose == 2) fprintf(out, "pot-temp=%dK",kpds7);
+		else fprintf(out, "%dK",kpds7);
 	 	break;
-	case 114: printf("%d-%dK",475-o11,475-o12);
+	case 114: fprintf(out, "%d-%dK",475-o11,475-o12);
 	 	break;
-	case 115: printf("%d mb above gnd",kpds7);
+	case 115: fprintf(out, "%d mb above gnd",kpds7);
 	 	break;
-	case 116: printf("%d-%d mb above gnd",o11,o12);
+	case 116: fprintf(out, "%d-%d mb above gnd",o11,o12);
 	 	break;
-	case 117: printf("%d pv units",INT2(o11,o12)); /* units are suspect */
+	case 117: fprintf(out, "%d pv units",INT2(o11,o12)); /* units are suspect */
 	 	break;
-	case 119: printf("%.5f (ETA level)",kpds7/10000.0);
+	case 119: fprintf(out, "%.5f (ETA level)",kpds7/10000.0);
 	 	break;
-	case 120: printf("%.2f-%.2f (ETA levels)",o11/100.0,o12/100.0);
+	case 120: fprintf(out, "%.2f-%.2f (ETA levels)",o11/100.0,o12/100.0);
 	 	break;
-	case 121: printf("%d-%d mb",1100-o11,1100-o12);
+	case 121: fprintf(out, "%d-%d mb",1100-o11,1100-o12);
 	 	break;
-	case 125: printf("%d cm above gnd",kpds7);
+	case 125: fprintf(out, "%d cm above gnd",kpds7);
 	 	break;
 	case 126: 
-		if (center == NMC) printf("%.2f mb",kpds7*0.01);
+		if (center == NMC) fprintf(out, "%.2f mb",kpds7*0.01);
 	 	break;
-	case 128: printf("%.3f-%.3f (sigma)",1.1-o11/1000.0, 1.1-o12/1000.0);
+	case 128: fprintf(out, "%.3f-%.3f (sigma)",1.1-o11/1000.0, 1.1-o12/1000.0);
 	 	break;
-	case 141: printf("%d-%d mb",o11*10,1100-o12);
+	case 141: fprintf(out, "%d-%d mb",o11*10,1100-o12);
 	 	break;
-	case 160: printf("%d m below sea level",kpds7);
+	case 160: fprintf(out, "%d m below sea level",kpds7);
 	 	break;
 	default:
 	 	break;
@@ -2225,7 +2740,7 @@ static char *units[] = {
         "??", "??", "??", "??", "??", "??", "??", "??", "??", "??",
         "??", " sec"}; 
 
-void PDStimes(int time_range, int p1, int p2, int time_unit) {
+void PDStimes(FILE *out, int time_range, int p1, int p2, int time_unit) {
 
 	char *unit;
 	enum {anal, fcst, unknown} type;
@@ -2310,12 +2825,12 @@ void PDStimes(int time_range, int p1, int p2, int time_unit) {
 
 	/* ----------------------------------------------- */
 
-	if (type == anal) printf("anl:");
-	else if (type == fcst) printf("%d%s fcst:",fcst_len,unit);
+	if (type == anal) fprintf(out, "anl:");
+	else if (type == fcst) fprintf(out, "%d%s fcst:",fcst_len,unit);
 
 
 	if (time_range == 123 || time_range == 124) {
-		if (p1 != 0) printf("start@%d%s:",p1,unit);
+		if (p1 != 0) fprintf(out, "start@%d%s:",p1,unit);
 	}
 
 
@@ -2328,100 +2843,100 @@ void PDStimes(int time_range, int p1, int p2, int time_unit) {
 	case 1:
 	case 10:
 		break;
-	case 2: printf("valid %d-%d%s:",p1,p2,unit);
+	case 2: fprintf(out, "valid %d-%d%s:",p1,p2,unit);
 		break;
-	case 3: printf("%d-%d%s ave:",p1,p2,unit);
+	case 3: fprintf(out, "%d-%d%s ave:",p1,p2,unit);
 		break;
-	case 4: printf("%d-%d%s acc:",p1,p2,unit);
+	case 4: fprintf(out, "%d-%d%s acc:",p1,p2,unit);
 		break;
-	case 5: printf("%d-%d%s diff:",p1,p2,unit);
+	case 5: fprintf(out, "%d-%d%s diff:",p1,p2,unit);
 		break;
-        case 6: printf("-%d to -%d %s ave:", p1,p2,unit);
+        case 6: fprintf(out, "-%d to -%d %s ave:", p1,p2,unit);
                 break;
-        case 7: printf("-%d to %d %s ave:", p1,p2,unit);
+        case 7: fprintf(out, "-%d to %d %s ave:", p1,p2,unit);
                 break;
 	case 11: if (p1 > 0) {
-		    printf("init fcst %d%s:",p1,unit);
+		    fprintf(out, "init fcst %d%s:",p1,unit);
 		}
 		else {
-	            printf("time?:");
+	            fprintf(out, "time?:");
 		}
 		break;
-	case 13: printf("nudge ana %d%s:",p1,unit);
+	case 13: fprintf(out, "nudge ana %d%s:",p1,unit);
 		break;
-	case 14: printf("rel. fcst %d%s:",p1,unit);
+	case 14: fprintf(out, "rel. fcst %d%s:",p1,unit);
 		break;
 	case 51: if (p1 == 0) {
-		    /* printf("clim %d%s:",p2,unit); */
-		    printf("0-%d%s product:ave@1yr:",p2,unit);
+		    /* fprintf(out, "clim %d%s:",p2,unit); */
+		    fprintf(out, "0-%d%s product:ave@1yr:",p2,unit);
 		}
 		else if (p1 == 1) {
-		    /* printf("clim (diurnal) %d%s:",p2,unit); */
-		    printf("0-%d%s product:same-hour,ave@1yr:",p2,unit);
+		    /* fprintf(out, "clim (diurnal) %d%s:",p2,unit); */
+		    fprintf(out, "0-%d%s product:same-hour,ave@1yr:",p2,unit);
 		}
 		else {
-		    printf("clim? p1=%d? %d%s?:",p1,p2,unit);
+		    fprintf(out, "clim? p1=%d? %d%s?:",p1,p2,unit);
 		}
 		break;
 	case 113:
 	case 123:
-		printf("ave@%d%s:",p2,unit);
+		fprintf(out, "ave@%d%s:",p2,unit);
 		break;
 	case 114:
 	case 124:
-		printf("acc@%d%s:",p2,unit);
+		fprintf(out, "acc@%d%s:",p2,unit);
 		break;
 	case 115:
-		printf("ave of fcst:%d to %d%s:",p1,p2,unit);
+		fprintf(out, "ave of fcst:%d to %d%s:",p1,p2,unit);
 		break;
 	case 116:
-		printf("acc of fcst:%d to %d%s:",p1,p2,unit);
+		fprintf(out, "acc of fcst:%d to %d%s:",p1,p2,unit);
 		break;
 	case 118: 
-		printf("var@%d%s:",p2,unit);
+		fprintf(out, "var@%d%s:",p2,unit);
 		break;
 	case 128:
-		printf("%d-%d%s fcst acc:ave@24hr:", p1, p2, unit);
+		fprintf(out, "%d-%d%s fcst acc:ave@24hr:", p1, p2, unit);
 		break;
 	case 129:
-		printf("%d-%d%s fcst acc:ave@%d%s:", p1, p2, unit, p2-p1,unit);
+		fprintf(out, "%d-%d%s fcst acc:ave@%d%s:", p1, p2, unit, p2-p1,unit);
 		break;
 	case 130:
-		printf("%d-%d%s fcst ave:ave@24hr:", p1, p2, unit);
+		fprintf(out, "%d-%d%s fcst ave:ave@24hr:", p1, p2, unit);
 		break;
 	case 131:
-		printf("%d-%d%s fcst ave:ave@%d%s:", p1, p2, unit,p2-p1,unit);
+		fprintf(out, "%d-%d%s fcst ave:ave@%d%s:", p1, p2, unit,p2-p1,unit);
 		break;
 		/* for CFS */
 	case 132:
-		printf("%d-%d%s anl:ave@1yr:", p1, p2, unit);
+		fprintf(out, "%d-%d%s anl:ave@1yr:", p1, p2, unit);
 		break;
 	case 133:
-		printf("%d-%d%s fcst:ave@1yr:", p1, p2, unit);
+		fprintf(out, "%d-%d%s fcst:ave@1yr:", p1, p2, unit);
 		break;
 	case 134:
-		printf("%d-%d%s fcst-anl:rms@1yr:", p1, p2, unit);
+		fprintf(out, "%d-%d%s fcst-anl:rms@1yr:", p1, p2, unit);
 		break;
 	case 135:
-		printf("%d-%d%s fcst-fcst_mean:rms@1yr:", p1, p2, unit);
+		fprintf(out, "%d-%d%s fcst-fcst_mean:rms@1yr:", p1, p2, unit);
 		break;
 	case 136:
-		printf("%d-%d%s anl-anl_mean:rms@1yr:", p1, p2, unit);
+		fprintf(out, "%d-%d%s anl-anl_mean:rms@1yr:", p1, p2, unit);
 		break;
 	case 137:
-		printf("%d-%d%s fcst acc:ave@6hr:", p1, p2, unit);
+		fprintf(out, "%d-%d%s fcst acc:ave@6hr:", p1, p2, unit);
 		break;
 	case 138:
-		printf("%d-%d%s fcst ave:ave@6hr:", p1, p2, unit);
+		fprintf(out, "%d-%d%s fcst ave:ave@6hr:", p1, p2, unit);
 		break;
 	case 139:
-		printf("%d-%d%s fcst acc:ave@12hr:", p1, p2, unit);
+		fprintf(out, "%d-%d%s fcst acc:ave@12hr:", p1, p2, unit);
 		break;
 	case 140:
-		printf("%d-%d%s fcst ave:ave@12hr:", p1, p2, unit);
+		fprintf(out, "%d-%d%s fcst ave:ave@12hr:", p1, p2, unit);
 		break;
 		
-	default: printf("time?:");
+	default: fprintf(out, "time?:");
 	}
 }
 
@@ -10792,7 +11307,7 @@ const struct ParmTable parm_table_mdl_nceptab[256] = {
  * prefix and suffix are only printed if EC_ext has text
  */
 
-void EC_ext(unsigned char *pds, char *prefix, char *suffix, int verbose) {
+void EC_ext(FILE *out, unsigned char *pds, char *prefix, char *suffix, int verbose) {
 
     int local_id, ec_type, ec_class, ec_stream;
     char string[200];
@@ -10805,7 +11320,7 @@ void EC_ext(unsigned char *pds, char *prefix, char *suffix, int verbose) {
     ec_type = PDS_EcType(pds);
     ec_stream = PDS_EcStream(pds);
 
-    if (verbose == 2) printf("%sECext=%d%s", prefix, local_id, suffix);
+    if (verbose == 2) fprintf(out, "%sECext=%d%s", prefix, local_id, suffix);
 
     if (verbose == 2) {
 	switch(ec_class) {
@@ -10819,7 +11334,7 @@ void EC_ext(unsigned char *pds, char *prefix, char *suffix, int verbose) {
 	    case 8: strcpy(string, "ELDAS"); break;
 	     default: sprintf(string, "%d", ec_class); break;
 	}
-        printf("%sclass=%s%s",prefix,string,suffix);
+        fprintf(out, "%sclass=%s%s",prefix,string,suffix);
     }
     /*
      10/03/2000: R.Rudsar : subroutine changed.
@@ -10853,7 +11368,7 @@ void EC_ext(unsigned char *pds, char *prefix, char *suffix, int verbose) {
             case 80: strcpy(string, "Fcst seasonal mean"); break;
             default: sprintf(string, "%d", ec_type); break;
         }
-        printf("%stype=%s%s",prefix,string,suffix);
+        fprintf(out, "%stype=%s%s",prefix,string,suffix);
 /*    }  */
     if (verbose == 2) {
         switch(ec_stream) {
@@ -10865,22 +11380,22 @@ void EC_ext(unsigned char *pds, char *prefix, char *suffix, int verbose) {
 	    case 1091: strcpy(string, "EC seasonal fcst mon means"); break;
 	    default:   sprintf(string, "%d", ec_stream); break;
         }
-        printf("%sstream=%s%s",prefix,string,suffix);
+        fprintf(out, "%sstream=%s%s",prefix,string,suffix);
     }
     if (verbose == 2) {
-        printf("%sVersion=%c%c%c%c%s", prefix, *(PDS_Ec16Version(pds)), *(PDS_Ec16Version(pds)+1),
+        fprintf(out, "%sVersion=%c%c%c%c%s", prefix, *(PDS_Ec16Version(pds)), *(PDS_Ec16Version(pds)+1),
 		*(PDS_Ec16Version(pds)+2), *(PDS_Ec16Version(pds)+3), suffix);
         if (local_id == 16) {
-	    printf("%sSysVersion=%d%s", prefix, PDS_Ec16SysNum(pds), suffix);
-	    printf("%sAvgPeriod=%d%s", prefix, PDS_Ec16AvePeriod(pds), suffix);
-	    printf("%sFcstMon=%d%s", prefix, PDS_Ec16FcstMon(pds), suffix);
+	    fprintf(out, "%sSysVersion=%d%s", prefix, PDS_Ec16SysNum(pds), suffix);
+	    fprintf(out, "%sAvgPeriod=%d%s", prefix, PDS_Ec16AvePeriod(pds), suffix);
+	    fprintf(out, "%sFcstMon=%d%s", prefix, PDS_Ec16FcstMon(pds), suffix);
 
         }
     }
 
         if (local_id == 16) {
-	    printf("%sEnsem_mem=%d%s", prefix, PDS_Ec16Number(pds), suffix);
-	    printf("%sVerfDate=%d%s", prefix, PDS_Ec16VerfMon(pds), suffix);
+	    fprintf(out, "%sEnsem_mem=%d%s", prefix, PDS_Ec16Number(pds), suffix);
+	    fprintf(out, "%sVerfDate=%d%s", prefix, PDS_Ec16VerfMon(pds), suffix);
         }
 
 }
@@ -10893,9 +11408,7 @@ void EC_ext(unsigned char *pds, char *prefix, char *suffix, int verbose) {
  * 7/25/03 wind fix Dusan Jovic
  * 9/17/03 fix scan mode
  */
-extern int ec_large_grib, len_ec_bds;
-
-int GDS_grid(unsigned char *gds, unsigned char *bds, int *nx, int *ny, 
+int GDS_grid(struct wgrib_ctx *ctx, unsigned char *gds, unsigned char *bds, int *nx, int *ny, 
              long int *nxny) {
 
     int i, d, ix, iy, pl;
@@ -10929,7 +11442,7 @@ int GDS_grid(unsigned char *gds, unsigned char *bds, int *nx, int *ny,
     }
     if (GDS_Harmonic(gds)) {
 	if (BDS_ComplexPacking(bds)) {
-	    *nx = BDS_NValues(bds);
+	    *nx = BDS_NValues(ctx, bds);
 	    *ny = -1;
 	}
 	else {
@@ -10937,7 +11450,7 @@ int GDS_grid(unsigned char *gds, unsigned char *bds, int *nx, int *ny,
             *nx = *nxny = (8*(BDS_LEN(bds)-15)-BDS_UnusedBits(bds))/
 		BDS_NumBits(bds)+1;
             if ((8*(BDS_LEN(bds)-15)-BDS_UnusedBits(bds)) % BDS_NumBits(bds)) {
-	       fprintf(stderr,"inconsistent harmonic BDS\n");
+	       fprintf(ctx->err,"inconsistent harmonic BDS\n");
             }
             *ny = 1;
 	}
@@ -10946,7 +11459,7 @@ int GDS_grid(unsigned char *gds, unsigned char *bds, int *nx, int *ny,
 }
 
 #define NCOL 15
-void GDS_prt_thin_lon(unsigned char *gds) {
+void GDS_prt_thin_lon(FILE *out, unsigned char *gds) {
     int iy, i, col, pl;
 
     iy = GDS_LatLon_ny(gds);
@@ -10958,15 +11471,15 @@ void GDS_prt_thin_lon(unsigned char *gds) {
 	return;
     }
     for (col = i = 0; i < iy; i++) {
-	if (col == 0) printf("   ");
-	printf("%5d", (gds[pl+i*2] << 8) + gds[pl+i*2+1]);
+	if (col == 0) fprintf(out, "   ");
+	fprintf(out, "%5d", (gds[pl+i*2] << 8) + gds[pl+i*2+1]);
 	col++;
 	if (col == NCOL) {
 	    col = 0;
-	    printf("\n");
+	    fprintf(out, "\n");
 	}
     }
-    if (col != 0) printf("\n");
+    if (col != 0) fprintf(out, "\n");
 }
 
 /*
@@ -10987,7 +11500,7 @@ static char *scan_mode[8] = {
 	"SN:EW" };
 
 
-void GDS_winds(unsigned char *gds, int verbose) {
+void GDS_winds(FILE *out, unsigned char *gds, int verbose) {
     int scan = -1, mode = -1;
 
     if (gds != NULL) {
@@ -11036,17 +11549,17 @@ void GDS_winds(unsigned char *gds, int verbose) {
     }
     if (verbose == 1) {
 	if (mode != -1) {
-	    if (mode & 8) printf("winds in grid direction:");
-	    else printf("winds are N/S:"); 
+	    if (mode & 8) fprintf(out, "winds in grid direction:");
+	    else fprintf(out, "winds are N/S:"); 
 	}
     }
     else if (verbose == 2) {
 	if (scan != -1) {
-	    printf(" scan: %s", scan_mode[(scan >> 5) & 7]);
+	    fprintf(out, " scan: %s", scan_mode[(scan >> 5) & 7]);
         }
 	if (mode != -1) {
-	    if (mode & 8) printf(" winds(grid) ");
-	    else printf(" winds(N/S) "); 
+	    if (mode & 8) fprintf(out, " winds(grid) ");
+	    else fprintf(out, " winds(N/S) "); 
 	}
     }
 }
@@ -11055,10 +11568,43 @@ void GDS_winds(unsigned char *gds, int verbose) {
 
 #define START -1
 
-static int user_center = 0, user_subcenter = 0, user_ptable = 0;
-static enum {filled, not_found, not_checked, no_file, init} status = init;
+enum user_table_status {filled, not_found, not_checked, no_file, init};
+
+/*
+ * wgrib_ctx_init: default state, as at the start of GRIB_MAIN
+ * wgrib_ctx_free: release the user parameter table and record buffer
+ *   (ctx->input belongs to the caller)
+ */
 
-struct ParmTable parm_table_user[256];
+void wgrib_ctx_init(struct wgrib_ctx *ctx) {
+
+    memset(ctx, 0, sizeof(struct wgrib_ctx));
+    ctx->out = stdout;
+    ctx->err = stderr;
+    ctx->def_ncep_table = DEF_T62_NCEP_TABLE;
+    ctx->user_status = init;
+}
+
+void wgrib_ctx_free(struct wgrib_ctx *ctx) {
+
+    int i;
+
+    if (ctx->parm_table_user != NULL) {
+	for (i = 0; i < 256; i++) {
+	    free(ctx->parm_table_user[i].name);
+	    free(ctx->parm_table_user[i].comment);
+	}
+	free(ctx->parm_table_user);
+	ctx->parm_table_user = NULL;
+    }
+    if (ctx->gribtab != NULL) {
+	fclose(ctx->gribtab);
+	ctx->gribtab = NULL;
+    }
+    ctx->user_status = init;
+    free(ctx->buffer);
+    ctx->buffer = NULL;
+}
 
 /*
  * sets up user parameter table
@@ -11066,33 +11612,35 @@ struct ParmTable parm_table_user[256];
  * v1.2  3/2007 w. ebisuzaki add FAST_GRIBTAB option
  */
 
-int setup_user_table(int center, int subcenter, int ptable) {
+int setup_user_table(struct wgrib_ctx *ctx, int center, int subcenter, int ptable) {
 
     int i, j, c0, c1, c2;
-    static FILE *input;
-    static int file_open = 0;
+    FILE *input;
     char *filename, line[300];
 
-    if (status == init) {
-	for (i = 0; i < 256; i++) {
-	    parm_table_user[i].name = parm_table_user[i].comment = NULL;
+    if (ctx->user_status == init) {
+	ctx->parm_table_user = (struct ParmTable *)
+	    calloc(256, sizeof(struct ParmTable));
+	if (ctx->parm_table_user == NULL) {
+	    ctx->user_status = no_file;
+	    return 0;
 	}
-	status = not_checked;
+	ctx->user_status = not_checked;
     }
 
-    if (status == no_file) return 0;
+    if (ctx->user_status == no_file) return 0;
 
-    if ((user_center == -1 || center == user_center) &&
-	    (user_subcenter == -1 || subcenter == user_subcenter) &&
-	    (user_ptable == -1 || ptable == user_ptable)) {
+    if ((ctx->user_center == -1 || center == ctx->user_center) &&
+	    (ctx->user_subcenter == -1 || subcenter == ctx->user_subcenter) &&
+	    (ctx->user_ptable == -1 || ptable == ctx->user_ptable)) {
 
-	if (status == filled) return 1;
-	if (status == not_found) return 0;
+	if (ctx->user_status == filled) { ctx->table_reuses++; return 1; }
+	if (ctx->user_status == not_found) { ctx->table_reuses++; return 0; }
     }
 
     /* open gribtab file if not open */
 
-    if (!file_open) {
+    if (ctx->gribtab == NULL) {
 #ifdef FAST_GRIBTAB
         filename = getenv("GRIBTAB");
 #else
@@ -11101,45 +11649,47 @@ int setup_user_table(int center, int subcenter, int ptable) {
         if (filename == NULL) filename = "gribtab";
 #endif
         if (filename == NULL || (input = fopen(filename,"r")) == NULL) {
-            status = no_file;
+            ctx->user_status = no_file;
             return 0;
         }
-	file_open = 1;
+	ctx->gribtab = input;
     }
     else {
+	input = ctx->gribtab;
 	rewind(input);
     }
 
-    user_center = center;
-    user_subcenter = subcenter;
-    user_ptable = ptable;
+    ctx->user_center = center;
+    ctx->user_subcenter = subcenter;
+    ctx->user_ptable = ptable;
+    ctx->table_loads++;
 
     /* scan for center & subcenter and ptable */
     for (;;) {
         if (fgets(line, 299, input) == NULL) {
-	    status = not_found;
+	    ctx->user_status = not_found;
             return 0;
         }
 	if (atoi(line) != START) continue;
 	i = sscanf(line,"%d:%d:%d:%d", &j, &center, &subcenter, &ptable);
         if (i != 4) {
-	    fprintf(stderr,"illegal gribtab center/subcenter/ptable line: %s\n", line);
+	    fprintf(ctx->err,"illegal gribtab center/subcenter/ptable line: %s\n", line);
             continue;
         }
-	if ((center == -1 || center == user_center) &&
-	    (subcenter == -1 || subcenter == user_subcenter) &&
-	    (ptable == -1 || ptable == user_ptable)) break;
+	if ((center == -1 || center == ctx->user_center) &&
+	    (subcenter == -1 || subcenter == ctx->user_subcenter) &&
+	    (ptable == -1 || ptable == ctx->user_ptable)) break;
     }
 
-    user_center = center;
-    user_subcenter = subcenter;
-    user_ptable = ptable;
+    ctx->user_center = center;
+    ctx->user_subcenter = subcenter;
+    ctx->user_ptable = ptable;
 
     /* free any used memory */
     for (i = 0; i < 256; i++) {
-        if (parm_table_user[i].name != NULL) free(parm_table_user[i].name);
-        if (parm_table_user[i].comment != NULL) free(parm_table_user[i].comment);
-	parm_table_user[i].name = parm_table_user[i].comment = NULL;
+        if (ctx->parm_table_user[i].name != NULL) free(ctx->parm_table_user[i].name);
+        if (ctx->parm_table_user[i].comment != NULL) free(ctx->parm_table_user[i].comment);
+	ctx->parm_table_user[i].name = ctx->parm_table_user[i].comment = NULL;
     }
 
     /* read definitions */
@@ -11158,28 +11708,28 @@ int setup_user_table(int center, int subcenter, int ptable) {
 	c2 = strlen(line);
         if (line[c2-1] == '\n') line[--c2] = '\0';
         if (c2 <= c1) {
-	    fprintf(stderr,"illegal gribtab line:%s\n", line);
+	    fprintf(ctx->err,"illegal gribtab line:%s\n", line);
 	    continue;
 	}
 	line[c0] = 0;
 	line[c1] = 0;
 
-	parm_table_user[i].name = (char *) malloc(c1 - c0);
-	parm_table_user[i].comment = (char *) malloc(c2 - c1);
-	strcpy(parm_table_user[i].name, line+c0+1);
-	strcpy(parm_table_user[i].comment, line+c1+1);
+	ctx->parm_table_user[i].name = (char *) malloc(c1 - c0);
+	ctx->parm_table_user[i].comment = (char *) malloc(c2 - c1);
+	strcpy(ctx->parm_table_user[i].name, line+c0+1);
+	strcpy(ctx->parm_table_user[i].comment, line+c1+1);
     }
 
     /* now to fill in undefined blanks */
     for (i = 0; i < 255; i++) {
-	if (parm_table_user[i].name == NULL) {
-	    parm_table_user[i].name = (char *) malloc(7);
-	    sprintf(parm_table_user[i].name, "var%d", i);
-	    parm_table_user[i].comment = (char *) malloc(strlen("undefined")+1);
-	    strcpy(parm_table_user[i].comment, "undefined");
+	if (ctx->parm_table_user[i].name == NULL) {
+	    ctx->parm_table_user[i].name = (char *) malloc(7);
+	    sprintf(ctx->parm_table_user[i].name, "var%d", i);
+	    ctx->parm_table_user[i].comment = (char *) malloc(strlen("undefined")+1);
+	    strcpy(ctx->parm_table_user[i].comment, "undefined");
         }
     }
-    status = filled;
+    ctx->user_status = filled;
     return 1;
 }
 
@@ -11203,10 +11753,7 @@ int setup_user_table(int center, int subcenter, int ptable) {
  * v1.2.3  Jan 31 + 1 month => Feb 31 .. change to Feb 28/29
  */
 
-static int msg_count = 0;
-extern int minute;
-
-int PDS_date(unsigned char *pds, int option, int v_time) {
+int PDS_date(struct wgrib_ctx *ctx, unsigned char *pds, int option, int v_time) {
 
     int year, month, day, hour, min;
 
@@ -11217,23 +11764,23 @@ int PDS_date(unsigned char *pds, int option, int v_time) {
         hour = PDS_Hour(pds);
     }
     else {
-        if (verf_time(pds, &year, &month, &day, &hour) != 0) {
-	    if (msg_count++ < 5) fprintf(stderr, "PDS_date: problem\n");
+        if (verf_time(ctx, pds, &year, &month, &day, &hour) != 0) {
+	    if (ctx->msg_count++ < 5) fprintf(ctx->err, "PDS_date: problem\n");
 	}
     }
     min =  PDS_Minute(pds);
 
     switch(option) {
 	case 0:
-	    printf("%2.2d%2.2d%2.2d%2.2d", year % 100, month, day, hour);
-	    if (minute) printf("-%2.2d", min);
+	    fprintf(ctx->out, "%2.2d%2.2d%2.2d%2.2d", year % 100, month, day, hour);
+	    if (ctx->minute) fprintf(ctx->out, "-%2.2d", min);
 	    break;
 	case 1:
-	    printf("%4.4d%2.2d%2.2d%2.2d", year, month, day, hour);
-	    if (minute) printf("-%2.2d", min);
+	    fprintf(ctx->out, "%4.4d%2.2d%2.2d%2.2d", year, month, day, hour);
+	    if (ctx->minute) fprintf(ctx->out, "-%2.2d", min);
 	    break;
 	default:
-	    fprintf(stderr,"missing code\n");
+	    fprintf(ctx->err,"missing code\n");
 	    exit(8);
     }
     return 0;
@@ -11250,7 +11797,8 @@ static int leap(int year) {
 }
 
 
-int add_time(int *year, int *month, int *day, int *hour, int dtime, int unit) {
+int add_time(struct wgrib_ctx *ctx, int *year, int *month, int *day, int *hour,
+	int dtime, int unit) {
     int y, m, d, h, jday, i, days_in_month;
 
     y = *year;
@@ -11364,7 +11912,7 @@ int add_time(int *year, int *month, int *day, int *hour, int dtime, int unit) {
 	*day = d;
 	return 0;
    }
-   fprintf(stderr,"add_time: undefined time unit %d\n", unit);
+   fprintf(ctx->err,"add_time: undefined time unit %d\n", unit);
    return 1;
 }
 
@@ -11377,7 +11925,8 @@ int add_time(int *year, int *month, int *day, int *hour, int dtime, int unit) {
  *
  */
 
-int verf_time(unsigned char *pds, int *year, int *month, int *day, int *hour) {
+int verf_time(struct wgrib_ctx *ctx, unsigned char *pds, int *year, int *month,
+	int *day, int *hour) {
     int tr, dtime, unit;
 
     *year = PDS_Year4(pds);
@@ -11397,7 +11946,7 @@ int verf_time(unsigned char *pds, int *year, int *month, int *day, int *hour) {
 
     if (dtime == 0) return 0;
 
-    return add_time(year, month, day, hour, dtime, unit);
+    return add_time(ctx, year, month, day, hour, dtime, unit);
 }
 
 
@@ -11421,9 +11970,7 @@ int verf_time(unsigned char *pds, int *year, int *month, int *day, int *hour) {
  * updated 8/06 w. ebisuzaki
  */
 
-extern int ncep_ens;
-
-void ensemble(unsigned char *pds, int mode) {
+void ensemble(struct wgrib_ctx *ctx, unsigned char *pds, int mode) {
 
     int pdslen;
     unsigned char ctmp;
@@ -11432,16 +11979,16 @@ void ensemble(unsigned char *pds, int mode) {
     pdslen = PDS_LEN(pds);
     char_end = mode == 2 ? ' ' : ':';
 
-    if ((PDS_Center(pds) == NMC || ncep_ens) && pdslen >= 45 && pds[40] == 1) {
+    if ((PDS_Center(pds) == NMC || ctx->ncep_ens) && pdslen >= 45 && pds[40] == 1) {
 
 	/* control run */
 
 	if (pds[41] == 1) {
 	    if (mode != 2) {
-		printf("ens%c0:%c", pds[42] == 1 ? '+' : '-', char_end);
+		fprintf(ctx->out, "ens%c0:%c", pds[42] == 1 ? '+' : '-', char_end);
 	    }
 	    else {
-		printf("%s-res_ens_control ", pds[42] == 1 ? "hi" : "low");
+		fprintf(ctx->out, "%s-res_ens_control ", pds[42] == 1 ? "hi" : "low");
 	    }
 	}
 
@@ -11449,10 +11996,10 @@ void ensemble(unsigned char *pds, int mode) {
 
 	else if (pds[41] == 2 || pds[41] == 3) {
 	    if (mode != 2) {
-	        printf("ens%c%d%c", pds[41] == 3 ? '+' : '-', pds[42],char_end);
+	        fprintf(ctx->out, "ens%c%d%c", pds[41] == 3 ? '+' : '-', pds[42],char_end);
 	    }
 	    else {
-		printf("ens_perturbation=%c%d ",pds[41] == 3 ? '+' : '-', 
+		fprintf(ctx->out, "ens_perturbation=%c%d ",pds[41] == 3 ? '+' : '-', 
 		    pds[42]);
 	    }
 	}
@@ -11460,38 +12007,38 @@ void ensemble(unsigned char *pds, int mode) {
 	/* cluster mean */
 
 	else if (pds[41] == 4) {
-	    if (mode != 2) printf("cluster%c", char_end);
-	    else printf("cluster(%d members) ",pds[60]);
+	    if (mode != 2) fprintf(ctx->out, "cluster%c", char_end);
+	    else fprintf(ctx->out, "cluster(%d members) ",pds[60]);
 	}
 
 
 	/* ensemble mean */
 
 	else if (pds[41] == 5) {
-	    if (mode != 2) printf("ensemble%c", char_end);
-	    else printf("ensemble(%d members) ",pds[60]);
+	    if (mode != 2) fprintf(ctx->out, "ensemble%c", char_end);
+	    else fprintf(ctx->out, "ensemble(%d members) ",pds[60]);
 	}
 
 	/* other case .. debug code */
 
 	else {
-		printf("ens %d/%d/%d/%d%c", pds[41],pds[42],pds[43],pds[44],char_end);
+		fprintf(ctx->out, "ens %d/%d/%d/%d%c", pds[41],pds[42],pds[43],pds[44],char_end);
 	}
 
 
 	if (pdslen >= 44) {
-	    if (pds[43] == 1 && pds[41] >= 4) printf("mean%c", char_end);
-	    else if (pds[43] == 2) printf("weighted mean%c",char_end);
-	    else if (pds[43] == 3) printf("no bias%c",char_end);
-	    else if (pds[43] == 4) printf("weighted mean no bias%c",char_end);
-	    else if (pds[43] == 5) printf("weight%c",char_end);
-	    else if (pds[43] == 6) printf("climate percentile%c",char_end);
-	    else if (pds[43] == 7) printf("daily climate mean%c",char_end);
-	    else if (pds[43] == 8) printf("daily climate std dev%c",char_end);
-	    else if (pds[43] == 11) printf("std dev%c",char_end);
-	    else if (pds[43] == 12) printf("norm std dev%c",char_end);
-	    else if (pds[43] == 21) printf("max val%c",char_end);
-	    else if (pds[43] == 22) printf("min val%c",char_end);
+	    if (pds[43] == 1 && pds[41] >= 4) fprintf(ctx->out, "mean%c", char_end);
+	    else if (pds[43] == 2) fprintf(ctx->out, "weighted mean%c",char_end);
+	    else if (pds[43] == 3) fprintf(ctx->out, "no bias%c",char_end);
+	    else if (pds[43] == 4) fprintf(ctx->out, "weighted mean no bias%c",char_end);
+	    else if (pds[43] == 5) fprintf(ctx->out, "weight%c",char_end);
+	    else if (pds[43] == 6) fprintf(ctx->out, "climate percentile%c",char_end);
+	    else if (pds[43] == 7) fprintf(ctx->out, "daily climate mean%c",char_end);
+	    else if (pds[43] == 8) fprintf(ctx->out, "daily climate std dev%c",char_end);
+	    else if (pds[43] == 11) fprintf(ctx->out, "std dev%c",char_end);
+	    else if (pds[43] == 12) fprintf(ctx->out, "norm std dev%c",char_end);
+	    else if (pds[43] == 21) fprintf(ctx->out, "max val%c",char_end);
+	    else if (pds[43] == 22) fprintf(ctx->out, "min val%c",char_end);
 	}
 
 	/* NCEP probability limits */
@@ -11500,13 +12047,13 @@ void ensemble(unsigned char *pds, int mode) {
 	    ctmp = PDS_PARAM(pds);
 	    PDS_PARAM(pds) = pds[45];
 	    if (pds[46] == 1 && pdslen >= 51) {
-		printf("prob(%s<%f)%c", k5toa(pds), ibm2flt(pds+47),char_end);
+		fprintf(ctx->out, "prob(%s<%f)%c", k5toa(ctx, pds), ibm2flt(pds+47),char_end);
 	    }
 	    else if (pds[46] == 2 && pdslen >= 54) {
-		printf("prob(%s>%f)%c", k5toa(pds), ibm2flt(pds+51), char_end);
+		fprintf(ctx->out, "prob(%s>%f)%c", k5toa(ctx, pds), ibm2flt(pds+51), char_end);
 	    }
 	    else if (pds[46] == 3 && pdslen >= 54) {
-		printf("prob(%f<%s<%f)%c", ibm2flt(pds+47), k5toa(pds), 
+		fprintf(ctx->out, "prob(%f<%s<%f)%c", ibm2flt(pds+47), k5toa(ctx, pds), 
 			ibm2flt(pds+51), char_end);
 	    }
             PDS_PARAM(pds) = ctmp;
@@ -13374,10 +13921,7 @@ const struct ParmTable parm_table_cptec_254[256] = {
  *  does not handle matrix values
  */
 
-extern int ec_large_grib,  len_ec_bds;
-
-
-int BDS_NValues(unsigned char *bds) {
+int BDS_NValues(struct wgrib_ctx *ctx, unsigned char *bds) {
 
     /* returns number of grid points as determined from the BDS */
 
@@ -13392,3 +13936,659 @@ int BDS_NValues(unsigned char *bds) {
     }
     return i;
 }
+
+/*
+ * echack_mem: echack for a grib message held in memory
+ *
+ * msg[avail] = bytes from the start of the grib message to end of buffer
+ * sets ctx->ec_large_grib and ctx->len_ec_bds like echack
+ */
+
+static long echack_mem(struct wgrib_ctx *ctx, unsigned char *msg, long avail, long len_grib) {
+
+    unsigned char *pds, *sec;
+    unsigned int pdslen, gdslen, bmslen, bdslen;
+
+    if (avail < 8 + LEN_HEADER_PDS) return 0;
+    pds = msg + 8;
+    pdslen = PDS_LEN(pds);
+
+    /* know that NCEP and CMC do not use echack */
+    if (PDS_Center(pds) == NMC || PDS_Center(pds) == CMC) {
+	ctx->ec_large_grib = 0;
+        return len_grib;
+    }
+
+    gdslen = 0;
+    if (PDS_HAS_GDS(pds)) {
+	if (avail < 8 + pdslen + 3) return 0;
+	sec = pds + pdslen;
+	gdslen = __LEN24(sec);
+    }
+    bmslen = 0;
+    if (PDS_HAS_BMS(pds)) {
+	if (avail < 8 + pdslen + gdslen + 3) return 0;
+	sec = pds + pdslen + gdslen;
+	bmslen = __LEN24(sec);
+    }
+    if (avail < 8 + pdslen + gdslen + bmslen + 3) return 0;
+    sec = pds + pdslen + gdslen + bmslen;
+    bdslen = __LEN24(sec);
+
+    if (bdslen >= 120) {
+	/* normal record */
+	ctx->ec_large_grib = 0;
+	return len_grib;
+    }
+    /* ECMWF hack */
+    len_grib = (len_grib & 0x7fffff) * 120 - bdslen + 4;
+    ctx->len_ec_bds = len_grib - (12 + pdslen + gdslen + bmslen);
+    ctx->ec_large_grib = 1;
+    return len_grib;
+}
+
+/*
+ * seek_grib_mem: seek_grib for a grib file held in memory (i.e. mmap'ed)
+ *
+ * buffer[size] = contents of the file
+ * pos = initial position to start looking at (= 0 for 1st call)
+ *       returns with position of next grib header (units=bytes)
+ * len_grib = length of the grib record (bytes)
+ *
+ * returns pointer to start of grib message, NULL if not found
+ * unlike seek_grib, grib2 messages are skipped silently
+ */
+
+static unsigned char *seek_grib_mem(struct wgrib_ctx *ctx, unsigned char *buffer,
+	size_t size, unsigned long *pos, long *len_grib) {
+
+    unsigned char *p, *end;
+    long length_grib;
+    long long t0;
+
+    *len_grib = 0;
+    if (size < LEN_HEADER_PDS || *pos > size - LEN_HEADER_PDS) return NULL;
+    p = buffer + *pos;
+    end = buffer + size - LEN_HEADER_PDS;
+
+    while (p < end && (p = memchr(p, 'G', end - p)) != NULL) {
+	if (p[1] == 'R' && p[2] == 'I' && p[3] == 'B' && p[7] == 1) {
+	    *pos = p - buffer;
+	    length_grib = (p[4] << 16) + (p[5] << 8) + p[6];
+
+	    /* small records don't have ECMWF hack */
+	    if ((length_grib & 0x800000) == 0) {
+		ctx->ec_large_grib = 0;
+		*len_grib = length_grib;
+	    }
+	    else {
+		ctx->ec_large_grib = 1;
+		t0 = STATS_CLOCK();
+		*len_grib = echack_mem(ctx, p, (long) (buffer + size - p), length_grib);
+		stats_phase(WGRIB_ECHACK, t0, NULL);
+	    }
+	    return p;
+	}
+	p++;
+    }
+    return NULL;
+}
+
+/*
+ * scan_grib_mem: scan_grib_file for a grib file held in memory
+ *
+ * input: buffer[size], contents of the file (i.e. mmap'ed)
+ * output: *records, malloc'ed array of record information (caller frees)
+ *
+ * returns number of records, -1 if out of memory, -2 if a record is bad
+ * no data is copied
+ */
+
+long scan_grib_mem(struct wgrib_ctx *ctx, unsigned char *buffer, size_t size,
+	struct grib_record **records) {
+
+    unsigned char *msg;
+    struct grib_record *tmp;
+    long int len_grib, n = 0, n_alloc = 0;
+    long unsigned pos = 0;
+    long long t0;
+
+    *records = NULL;
+    for (;;) {
+	t0 = STATS_CLOCK();
+	msg = seek_grib_mem(ctx, buffer, size, &pos, &len_grib);
+	stats_phase(WGRIB_SEEK, t0, NULL);
+	if (msg == NULL) break;
+	if (len_grib <= 0 || len_grib > (long) (size - pos)) goto bad_record;
+
+	if (n == n_alloc) {
+	    n_alloc = n_alloc ? 2 * n_alloc : 256;
+	    tmp = (struct grib_record *) realloc((void *) *records,
+		n_alloc * sizeof(struct grib_record));
+	    if (tmp == NULL) {
+		free(*records);
+		*records = NULL;
+		return -1;
+	    }
+	    *records = tmp;
+	}
+	t0 = STATS_CLOCK();
+	if (grib_record_info(ctx, msg, len_grib, pos, *records + n) != 0) goto bad_record;
+	stats_phase(WGRIB_SCAN, t0, NULL);
+	STATS_ADD(records_scanned, 1);
+	n++;
+        pos += len_grib;
+    }
+    return n;
+
+bad_record:
+    free(*records);
+    *records = NULL;
+    return -2;
+}
+
+/*
+ * grib_message_length: length of the grib message starting at msg[size]
+ *
+ * returns length (ECMWF large record hack resolved), -1 if msg is not
+ * the start of a complete grib edition 1 message
+ */
+
+static long grib_message_length(struct wgrib_ctx *ctx, unsigned char *msg, size_t size) {
+
+    long len_grib;
+
+    if (size < LEN_HEADER_PDS || msg[0] != 'G' || msg[1] != 'R' || msg[2] != 'I'
+	    || msg[3] != 'B' || msg[7] != 1) return -1;
+
+    len_grib = (msg[4] << 16) + (msg[5] << 8) + msg[6];
+    if ((len_grib & 0x800000) == 0) ctx->ec_large_grib = 0;
+    else {
+	ctx->ec_large_grib = 1;
+	len_grib = echack_mem(ctx, msg, (long) size, len_grib);
+    }
+    if (len_grib <= 0 || (size_t) len_grib > size) return -1;
+    return len_grib;
+}
+
+/*
+ * grib_header_length: length of the grib message starting at msg, told
+ * from its first avail bytes (the sections up to the BDS length for the
+ * ECMWF large record hack), for reading messages from a stream
+ *
+ * returns length, 0 if more bytes are needed, -1 if msg is not the start
+ * of a grib edition 1 message
+ */
+
+long grib_header_length(struct wgrib_ctx *ctx, unsigned char *msg, size_t avail) {
+
+    long len_grib;
+
+    if (avail < 8) return 0;
+    if (msg[0] != 'G' || msg[1] != 'R' || msg[2] != 'I' || msg[3] != 'B'
+	    || msg[7] != 1) return -1;
+
+    len_grib = (msg[4] << 16) + (msg[5] << 8) + msg[6];
+    if ((len_grib & 0x800000) == 0) {
+	ctx->ec_large_grib = 0;
+	return len_grib;
+    }
+    return echack_mem(ctx, msg, (long) avail, len_grib);
+}
+
+/*
+ * grib_message_info: grib_record for the message starting at msg[size]
+ *
+ * info->offset is 0, returns 0 if ok, 1 if the message is bad
+ */
+
+int grib_message_info(struct wgrib_ctx *ctx, unsigned char *msg, size_t size,
+	struct grib_record *info) {
+
+    long len_grib;
+    long long t0;
+    int status;
+
+    if ((len_grib = grib_message_length(ctx, msg, size)) < 0) return 1;
+    t0 = STATS_CLOCK();
+    status = grib_record_info(ctx, msg, len_grib, 0, info);
+    stats_phase(WGRIB_SCAN, t0, NULL);
+    return status;
+}
+
+/*
+ * grib_unpack_setup: find the BDS_unpack arguments for the message at msg[size]
+ *
+ * returns 0 if ok, 1 if the message is bad, 2 if the packing is not supported
+ * (complex packing, which makes BDS_unpack exit)
+ */
+
+int grib_unpack_setup(struct wgrib_ctx *ctx, unsigned char *msg, size_t size,
+	struct grib_unpack *u) {
+
+    unsigned char *pds, *gds, *bms, *bds;
+    long len_grib;
+    int nx, ny;
+    double temp;
+
+    if ((len_grib = grib_message_length(ctx, msg, size)) < 0) return 1;
+    if (grib_sections(ctx, msg, len_grib, &pds, &gds, &bms, &bds)) return 1;
+    if (BDS_ComplexPacking(bds)) return 2;
+
+    temp = int_power(10.0, - PDS_DecimalScale(pds));
+    u->bds = bds;
+    u->bitmap = BMS_bitmap(bms);
+    u->n_bits = BDS_NumBits(bds);
+    u->nxny = grib_nxny(ctx, gds, bms, bds, &nx, &ny);
+    u->ref = temp * BDS_RefValue(bds);
+    u->scale = temp * int_power(2.0, BDS_BinScale(bds));
+    return 0;
+}
+
+/*
+ * threaded unpacking: the points are split in parts starting at multiples
+ * of 8, so every part starts at a byte of the bitmap.  Without a bitmap the
+ * packed integer of point p starts at bit p*n_bits (p-1 for spectral
+ * fields, after the global mean); with one at d*n_bits, d being the number
+ * of defined points before the part (prefix sums of the bitmap popcounts).
+ * Each part is unpacked and expanded over the bitmap as BDS_unpack_fill
+ * does the whole field, so the output is bit-identical.
+ */
+
+int wgrib_unpack_threads = 1;
+long wgrib_unpack_min_points = 1L << 20;
+
+struct unpack_part {
+    struct grib_unpack *u;
+    float *flt, missing;
+    long p0, n;			/* points */
+    unsigned long long defined;	/* defined points before p0 */
+};
+
+static void unpack_part(struct unpack_part *t) {
+
+    struct grib_unpack *u = t->u;
+    unsigned char *bits, *map;
+    float *flt = t->flt + t->p0;
+    long nd;
+
+    if (BDS_Harmonic(u->bds)) {
+	bits = u->bds + 15;
+	if (t->p0 == 0) {
+	    flt[0] = BDS_Harmonic_RefValue(u->bds);
+	    unpack_at(flt + 1, bits, 0, u->n_bits, (int) t->n - 1, u->ref, u->scale,
+		u->n_bits == 25);
+	}
+	else {
+	    unpack_at(flt, bits, (unsigned long long) (t->p0 - 1) * u->n_bits,
+		u->n_bits, (int) t->n, u->ref, u->scale, u->n_bits == 25);
+	}
+    }
+    else if (u->bitmap) {
+	map = u->bitmap + (t->p0 >> 3);
+	nd = t->n - missing_points(map, (int) t->n);
+	unpack_at(flt + (t->n - nd), u->bds + 11, t->defined * u->n_bits, u->n_bits,
+	    (int) nd, u->ref, u->scale, 0);
+	expand_bitmap(flt, map, (int) t->n, (int) nd, t->missing);
+    }
+    else {
+	unpack_at(flt, u->bds + 11, (unsigned long long) t->p0 * u->n_bits,
+	    u->n_bits, (int) t->n, u->ref, u->scale, u->n_bits == 25);
+    }
+}
+
+#ifdef _WIN32
+static DWORD WINAPI unpack_thread(LPVOID arg) {
+    unpack_part((struct unpack_part *) arg);
+    return 0;
+}
+#else
+static void *unpack_thread(void *arg) {
+    unpack_part((struct unpack_part *) arg);
+    return NULL;
+}
+#endif
+
+/* returns 0 if the field was unpacked, 1 if it needs the serial code */
+static int unpack_threaded(struct grib_unpack *u, float *flt, float missing,
+	int n_threads) {
+
+    struct unpack_part parts[WGRIB_MAX_THREADS];
+#ifdef _WIN32
+    HANDLE threads[WGRIB_MAX_THREADS];
+#else
+    pthread_t threads[WGRIB_MAX_THREADS];
+#endif
+    int started[WGRIB_MAX_THREADS];
+    unsigned long long defined;
+    long size, p0;
+    int i, n;
+
+    if (u->n_bits > 32 || (BDS_Harmonic(u->bds) && u->bitmap)) return 1;
+    if (n_threads > WGRIB_MAX_THREADS) n_threads = WGRIB_MAX_THREADS;
+    size = ((u->nxny + n_threads - 1) / n_threads + 7) & ~7L;
+
+    defined = 0;
+    for (n = 0, p0 = 0; p0 < u->nxny; n++, p0 += size) {
+	parts[n].u = u;
+	parts[n].flt = flt;
+	parts[n].missing = missing;
+	parts[n].p0 = p0;
+	parts[n].n = u->nxny - p0 < size ? u->nxny - p0 : size;
+	parts[n].defined = defined;
+	if (u->bitmap) defined += parts[n].n -
+	    missing_points(u->bitmap + (p0 >> 3), (int) parts[n].n);
+    }
+
+    /* part 0 on this thread, a part whose thread cannot start too */
+    for (i = 1; i < n; i++) {
+#ifdef _WIN32
+	threads[i] = CreateThread(NULL, 0, unpack_thread, parts + i, 0, NULL);
+	started[i] = threads[i] != NULL;
+#else
+	started[i] = pthread_create(threads + i, NULL, unpack_thread, parts + i) == 0;
+#endif
+	if (!started[i]) unpack_part(parts + i);
+    }
+    if (n > 0) unpack_part(parts);
+    for (i = 1; i < n; i++) {
+	if (!started[i]) continue;
+#ifdef _WIN32
+	WaitForSingleObject(threads[i], INFINITE);
+	CloseHandle(threads[i]);
+#else
+	pthread_join(threads[i], NULL);
+#endif
+    }
+    return 0;
+}
+
+/*
+ * grib_unpack: BDS_unpack for grib_unpack_setup, undefined values set to missing
+ */
+
+void grib_unpack(struct grib_unpack *u, float *flt, float missing) {
+
+    long long t0;
+    int n_threads = wgrib_unpack_threads;
+
+    t0 = STATS_CLOCK();
+    if (n_threads <= 1 || u->nxny < wgrib_unpack_min_points ||
+	    unpack_threaded(u, flt, missing, n_threads))
+	BDS_unpack_fill(flt, u->bds, u->bitmap, u->n_bits, u->nxny, u->ref, u->scale,
+	    missing);
+    stats_phase(WGRIB_UNPACK, t0, NULL);
+    STATS_ADD(fields, 1);
+    STATS_ADD(values, u->nxny);
+}
+
+/*
+ * grib_unpack_window: unpack only the points (j0 + sj*k) * nx + i0 + si*l,
+ * k = 0..nj-1, l = 0..ni-1, of a grid stored in rows of nx points, into
+ * flt[nj*ni], bit-identical to grib_unpack
+ *
+ * without a bitmap the packed integer of point p starts at bit p*n_bits.
+ * With a bitmap it starts at bit c*n_bits, c being the number of defined
+ * points before p, which is counted once while walking the bitmap forward
+ * (the points are visited in increasing order).
+ *
+ * returns 0 if ok, 1 if the window is outside the grid, 2 if the packing
+ * needs grib_unpack (spectral or n_bits > 32)
+ */
+
+static int bit_count(unsigned int b) {
+    b = b - ((b >> 1) & 0x55);
+    b = (b & 0x33) + ((b >> 2) & 0x33);
+    return (b + (b >> 4)) & 0x0f;
+}
+
+int grib_unpack_window(struct grib_unpack *u, long nx, long j0, long nj, long sj,
+	long i0, long ni, long si, float *flt, float missing) {
+
+    unsigned char *bits, *bitmap;
+    unsigned long long jmask, j, bit;
+    long k, l, p, byte, n_bytes, count, cursor;
+    int n_bits, shift, float_j, b;
+    long long t0;
+
+    n_bits = u->n_bits;
+    if (BDS_Harmonic(u->bds) || n_bits > 32) return 2;
+    if (nj <= 0 || ni <= 0) return 0;
+    if (j0 < 0 || i0 < 0 || sj <= 0 || si <= 0 || i0 + (ni - 1) * si >= nx ||
+	    (j0 + (nj - 1) * sj) * nx + nx > u->nxny) return 1;
+
+    bits = u->bds + 11;
+    bitmap = u->bitmap;
+    jmask = (1ULL << n_bits) - 1;
+    float_j = bitmap == NULL && n_bits == 25;
+    count = cursor = 0;
+    t0 = STATS_CLOCK();
+
+    for (k = 0; k < nj; k++) {
+	for (l = 0; l < ni; l++) {
+	    p = (j0 + k * sj) * nx + i0 + l * si;
+	    if (bitmap) {
+		byte = p >> 3;
+		while (cursor < byte) count += bit_count(bitmap[cursor++]);
+		b = bitmap[byte];
+		if ((b & map_masks[p & 7]) == 0) {
+		    *flt++ = missing;
+		    continue;
+		}
+		/* defined points before p */
+		bit = (unsigned long long) (count + bit_count(b & ~(0xff >> (p & 7)) & 0xff));
+	    }
+	    else {
+		bit = (unsigned long long) p;
+	    }
+	    bit *= n_bits;
+	    byte = (long) (bit >> 3);
+	    shift = (int) (bit & 7);
+	    n_bytes = (shift + n_bits + 7) >> 3;
+	    j = 0;
+	    while (n_bytes-- > 0) j = (j << 8) | bits[byte++];
+	    j = (j >> ((8 - (shift + n_bits) % 8) % 8)) & jmask;
+	    *flt++ = float_j ? u->ref + u->scale*(float) j : u->ref + u->scale*j;
+	}
+    }
+    stats_phase(WGRIB_UNPACK, t0, NULL);
+    STATS_ADD(fields, 1);
+    STATS_ADD(values, nj * ni);
+    return 0;
+}
+
+/*
+ * grib_unpack_reduce: grib_unpack folded into the accumulators of r
+ *
+ * the field is unpacked REDUCE_BLOCK points at a time into a block that
+ * stays in the L1 cache and each block is folded into r before the next
+ * one is unpacked, so the field is never stored.  Values are those of
+ * grib_unpack (bit-identical, converted to double), points missing from
+ * the bitmap are skipped.  Blocks start at multiples of 8 points, at a
+ * byte of the bitmap; the packed integers of a block start at bit
+ * d*n_bits, d being the number of defined points before the block.
+ * Over the values of a record the block mean and m2 are computed in two
+ * passes and merged (Chan et al.), per grid point by Welford's update.
+ *
+ * returns 0 if ok, 2 if the packing is not supported (spectral with a
+ * bitmap), 3 if out of memory
+ */
+
+#define REDUCE_BLOCK 2048
+
+/* numpy.histogram bin of x, -1 if outside the edges */
+static int reduce_bin(double *edges, int n_edges, double x) {
+    int lo = 0, hi = n_edges - 1, mid;
+
+    if (!(x >= edges[0] && x <= edges[hi])) return -1;
+    if (x == edges[hi]) return hi - 1;
+    while (hi - lo > 1) {
+	mid = (lo + hi) / 2;
+	if (x >= edges[mid]) lo = mid;
+	else hi = mid;
+    }
+    return lo;
+}
+
+/*
+ * fold the points p0..p0+n-1 into r, flt[] holding the nd defined ones
+ * (all n if bitmap is NULL, else those set in bitmap[], the byte of p0)
+ */
+static void reduce_block(struct grib_reduce *r, float *flt, long nd, long p0,
+	long n, unsigned char *bitmap) {
+
+    long k, p;
+    long long c;
+    int b, nb;
+    double x, lo, hi, sum, mean, m2, d;
+
+    nb = r->n_edges - 1;
+    if (!r->per_point) {
+	if (nd == 0) return;
+	lo = hi = flt[0];
+	sum = 0.0;
+	for (k = 0; k < nd; k++) {
+	    x = flt[k];
+	    if (x < lo) lo = x;
+	    if (x > hi) hi = x;
+	    sum += x;
+	}
+	if (r->min && lo < *r->min) *r->min = lo;
+	if (r->max && hi > *r->max) *r->max = hi;
+	if (r->mean) {
+	    c = *r->count + nd;
+	    mean = sum / nd;
+	    d = mean - *r->mean;
+	    *r->mean += d * nd / c;
+	    if (r->m2) {
+		m2 = 0.0;
+		for (k = 0; k < nd; k++) {
+		    x = flt[k] - mean;
+		    m2 += x * x;
+		}
+		*r->m2 += m2 + d * d * ((double) *r->count * nd / c);
+	    }
+	}
+	if (r->hist) {
+	    for (k = 0; k < nd; k++) {
+		if ((b = reduce_bin(r->edges, r->n_edges, flt[k])) >= 0) r->hist[b]++;
+	    }
+	}
+	*r->count += nd;
+	return;
+    }
+
+    for (k = 0; k < n; k++) {
+	if (bitmap && (bitmap[k >> 3] & map_masks[k & 7]) == 0) continue;
+	x = *flt++;
+	p = p0 + k;
+	c = ++r->count[p];
+	if (r->min && x < r->min[p]) r->min[p] = x;
+	if (r->max && x > r->max[p]) r->max[p] = x;
+	if (r->mean) {
+	    d = x - r->mean[p];
+	    r->mean[p] += d / c;
+	    if (r->m2) r->m2[p] += d * (x - r->mean[p]);
+	}
+	if (r->hist && (b = reduce_bin(r->edges, r->n_edges, x)) >= 0)
+	    r->hist[p * nb + b]++;
+    }
+}
+
+int grib_unpack_reduce(struct grib_unpack *u, struct grib_reduce *r) {
+
+    float block[REDUCE_BLOCK], *full;
+    unsigned char *bits, *bitmap, *map;
+    unsigned long long defined;
+    long p0, m, nd, k;
+    int n_bits, harmonic, float_j;
+    long long t0;
+
+    n_bits = u->n_bits;
+    bitmap = u->bitmap;
+    harmonic = BDS_Harmonic(u->bds) != 0;
+    if (harmonic && bitmap) return 2;
+    t0 = STATS_CLOCK();
+
+    if (n_bits > 32) {
+	/* older unpacking code, whole field */
+	if ((full = (float *) malloc(sizeof(float) * (u->nxny > 0 ? u->nxny : 1))) == NULL)
+	    return 3;
+	BDS_unpack_fill(full, u->bds, bitmap, n_bits, u->nxny, u->ref, u->scale, 0.0);
+	for (p0 = 0; p0 < u->nxny; p0 += m) {
+	    m = u->nxny - p0 < REDUCE_BLOCK ? u->nxny - p0 : REDUCE_BLOCK;
+	    if (bitmap) {
+		map = bitmap + (p0 >> 3);
+		for (nd = k = 0; k < m; k++) {
+		    if (map[k >> 3] & map_masks[k & 7]) block[nd++] = full[p0 + k];
+		}
+		reduce_block(r, block, nd, p0, m, map);
+	    }
+	    else {
+		reduce_block(r, full + p0, m, p0, m, NULL);
+	    }
+	}
+	free(full);
+    }
+    else {
+	bits = u->bds + (harmonic ? 15 : 11);
+	float_j = bitmap == NULL && n_bits == 25;
+	defined = 0;
+	for (p0 = 0; p0 < u->nxny; p0 += m) {
+	    m = u->nxny - p0 < REDUCE_BLOCK ? u->nxny - p0 : REDUCE_BLOCK;
+	    if (bitmap) {
+		map = bitmap + (p0 >> 3);
+		nd = m - missing_points(map, (int) m);
+		unpack_at(block, bits, defined * n_bits, n_bits, (int) nd, u->ref,
+		    u->scale, 0);
+		reduce_block(r, block, nd, p0, m, map);
+		defined += nd;
+	    }
+	    else if (harmonic && p0 == 0) {
+		/* global mean, then the packed coefficients */
+		block[0] = BDS_Harmonic_RefValue(u->bds);
+		unpack_at(block + 1, bits, 0, n_bits, (int) m - 1, u->ref, u->scale,
+		    float_j);
+		reduce_block(r, block, m, p0, m, NULL);
+	    }
+	    else {
+		unpack_at(block, bits, (unsigned long long) (p0 - harmonic) * n_bits,
+		    n_bits, (int) m, u->ref, u->scale, float_j);
+		reduce_block(r, block, m, p0, m, NULL);
+	    }
+	}
+    }
+    stats_phase(WGRIB_UNPACK, t0, NULL);
+    STATS_ADD(fields, 1);
+    STATS_ADD(values, u->nxny);
+    return 0;
+}
+
+/*
+ * grib_latlon_grid: grid of the message at msg[size] from its GDS
+ * (GDS_LatLon_* macros), corners in millidegrees
+ *
+ * returns 0 if ok, 1 if the message is bad or not on a lat/lon grid
+ */
+
+int grib_latlon_grid(struct wgrib_ctx *ctx, unsigned char *msg, size_t size,
+	struct grib_latlon *g) {
+
+    unsigned char *pds, *gds, *bms, *bds;
+    long len_grib;
+
+    if ((len_grib = grib_message_length(ctx, msg, size)) < 0) return 1;
+    if (grib_sections(ctx, msg, len_grib, &pds, &gds, &bms, &bds)) return 1;
+    if (gds == NULL || !GDS_LatLon(gds)) return 1;
+
+    g->nx = GDS_LatLon_nx(gds);
+    g->ny = GDS_LatLon_ny(gds);
+    g->la1 = GDS_LatLon_La1(gds);
+    g->lo1 = GDS_LatLon_Lo1(gds);
+    g->la2 = GDS_LatLon_La2(gds);
+    g->lo2 = GDS_LatLon_Lo2(gds);
+    g->dx = GDS_LatLon_dx(gds);
+    g->dy = GDS_LatLon_dy(gds);
+    g->scan = GDS_LatLon_scan(gds);
+    return 0;
+}
@@ -0,0 +1,176 @@
+/*
+ * wgrib.h
+ *
+ * in-process interface to wgrib.c used by the python extension (pywgrib.c)
+ * nothing declared here prints to stdout/stderr, output goes to the
+ * streams given in the call or in struct wgrib_ctx
+ */
+
+#ifndef WGRIB_H
+#define WGRIB_H
+
+#include <stdio.h>
+
+struct ParmTable {
+	/* char *name, *comment; */
+	char *name, *comment;
+};
+
+/*
+ * state that wgrib keeps between calls: options, the ECMWF large record
+ * hack of the current message, warning counters and the user parameter
+ * table.  Every entry point takes one, so threads with their own context
+ * do not share any mutable state.
+ */
+struct wgrib_ctx {
+    FILE *out, *err;			/* instead of stdout, stderr */
+    int ec_large_grib, len_ec_bds;	/* ECMWF large record hack in effect */
+    int minute, ncep_ens, cmc_eq_ncep;	/* -min, -ncep_ens, -cmc */
+    int def_ncep_table;			/* enum Def_NCEP_Table, -ncep_opn/-ncep_rean */
+    int warn_grib2, missing_count, reanal_opn_count, msg_count;
+    FILE *gribtab;			/* user parameter table (setup_user_table) */
+    int user_center, user_subcenter, user_ptable, user_status;
+    struct ParmTable *parm_table_user;
+    int parm_table_default;		/* last lookup fell back to NCEP opn */
+    /* kept between runs of wgrib_run */
+    FILE *input;			/* grib file, NULL to open argv's */
+    unsigned char *buffer;		/* record buffer */
+    long buffer_size;
+    long n_runs, buffer_allocs, buffer_reuses, table_loads, table_reuses;
+};
+
+/*
+ * one row of the inventory returned by scan_grib_file
+ * layout must match RECORD_DTYPE in wgrib/inventory.py
+ */
+struct grib_record {
+    long long offset;		/* byte position of "GRIB" */
+    long long length;		/* length of grib message (bytes) */
+    long long date;		/* initial time as YYYYMMDDHH */
+    int kpds5, kpds6, kpds7;
+    int time_range, p1, p2, time_unit;
+    int center, subcenter, process, table, grid;
+    int nx, ny, nxny;
+    int n_bits, has_bitmap, minute;
+    int gds_offset, bms_offset;	/* from start of message, 0 if none */
+    int bds_offset, bds_length;
+    int member;			/* ensemble member, 0 for control or none */
+};
+
+/*
+ * arguments to BDS_unpack for one record, filled by grib_unpack_setup
+ */
+struct grib_unpack {
+    unsigned char *bds, *bitmap;
+    int n_bits;
+    long nxny;
+    double ref, scale;
+};
+
+/*
+ * accumulators of grib_unpack_reduce, the arrays hold one element (over
+ * the values of a record) or one per grid point (over records); unwanted
+ * statistics are NULL.  mean and m2 (sum of squared deviations from the
+ * mean) are updated together, hist[point * (n_edges - 1) + bin] counts
+ * values in [edges[bin], edges[bin + 1]) (the last bin is closed).
+ */
+struct grib_reduce {
+    int per_point;
+    long long *count;		/* defined values, required */
+    double *min, *max;		/* start at +/-HUGE_VAL */
+    double *mean, *m2;		/* start at 0, m2 needs mean */
+    long long *hist;
+    double *edges;
+    int n_edges;
+};
+
+/*
+ * regular lat/lon grid (GDS data representation type 0), millidegrees
+ */
+struct grib_latlon {
+    int nx, ny;
+    int la1, lo1, la2, lo2, dx, dy;
+    int scan;
+};
+
+/*
+ * instrumentation: cumulative counters of all threads, kept only while
+ * wgrib_stats_enabled is set (otherwise every probe is a single test).
+ * seek includes echack; scan is the structured inventory (grib_record),
+ * inventory the text one
+ */
+enum wgrib_phase {
+    WGRIB_SEEK, WGRIB_ECHACK, WGRIB_READ, WGRIB_SCAN, WGRIB_INVENTORY,
+    WGRIB_UNPACK, WGRIB_WRITE, WGRIB_NPHASES
+};
+
+struct wgrib_stats {
+    long long ns[WGRIB_NPHASES];	/* time spent in each phase */
+    long long calls[WGRIB_NPHASES];
+    long long bytes_read, bytes_written;
+    long long records, records_scanned;	/* by wgrib_run, by the scanners */
+    long long fields, values;		/* unpacked */
+    long long buffer_reallocs;		/* record buffer grown */
+};
+
+/* one record of wgrib_run, given to wgrib_record_hook */
+struct wgrib_trace {
+    long count;
+    unsigned long pos;
+    long len_grib;
+    long long ns[WGRIB_NPHASES];	/* this record only */
+};
+
+/* wgrib_stats_enabled and wgrib_record_hook are set while other threads
+ * run: read and write them only through these */
+#ifdef __GNUC__
+#define WGRIB_LOAD(x)		__atomic_load_n(&(x), __ATOMIC_ACQUIRE)
+#define WGRIB_STORE(x, v)	__atomic_store_n(&(x), (v), __ATOMIC_RELEASE)
+#else
+#define WGRIB_LOAD(x)		(x)
+#define WGRIB_STORE(x, v)	((x) = (v))
+#endif
+
+extern int wgrib_stats_enabled;
+extern struct wgrib_stats wgrib_stats;
+extern void (*wgrib_record_hook)(const struct wgrib_trace *trace);
+
+long long wgrib_clock(void);
+void wgrib_stats_reset(void);
+
+void wgrib_ctx_init(struct wgrib_ctx *ctx);
+void wgrib_ctx_free(struct wgrib_ctx *ctx);
+
+int wgrib_main(int argc, char **argv, FILE *out, FILE *err);
+int wgrib_run(struct wgrib_ctx *ctx, int argc, char **argv);
+
+long scan_grib_file(struct wgrib_ctx *ctx, FILE *input, struct grib_record **records);
+long scan_grib_mem(struct wgrib_ctx *ctx, unsigned char *buffer, size_t size,
+	struct grib_record **records);
+long grib_header_length(struct wgrib_ctx *ctx, unsigned char *msg, size_t avail);
+int grib_message_info(struct wgrib_ctx *ctx, unsigned char *msg, size_t size,
+	struct grib_record *info);
+int grib_unpack_setup(struct wgrib_ctx *ctx, unsigned char *msg, size_t size,
+	struct grib_unpack *u);
+/*
+ * grib_unpack splits fields of at least wgrib_unpack_min_points points
+ * over wgrib_unpack_threads threads (at most WGRIB_MAX_THREADS, 1 = never)
+ */
+#define WGRIB_MAX_THREADS 64
+extern int wgrib_unpack_threads;
+extern long wgrib_unpack_min_points;
+
+void grib_unpack(struct grib_unpack *u, float *flt, float missing);
+int grib_unpack_window(struct grib_unpack *u, long nx, long j0, long nj, long sj,
+	long i0, long ni, long si, float *flt, float missing);
+int grib_unpack_reduce(struct grib_unpack *u, struct grib_reduce *r);
+int grib_latlon_grid(struct wgrib_ctx *ctx, unsigned char *msg, size_t size,
+	struct grib_latlon *g);
+
+const struct ParmTable *param_table(struct wgrib_ctx *ctx, unsigned char *pds);
+char *k5toa(struct wgrib_ctx *ctx, unsigned char *pds);
+char *k5_comments(struct wgrib_ctx *ctx, unsigned char *pds);
+void levels(FILE *out, int kpds6, int kpds7, int center, int verbose);
+void PDStimes(FILE *out, int time_range, int p1, int p2, int time_unit);
+
+#endif
@@ -0,0 +1,60 @@
+"""
+Synthetic GRIB files shared by the tests (see benchmarks/synthetic.py)
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'benchmarks'))
+
+from synthetic import grid_file, message  # noqa: E402
+
+# name -> grid_file() arguments
+FILES = {
+    'grid': dict(count=24, nx=36, ny=19, n_bits=12),
+    'bitmap': dict(count=16, nx=37, ny=19, n_bits=13, bitmap=0.6),
+    'sparse': dict(count=8, nx=40, ny=20, n_bits=3, bitmap=0.05),
+    'bits25': dict(count=8, nx=30, ny=10, n_bits=25),
+    'bits32': dict(count=8, nx=30, ny=10, n_bits=32),
+    'harmonic': dict(count=8, n_bits=16, truncation=21),
+    'ec_large': dict(count=4, nx=50, ny=40, n_bits=8, ec_large=True),
+}
+
+
+@pytest.fixture(scope='session')
+def grib_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp('grib')
+
+
+@pytest.fixture(scope='session')
+def files(grib_dir):
+    '''name -> path of every file of FILES, plus 'mixed' (all of them)'''
+    paths = dict((name, grid_file(str(grib_dir / (name + '.grb')), **spec))
+                 for name, spec in FILES.items())
+    mixed = str(grib_dir / 'mixed.grb')
+    with open(mixed, 'wb') as out:
+        for name in sorted(paths):
+            with open(paths[name], 'rb') as f:
+                out.write(f.read())
+    paths['mixed'] = mixed
+    return paths
+
+
+@pytest.fixture(params=sorted(FILES) + ['mixed'])
+def path(request, files):
+    '''Each of the synthetic files in turn'''
+    return files[request.param]
+
+
+@pytest.fixture
+def tables_file(tmp_path):
+    '''Records that make wgrib warn once per run about their tables'''
+    path = str(tmp_path / 'tables.grb')
+    with open(path, 'wb') as f:
+        f.write(message(process=80) + message(process=80, kpds5=33) +
+                message(center=78, table=200))
+    return path
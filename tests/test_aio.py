@@ -0,0 +1,55 @@
+"""
+wgrib.aio against the blocking calls
+"""
+from __future__ import print_function, unicode_literals
+
+import asyncio
+
+import numpy
+
+import wgrib
+import wgrib.aio
+
+
+def _fields(path):
+    with wgrib.GribFile(path, index=False) as grb:
+        return [grb.read(i) for i in range(len(grb))]
+
+
+def test_decode_matches_read(files):
+    async def main():
+        async with wgrib.aio.open(files['mixed'], limit=3) as grb:
+            records = [rec async for rec in grb]
+            return await asyncio.gather(*[grb.decode(r) for r in records])
+
+    fields = asyncio.run(main())
+    expected = _fields(files['mixed'])
+    assert len(fields) == len(expected)
+    for a, b in zip(fields, expected):
+        numpy.testing.assert_array_equal(a, b)
+
+
+def test_scan_and_call_wgrib(files):
+    async def main():
+        return await asyncio.gather(
+            wgrib.aio.scan(files['grid']),
+            wgrib.aio.call_wgrib(['wgrib', files['grid'], '-s']))
+
+    records, (out, err) = asyncio.run(main())
+    assert records.tobytes() == wgrib.scan(files['grid']).tobytes()
+    assert out == wgrib.call_wgrib(['wgrib', files['grid'], '-s'])[0]
+
+
+def test_cancelled_calls_free_their_slots(files):
+    async def main():
+        async with wgrib.aio.open(files['grid'], limit=1) as grb:
+            tasks = [asyncio.ensure_future(grb.decode(i))
+                     for i in range(len(grb))]
+            await asyncio.sleep(0)
+            for task in tasks[1:]:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            return await asyncio.wait_for(grb.decode(0), 10)
+
+    numpy.testing.assert_array_equal(asyncio.run(main()),
+                                     _fields(files['grid'])[0])
@@ -0,0 +1,75 @@
+"""
+batch_decode: fields decoded by worker processes into shared memory
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+
+import numpy
+import pytest
+
+import wgrib
+
+batch_decode = pytest.importorskip('wgrib.batch').batch_decode
+
+
+def _requests(files):
+    return [(files[name], i) for name in ('grid', 'bitmap', 'harmonic')
+            for i in range(4)]
+
+
+def _expected(requests):
+    fields = []
+    for path, record in requests:
+        with wgrib.GribFile(path, index=False) as grb:
+            fields.append(grb.read(record))
+    return fields
+
+
+def test_same_as_read(files):
+    requests = _requests(files)
+    expected = _expected(requests)
+    with batch_decode(requests, workers=2) as result:
+        for field, ref in zip(result, expected):
+            numpy.testing.assert_array_equal(field, ref)
+        for i, field in result.as_completed():
+            numpy.testing.assert_array_equal(field, expected[i])
+
+
+def test_fields_outlive_close(files):
+    requests = _requests(files)
+    expected = _expected(requests)
+    with batch_decode(requests, workers=2) as result:
+        field = result[len(requests) - 1]
+        name = result._shm.name
+    # the block is gone from the host, the field still reads fine
+    assert not os.path.exists(os.path.join('/dev/shm', name.lstrip('/')))
+    numpy.testing.assert_array_equal(field, expected[-1])
+    del field
+
+
+def test_as_completed_mixed_with_getitem(files):
+    requests = _requests(files)
+    expected = _expected(requests)
+    with batch_decode(requests, workers=2, chunksize=1) as result:
+        seen = []
+        for n, (i, field) in enumerate(result.as_completed()):
+            seen.append(i)
+            numpy.testing.assert_array_equal(field, expected[i])
+            if n == 1:
+                result[len(requests) - 1]  # finishes chunks in between
+            elif n == 3:
+                result.wait()
+        assert sorted(seen) == list(range(len(requests)))
+
+
+def test_pool_failure_removes_block(files, monkeypatch):
+    class Failing(object):
+        def __init__(self, *args):
+            raise OSError('too many processes')
+
+    before = set(os.listdir('/dev/shm'))
+    monkeypatch.setattr(wgrib.batch.multiprocessing, 'Pool', Failing)
+    with pytest.raises(OSError):
+        batch_decode(_requests(files), workers=2)
+    assert set(os.listdir('/dev/shm')) <= before
@@ -0,0 +1,68 @@
+"""
+SharedCache of decoded fields
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import tempfile
+import uuid
+
+import numpy
+import pytest
+
+import wgrib
+from wgrib import cache as wgrib_cache
+from wgrib.cache import SharedCache, _unlink
+
+
+@pytest.fixture
+def name():
+    name = 'wgrib_test_{}_{}'.format(os.getpid(), uuid.uuid4().hex[:8])
+    yield name
+    wgrib_cache.disable()
+    SharedCache(name).destroy()
+    os.remove(os.path.join(tempfile.gettempdir(),
+                           '{}.cache.lock'.format(name)))
+
+
+def test_put_get_and_evict(name):
+    cache = SharedCache(name, max_bytes=2 * 4 * 12, capacity=8)
+    fields = [numpy.arange(12, dtype=numpy.float32).reshape(3, 4) + i
+              for i in range(3)]
+    assert cache.put('a', fields[0]) and cache.put('b', fields[1])
+    assert not cache.put('a', fields[0])
+    numpy.testing.assert_array_equal(cache.get('a'), fields[0])
+    assert cache.put('c', fields[2])  # evicts b, used least recently
+    assert cache.get('b') is None
+    out = numpy.empty((3, 4), dtype=numpy.float32)
+    assert cache.get('c', out) is out
+    numpy.testing.assert_array_equal(out, fields[2])
+    stats = cache.stats
+    assert (stats['fields'], stats['nbytes'], stats['evictions']) == \
+        (2, 96, 1)
+    cache.close()
+
+
+def test_missing_block_frees_its_slot(name):
+    cache = SharedCache(name, capacity=4)
+    field = numpy.ones((2, 3), dtype=numpy.float32)
+    assert cache.put('a', field)
+    _unlink(cache._block(cache._digest('a')))
+    assert cache.get('a') is None
+    assert cache.stats['fields'] == 0 and cache.stats['nbytes'] == 0
+    assert cache.put('a', field)
+    numpy.testing.assert_array_equal(cache.get('a'), field)
+    cache.close()
+
+
+def test_read_through_cache(name, files):
+    with wgrib.GribFile(files['bitmap'], index=False) as grb:
+        expected = [grb.read(i) for i in range(len(grb))]
+        wgrib_cache.enable(name)
+        first = [grb.read(i) for i in range(len(grb))]
+        again = [grb.read(i) for i in range(len(grb))]
+    stats = wgrib_cache.stats()
+    assert stats['inserts'] == len(expected) and \
+        stats['hits'] == len(expected)
+    for a, b, c in zip(expected, first, again):
+        assert a.tobytes() == b.tobytes() == c.tobytes()
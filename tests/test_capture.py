@@ -0,0 +1,42 @@
+"""
+Output of wgrib written to memory by the extension
+"""
+from __future__ import print_function, unicode_literals
+
+import ctypes
+import sys
+
+import pytest
+
+import wgrib
+from wgrib.wgrib import capture
+
+
+def _main_output(capfd, *args):
+    '''stdout and stderr of main(), which prints to the process descriptors'''
+    capfd.readouterr()
+    wgrib.wgrib.main(*args)
+    ctypes.CDLL(None).fflush(None)
+    return capfd.readouterr()
+
+
+@pytest.mark.parametrize('option', ['-s', '-v', '-V', '-verf', '-4yr'])
+def test_same_as_main(path, option, capfd):
+    '''byte for byte what wgrib main() prints on stdout/stderr'''
+    out, err = wgrib.call_wgrib(['wgrib', path, option])
+    assert (out, err) == _main_output(capfd, 'wgrib', path, option)
+
+
+def test_exit_code(files, tmp_path):
+    assert capture('wgrib', files['grid'], '-s')[0] == 0
+    code, out, err = capture('wgrib', str(tmp_path / 'missing.grb'))
+    assert code != 0 and 'could not open' in err
+
+
+def test_arguments_not_leaked(files):
+    args = [files['grid'].encode('utf-8'), '-'.encode('ascii') + b's']
+    before = [sys.getrefcount(arg) for arg in args]
+    for _ in range(100):
+        capture(b'wgrib', *args)
+        wgrib.wgrib.main(b'wgrib', args[0], b'-s', b'-o', b'/dev/null')
+    assert [sys.getrefcount(arg) for arg in args] == before
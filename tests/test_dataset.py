@@ -0,0 +1,64 @@
+"""
+open_dataset: lazy (time, level, member, y, x) variables
+"""
+from __future__ import print_function, unicode_literals
+
+import numpy
+import pytest
+
+import wgrib
+
+
+@pytest.fixture
+def dataset(files):
+    with wgrib.open_dataset(files['grid'], index=False) as ds:
+        yield ds
+
+
+def _dense(variable):
+    '''The whole variable, read one record at a time'''
+    out = numpy.empty(variable.shape, dtype=numpy.float32)
+    for pos in numpy.ndindex(*variable.shape[:3]):
+        out[pos] = variable[pos]
+    return out
+
+
+def test_records_match_read(files, dataset):
+    with wgrib.GribFile(files['grid'], index=False) as grb:
+        for number, record in enumerate(grb):
+            variable = [v for v in dataset.variables.values()
+                        if (v._index == number).any()][0]
+            pos = numpy.argwhere(variable._index == number)[0]
+            numpy.testing.assert_array_equal(variable[tuple(pos)],
+                                             grb.read(number))
+
+
+@pytest.mark.parametrize('key', [
+    (0, 0, 0, [1, 2], [3, 4]),
+    (0, 0, 0, [1, 2], slice(3, 9, 2)),
+    ([0, 2], 0, 0, [5, 1, 2], [3, 4]),
+    (slice(None), [0], 0, 3, [0, 35]),
+    (Ellipsis, [2, 3], 7),
+    (-1, 0, 0, slice(None, None, -1), 0),
+    (slice(0, 2), 0, [0], numpy.array([True] * 10 + [False] * 9), [1]),
+])
+def test_lists_index_each_dimension(dataset, key):
+    variable = dataset['TMP']
+    dense = _dense(variable)
+    expected = dense
+    # one dimension at a time, as numpy does with a single list
+    full = key
+    if any(k is Ellipsis for k in key):
+        i = [k is Ellipsis for k in key].index(True)
+        full = key[:i] + (slice(None),) * (6 - len(key)) + key[i + 1:]
+    full = full + (slice(None),) * (5 - len(full))
+    dim = 0
+    for k in full:
+        if numpy.ndim(k) == 0 and not isinstance(k, slice):
+            expected = numpy.take(expected, k, axis=dim)
+        else:
+            expected = expected[(slice(None),) * dim + (k,)]
+            dim += 1
+    result = variable[key]
+    assert result.shape == expected.shape
+    numpy.testing.assert_array_equal(result, expected)
@@ -0,0 +1,51 @@
+"""
+Fields decoded into numpy against the values wgrib dumps
+"""
+from __future__ import print_function, unicode_literals
+
+import numpy
+import pytest
+
+import wgrib
+
+UNDEFINED = numpy.float32(9.999e20)
+
+
+def _dump(path, tmp_path):
+    '''Every field as wgrib -d all -bin -nh writes it'''
+    out = str(tmp_path / 'dump.bin')
+    wgrib.call_wgrib(['wgrib', path, '-d', 'all', '-bin', '-nh', '-o', out])
+    return numpy.fromfile(out, dtype=numpy.float32)
+
+
+def test_read_is_bit_identical_to_dump(path, tmp_path):
+    fields = []
+    with wgrib.GribFile(path, index=False) as grb:
+        for i, rec in enumerate(grb):
+            field = grb.read(i)
+            assert field.dtype == numpy.float32
+            assert field.size == int(rec.info['nxny'])
+            fields.append(numpy.where(numpy.isnan(field), UNDEFINED,
+                                      field).ravel())
+    assert numpy.concatenate(fields).tobytes() == \
+        _dump(path, tmp_path).tobytes()
+
+
+def test_decode_options(files):
+    path = files['bitmap']
+    with wgrib.GribFile(path, index=False) as grb:
+        rec = grb[3]
+        field = grb.read(3)
+        offset = int(rec.info['offset'])
+    assert field.shape == (19, 37) and numpy.isnan(field).any()
+    assert wgrib.decode(path, offset).tobytes() == field.tobytes()
+    assert rec.decode().tobytes() == field.tobytes()
+    masked = wgrib.decode(path, offset, masked=True)
+    assert (masked.mask == numpy.isnan(field)).all()
+    out = numpy.empty(field.size, dtype=numpy.float32)
+    assert wgrib.decode(path, offset, out=out) is out
+    assert out.tobytes() == field.ravel().tobytes()
+    with pytest.raises(ValueError):
+        wgrib.decode(path, offset, out=numpy.empty(10, numpy.float32))
+    with pytest.raises(ValueError):
+        wgrib.decode(path, offset, out=numpy.empty(field.shape))
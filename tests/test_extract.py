@@ -0,0 +1,92 @@
+"""
+extract() against `wgrib -s file | grep ... | wgrib -i -grib file`
+"""
+from __future__ import print_function, unicode_literals
+
+import ctypes
+import io
+import os
+import re
+import tempfile
+
+import numpy
+import pytest
+
+import wgrib
+from wgrib.tables import param_names
+
+_libc = ctypes.CDLL(None)
+
+
+def _pipe(path, pattern, out):
+    '''The records of path whose -s line matches pattern, as wgrib -i
+    -grib writes them (the inventory goes through its stdin)'''
+    inventory = wgrib.call_wgrib(['wgrib', path, '-s'])[0]
+    lines = ''.join(line + '\n' for line in inventory.splitlines()
+                    if re.search(pattern, line))
+    with tempfile.TemporaryFile() as f:
+        f.write(lines.encode('ascii'))
+        f.flush()
+        f.seek(0)
+        saved = os.dup(0)
+        os.dup2(f.fileno(), 0)
+        _libc.clearerr(ctypes.c_void_p.in_dll(_libc, 'stdin'))
+        try:
+            wgrib.call_wgrib(['wgrib', path, '-i', '-grib', '-o', out])
+        finally:
+            os.dup2(saved, 0)
+            os.close(saved)
+    with io.open(out, 'rb') as f:
+        return f.read()
+
+
+def _read(path):
+    with io.open(path, 'rb') as f:
+        return f.read()
+
+
+SELECTIONS = [
+    (':TMP:', dict(param='TMP')),
+    (':[UV]GRD:', dict(where=lambda r: numpy.isin(param_names(r),
+                                                  ('UGRD', 'VGRD')))),
+    (':1hr fcst:', dict(fcst=1)),
+    (':RH:.*:anl:', dict(param='RH', fcst=0)),
+    (':SSTK:', dict(param='SSTK')),  # an ECMWF name
+    (':NONE:', dict(param='NONE')),
+]
+
+
+@pytest.mark.parametrize('name', ['grid', 'bitmap', 'ec_large', 'mixed'])
+@pytest.mark.parametrize('pattern,keys', SELECTIONS)
+def test_extract_matches_pipe(files, tmp_path, name, pattern, keys):
+    path = files[name]
+    expected = _pipe(path, pattern, str(tmp_path / 'pipe.grb'))
+    dst = str(tmp_path / 'extract.grb')
+    records = wgrib.extract(path, dst, **keys)
+    assert _read(dst) == expected
+    if len(records):
+        scanned = wgrib.scan(dst)
+        assert (numpy.asarray(records) == numpy.asarray(scanned)).all()
+    else:
+        assert not expected
+
+
+def test_several_sources_and_append(files, tmp_path):
+    sources = [files['grid'], files['bitmap']]
+    expected = b''.join(_pipe(path, ':TMP:', str(tmp_path / 'pipe.grb'))
+                        for path in sources)
+    dst = str(tmp_path / 'extract.grb')
+    wgrib.extract(sources, dst, param='TMP')
+    assert _read(dst) == expected
+    wgrib.extract(files['grid'], dst, param='UGRD', append=True)
+    assert _read(dst) == expected + \
+        _pipe(files['grid'], ':UGRD:', str(tmp_path / 'pipe.grb'))
+    with io.open(str(tmp_path / 'object.grb'), 'wb') as f:
+        f.write(b'head')
+        wgrib.extract(sources, f, param='TMP')
+    assert _read(str(tmp_path / 'object.grb')) == b'head' + expected
+
+
+def test_destination_is_a_source(files):
+    with pytest.raises(ValueError):
+        wgrib.extract(files['grid'], files['grid'], param='TMP')
@@ -0,0 +1,61 @@
+"""
+Memory-mapped GribFile and its Records
+"""
+from __future__ import print_function, unicode_literals
+
+import gc
+import io
+
+import pytest
+
+import wgrib
+
+
+def test_records_are_views_of_the_file(path):
+    with io.open(path, 'rb') as f:
+        data = f.read()
+    with wgrib.GribFile(path, index=False) as grb:
+        assert len(grb) == len(list(grb))
+        for rec in grb:
+            start, length = int(rec.offset), int(rec.length)
+            assert isinstance(rec.message, memoryview)
+            assert rec.message.tobytes() == data[start:start + length]
+            assert bytes(rec.message[:4]) == b'GRIB'
+            assert len(rec.pds) == 28
+            assert rec.gds is None or len(rec.gds) == 32
+            assert (rec.bms is not None) == bool(rec.has_bitmap)
+            assert len(rec.bds) == int(rec.bds_length)
+            assert grb.record_at(start).message.tobytes() == \
+                rec.message.tobytes()
+
+
+def test_record_at_and_select(files):
+    with wgrib.GribFile(files['grid'], index=False) as grb:
+        with pytest.raises(KeyError):
+            grb.record_at(1)
+        rows = grb.select(param='TMP')
+        assert len(rows) and (rows.kpds5 == 11).all()
+        assert len(grb.select(param='TMP', kpds5=33)) == 0
+        fcst = grb.select(fcst=1)
+        assert len(fcst) and (fcst.p1 == 1).all()
+
+
+def test_records_outlive_the_file(files):
+    grb = wgrib.GribFile(files['bitmap'], index=False)
+    expected = grb.read(2)
+    rec = grb[2]
+    grb.close()
+    assert grb.closed
+    assert rec.decode().tobytes() == expected.tobytes()
+    del rec
+    gc.collect()
+
+
+def test_empty_file(tmp_path):
+    path = str(tmp_path / 'empty.grb')
+    io.open(path, 'wb').close()
+    with wgrib.GribFile(path, index=False) as grb:
+        assert len(grb) == 0
+        assert list(grb) == []
+        assert len(grb.select(param='TMP')) == 0
+    assert grb.records.dtype == wgrib.RECORD_DTYPE
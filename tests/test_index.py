@@ -0,0 +1,75 @@
+"""
+Sidecar index of GribFile: read when up to date, written on request
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import shutil
+
+import numpy
+import pytest
+
+import wgrib
+from wgrib import gribfile
+from wgrib.index import index_path
+
+
+@pytest.fixture
+def grib(files, tmp_path):
+    path = str(tmp_path / 'a.grb')
+    shutil.copy(files['grid'], path)
+    return path
+
+
+def _same(a, b):
+    '''Equal inventories (the padding of the rows is not saved)'''
+    return len(a) == len(b) and bool((numpy.asarray(a) ==
+                                      numpy.asarray(b)).all())
+
+
+def _no_scan(buf):
+    raise AssertionError('file scanned despite an up to date index')
+
+
+def test_default_does_not_write(grib):
+    with wgrib.GribFile(grib) as grb:
+        assert len(grb) == 24
+    with wgrib.Session() as session:
+        session.read(grib, 0)
+    wgrib.open_dataset(grib)
+    wgrib.extract(grib, grib + '.out', param='TMP')
+    assert sorted(os.listdir(os.path.dirname(grib))) == ['a.grb', 'a.grb.out']
+
+
+def test_written_on_request_then_read(grib, monkeypatch):
+    with wgrib.GribFile(grib, index=True) as grb:
+        expected = grb.records
+    assert os.path.exists(index_path(grib))
+    monkeypatch.setattr(gribfile, '_scan_buffer', _no_scan)
+    with wgrib.GribFile(grib) as grb:
+        assert _same(grb.records, expected)
+    with pytest.raises(AssertionError):
+        wgrib.GribFile(grib, index=False)
+
+
+def test_stale_index_is_ignored(grib, files):
+    wgrib.GribFile(grib, index=True).close()
+    with open(grib, 'ab') as out, open(files['bits25'], 'rb') as f:
+        out.write(f.read())
+    stamp = os.path.getmtime(index_path(grib))
+    with wgrib.GribFile(grib) as grb:
+        assert len(grb) == 32
+    assert os.path.getmtime(index_path(grib)) == stamp
+    with wgrib.GribFile(grib, index=True) as grb:
+        pass
+    with wgrib.GribFile(grib) as grb:
+        assert _same(grb.records, wgrib.scan(grib))
+
+
+def test_extract_index(grib):
+    dst = grib + '.out'
+    records = wgrib.extract(grib, dst, index=True)
+    assert os.path.exists(index_path(grib))
+    with wgrib.GribFile(dst) as grb:
+        assert _same(grb.records, records)
+    assert os.path.exists(index_path(dst))
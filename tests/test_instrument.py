@@ -0,0 +1,68 @@
+"""
+Counters and per-record hooks of wgrib.instrument
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import threading
+
+import wgrib
+from wgrib import instrument
+
+
+def test_trace_counts_records_and_values(files, tmp_path):
+    out = str(tmp_path / 'dump.bin')
+    with wgrib.GribFile(files['grid'], index=False) as grb:
+        records, points = len(grb), int(grb.records['nxny'].sum())
+    with instrument.trace() as t:
+        assert instrument.enabled()
+        wgrib.call_wgrib(['wgrib', files['grid'], '-d', 'all', '-bin',
+                          '-o', out])
+    assert not instrument.enabled()
+    assert t.stats['records'] == records
+    assert t.stats['fields'] == records and t.stats['values'] == points
+    assert t.stats['bytes_written'] == os.path.getsize(out)
+    assert t.stats['unpack_calls'] == records
+    assert 'unpack' in repr(t)
+
+
+def test_counters_off_by_default(files):
+    assert not instrument.enabled()
+    before = instrument.stats()
+    wgrib.call_wgrib(['wgrib', files['grid'], '-s'])
+    assert instrument.stats() == before
+
+
+def test_on_record(files):
+    seen = []
+    with instrument.on_record(seen.append):
+        wgrib.call_wgrib(['wgrib', files['grid'], '-s'])
+    wgrib.call_wgrib(['wgrib', files['grid'], '-s'])
+    with wgrib.GribFile(files['grid'], index=False) as grb:
+        offsets = [int(o) for o in grb.records['offset']]
+    assert [r.number for r in seen] == list(range(1, len(offsets) + 1))
+    assert [r.offset for r in seen] == offsets
+    assert all(r.inventory_ns >= 0 for r in seen)
+
+
+def test_hook_swapped_while_running(files):
+    # the hook is loaded once per record: setting it from another thread
+    # must never call a hook that was removed
+    stop = threading.Event()
+    seen = []
+
+    def toggle():
+        while not stop.is_set():
+            with instrument.on_record(seen.append):
+                pass
+
+    thread = threading.Thread(target=toggle)
+    thread.start()
+    try:
+        for _ in range(20):
+            wgrib.call_wgrib(['wgrib', files['mixed'], '-s'])
+    finally:
+        stop.set()
+        thread.join()
+    assert all(r.length > 0 for r in seen)
+    assert not instrument.enabled()
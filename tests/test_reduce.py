@@ -0,0 +1,82 @@
+"""
+wgrib.reduce against numpy on the decoded fields
+"""
+from __future__ import print_function, unicode_literals
+
+import warnings
+
+import numpy
+import pytest
+
+import wgrib
+
+OPS = ['count', 'missing', 'min', 'max', 'mean', 'sum', 'var', 'std', 'hist']
+BINS = numpy.linspace(-50, 350, 9)
+
+
+def _fields(path):
+    with wgrib.GribFile(path, index=False) as grb:
+        return numpy.array([grb.read(i) for i in range(len(grb))],
+                           dtype=numpy.float64)
+
+
+def _hist(values):
+    return numpy.histogram(values[~numpy.isnan(values)], BINS)[0]
+
+
+@pytest.mark.parametrize('name', ['grid', 'bitmap', 'sparse', 'bits25',
+                                  'bits32'])
+def test_time_axis(files, name):
+    fields = _fields(files[name])
+    stats = wgrib.reduce(files[name], ops=OPS, bins=BINS)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all NaN points
+        expected = dict(
+            count=(~numpy.isnan(fields)).sum(0),
+            missing=numpy.isnan(fields).sum(0),
+            min=numpy.nanmin(fields, 0), max=numpy.nanmax(fields, 0),
+            mean=numpy.nanmean(fields, 0), sum=numpy.nansum(fields, 0),
+            var=numpy.nanvar(fields, 0), std=numpy.nanstd(fields, 0))
+    for op, value in expected.items():
+        assert stats[op].shape == fields.shape[1:]
+        numpy.testing.assert_allclose(stats[op], value, rtol=1e-9,
+                                      atol=1e-9, err_msg=op)
+    hist = numpy.apply_along_axis(_hist, 0, fields)
+    numpy.testing.assert_array_equal(stats['hist'],
+                                     numpy.moveaxis(hist, 0, -1))
+
+
+@pytest.mark.parametrize('name', ['grid', 'bitmap', 'harmonic'])
+def test_record_axis(files, name):
+    fields = _fields(files[name]).reshape(len(wgrib.scan(files[name])), -1)
+    stats = wgrib.reduce(files[name], ops=OPS, axis='record', bins=BINS)
+    numpy.testing.assert_array_equal(stats['count'],
+                                     (~numpy.isnan(fields)).sum(1))
+    numpy.testing.assert_array_equal(stats['min'], numpy.nanmin(fields, 1))
+    numpy.testing.assert_array_equal(stats['max'], numpy.nanmax(fields, 1))
+    numpy.testing.assert_allclose(stats['mean'], numpy.nanmean(fields, 1),
+                                  rtol=1e-9)
+    numpy.testing.assert_allclose(stats['std'], numpy.nanstd(fields, 1),
+                                  rtol=1e-9)
+    numpy.testing.assert_array_equal(stats['hist'],
+                                     numpy.array([_hist(f) for f in fields]))
+
+
+def test_selection_and_errors(files):
+    path = files['mixed']
+    with wgrib.GribFile(path, index=False) as grb:
+        rows = numpy.searchsorted(grb.records.offset,
+                                  grb.select(kpds5=11, nx=36).offset)
+        fields = numpy.array([grb.read(int(i)) for i in rows],
+                             dtype=numpy.float64)
+    stats = wgrib.reduce(path, ops=['count', 'mean'], kpds5=11, nx=36)
+    assert (stats['count'] == len(rows)).all()
+    numpy.testing.assert_allclose(stats['mean'], fields.mean(0), rtol=1e-9)
+    with pytest.raises(ValueError):
+        wgrib.reduce(path, ops=['median'])
+    with pytest.raises(ValueError):
+        wgrib.reduce(path, ops=['hist'])
+    with pytest.raises(ValueError):
+        wgrib.reduce(path)  # grids of several sizes
+    with pytest.raises(ValueError):
+        wgrib.reduce(path, param='NONE')
@@ -0,0 +1,47 @@
+"""
+scan() and the mmap scanner against the text inventory
+"""
+from __future__ import print_function, unicode_literals
+
+import io
+
+import numpy
+
+import wgrib
+
+
+def _inventory(path):
+    '''(offset, date, kpds5, kpds6, kpds7) of every -v line'''
+    out = wgrib.call_wgrib(['wgrib', path, '-v'])[0]
+    rows = []
+    for line in out.splitlines():
+        fields = line.split(':')
+        kpds = [int(k) for k in fields[5].split('=')[1].split(',')]
+        rows.append((int(fields[1]), int(fields[2][2:])) + tuple(kpds))
+    return rows
+
+
+def test_scan_matches_inventory(path):
+    records = wgrib.scan(path)
+    assert [tuple(int(r[f]) for f in ('offset', 'date', 'kpds5', 'kpds6',
+                                      'kpds7')) for r in records] == \
+        _inventory(path)
+    # the mmap scanner of GribFile gives the same rows, padding included
+    with wgrib.GribFile(path, index=False) as grb:
+        assert grb.records.tobytes() == records.tobytes()
+
+
+def test_data_between_messages_is_skipped(files, tmp_path):
+    with io.open(files['bitmap'], 'rb') as f:
+        data = f.read()
+    records = wgrib.scan(files['bitmap'])
+    path = str(tmp_path / 'junk.grb')
+    with io.open(path, 'wb') as out:
+        for r in records:
+            out.write(b'junk GRIB' * 3)
+            out.write(data[r['offset']:r['offset'] + r['length']])
+    junk = wgrib.scan(path)
+    assert [r[0] for r in _inventory(path)] == list(junk['offset'])
+    assert (junk['length'] == records['length']).all()
+    for field in ('kpds5', 'nxny', 'n_bits', 'has_bitmap', 'bds_length'):
+        numpy.testing.assert_array_equal(junk[field], records[field])
@@ -0,0 +1,55 @@
+"""
+Session: pooled contexts and files give the same results as one-off calls
+"""
+from __future__ import print_function, unicode_literals
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+import wgrib
+
+
+def test_run_matches_call_wgrib(files):
+    with wgrib.Session() as session:
+        for _ in range(2):
+            for path in sorted(files.values()):
+                for option in ('-s', '-v', '-V'):
+                    assert session.run(path, option) == \
+                        wgrib.call_wgrib(['wgrib', path, option])
+
+
+def test_warnings_on_every_run(tables_file):
+    expected = wgrib.call_wgrib(['wgrib', tables_file, '-s'])
+    assert 'Using NCEP' in expected[1]
+    assert 'Undefined parameter table' in expected[1]
+    with wgrib.Session() as session:
+        for _ in range(3):
+            assert session.run(tables_file, '-s') == expected
+
+
+def test_options_last_one_run(tables_file):
+    with wgrib.Session() as session:
+        plain = session.run(tables_file, '-s')
+        session.run(tables_file, '-s', '-ncep_opn')
+        assert session.run(tables_file, '-s') == plain
+
+
+def test_read_while_files_are_evicted(files):
+    paths = sorted(files.values())
+    expected = {}
+    for path in paths:
+        with wgrib.GribFile(path, index=False) as grb:
+            expected[path] = [grb.read(i).copy() for i in range(len(grb))]
+
+    # one pooled file, every other call evicts the one being read
+    with wgrib.Session(max_files=1, index=False) as session:
+        def read(i):
+            path = paths[i % len(paths)]
+            record = i % len(expected[path])
+            return path, record, session.read(path, record)
+
+        with ThreadPoolExecutor(8) as pool:
+            for path, record, field in pool.map(read, range(400)):
+                numpy.testing.assert_array_equal(field, expected[path][record])
+        assert session.stats['files_evicted'] > 0
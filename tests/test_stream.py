@@ -0,0 +1,88 @@
+"""
+iter_records on files, chunk iterables and non-blocking pipes
+"""
+from __future__ import print_function, unicode_literals
+
+import io
+import os
+import threading
+import time
+
+import pytest
+
+import wgrib
+
+
+def _check(records, path):
+    expected = wgrib.scan(path)
+    assert [int(r.info['offset']) for r in records] == \
+        [int(o) for o in expected['offset']]
+    with wgrib.GribFile(path, index=False) as grb:
+        for i, rec in enumerate(records):
+            assert rec.decode().tobytes() == grb.read(i).tobytes()
+
+
+def test_file_and_chunks(files):
+    path = files['mixed']
+    with open(path, 'rb') as f:
+        _check(list(wgrib.iter_records(f, chunk_size=1000)), path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    chunks = (data[i:i + 7] for i in range(0, len(data), 7))
+    _check(list(wgrib.iter_records(chunks)), path)
+
+
+class _Counted(io.RawIOBase):
+    '''A non-blocking pipe end counting the reads'''
+
+    def __init__(self, fd):
+        self.fd, self.reads = fd, 0
+
+    def readable(self):
+        return True
+
+    def fileno(self):
+        return self.fd
+
+    def read(self, n=-1):
+        self.reads += 1
+        try:
+            return os.read(self.fd, n)
+        except BlockingIOError:
+            return None
+
+
+def test_non_blocking_pipe_is_waited_on(files):
+    path = files['grid']
+    with open(path, 'rb') as f:
+        data = f.read()
+    r, w = os.pipe()
+    os.set_blocking(r, False)
+    pieces = [data[i:i + 4096] for i in range(0, len(data), 4096)]
+
+    def writer():
+        for piece in pieces:
+            time.sleep(0.01)
+            os.write(w, piece)
+        os.close(w)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    source = _Counted(r)
+    try:
+        records = list(wgrib.iter_records(source, chunk_size=1 << 16))
+    finally:
+        thread.join()
+        os.close(r)
+    _check(records, path)
+    # one read with data and at most one without per piece, plus the EOF
+    assert source.reads <= 2 * len(pieces) + 2
+
+
+def test_non_blocking_without_fileno():
+    class Empty(object):
+        def read(self, n):
+            return None
+
+    with pytest.raises(ValueError):
+        next(wgrib.iter_records(Empty()))
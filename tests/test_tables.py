@@ -0,0 +1,57 @@
+"""
+Parameter names of TableRegistry against the wgrib inventory
+"""
+from __future__ import print_function, unicode_literals
+
+import wgrib
+from wgrib.tables import TableRegistry
+
+GRIBTAB = '''-1:78:0:200
+11:MYTMP:my temperature [K]
+-1:7:0:2
+11:NOTMP:not used by wgrib [K]
+'''
+
+
+def _names(path):
+    out, err = wgrib.call_wgrib(['wgrib', path, '-s'])
+    return [line.split(':')[3] for line in out.splitlines()]
+
+
+def test_names_match_inventory(path, tables_file):
+    for p in (path, tables_file):
+        assert list(TableRegistry().params(wgrib.scan(p))) == _names(p)
+
+
+def test_gribtab_after_builtin_tables(tables_file, tmp_path, monkeypatch):
+    gribtab = tmp_path / 'gribtab'
+    gribtab.write_text(GRIBTAB)
+    with monkeypatch.context() as m:
+        m.setenv('GRIBTAB', str(gribtab))
+        expected = _names(tables_file)
+    assert expected == ['TMP', 'UGRD', 'MYTMP']
+
+    registry = TableRegistry()
+    registry.load_user_table(str(gribtab))
+    assert list(registry.params(wgrib.scan(tables_file))) == expected
+    assert registry.param(78, 0, 200, 81, 11).units == 'K'
+
+
+def test_user_table_first(tables_file, tmp_path):
+    gribtab = tmp_path / 'gribtab'
+    gribtab.write_text(GRIBTAB)
+    registry = TableRegistry()
+    registry.load_user_table(str(gribtab), first=True)
+    assert list(registry.params(wgrib.scan(tables_file))) == \
+        ['NOTMP', 'UGRD', 'MYTMP']
+
+
+def test_override():
+    registry = TableRegistry()
+    registry.override(-1, -1, -1, {11: ('ANY', 'any table')})
+    registry.override(7, 0, 2, {11: ('FIRST', 'first [C]')}, first=True)
+    assert registry.param(7, 0, 2, 81, 11).name == 'FIRST'
+    assert registry.param(7, 0, 2, 81, 11).units == 'C'
+    assert registry.param(7, 0, 2, 81, 33).name == 'UGRD'
+    assert registry.param(98, 0, 128, 1, 130).name == 'T'
+    assert registry.param(85, 0, 2, 1, 11).name == 'ANY'
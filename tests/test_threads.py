@@ -0,0 +1,87 @@
+"""
+The wgrib context: concurrent calls give the same results as serial ones
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import pytest
+
+import wgrib
+
+THREADS = 8
+ROUNDS = 4
+
+
+def _dump(path, out):
+    wgrib.call_wgrib(['wgrib', path, '-d', 'all', '-bin', '-o', out])
+    with open(out, 'rb') as f:
+        return f.read()
+
+
+def _fields(path):
+    with wgrib.GribFile(path, index=False) as grb:
+        return [grb.read(i).tobytes() for i in range(len(grb))]
+
+
+def _jobs(files, tmp_path):
+    '''(name, function) of every kind of call, each on every file'''
+    for name, path in sorted(files.items()):
+        for option in ('-s', '-v', '-V'):
+            yield (name, option), \
+                lambda path=path, option=option: wgrib.call_wgrib(
+                    ['wgrib', path, option])
+        yield (name, 'scan'), lambda path=path: wgrib.scan(path).tobytes()
+        yield (name, 'read'), lambda path=path: _fields(path)
+        yield (name, 'dump'), lambda path=path, name=name: _dump(
+            path, str(tmp_path / '{}.{}.bin'.format(name, os.getpid())))
+
+
+def test_concurrent_calls_match_serial(files, tmp_path):
+    jobs = list(_jobs(files, tmp_path))
+    expected = dict((key, func()) for key, func in jobs)
+
+    # every thread needs its own dump file
+    def run(item):
+        i, (key, func) = item
+        if key[1] == 'dump':
+            out = str(tmp_path / 'dump{}.bin'.format(i))
+            return key, _dump(files[key[0]], out)
+        return key, func()
+
+    work = list(enumerate(jobs * ROUNDS))
+    with ThreadPoolExecutor(THREADS) as pool:
+        for key, result in pool.map(run, work[::-1]):
+            assert result == expected[key], key
+
+
+def test_concurrent_reads_of_one_file(files):
+    path = files['mixed']
+    with wgrib.GribFile(path, index=False) as grb:
+        expected = [grb.read(i).copy() for i in range(len(grb))]
+
+        def read(i):
+            return i, grb.read(i % len(grb))
+
+        with ThreadPoolExecutor(THREADS) as pool:
+            for i, field in pool.map(read, range(len(grb) * ROUNDS)):
+                numpy.testing.assert_array_equal(
+                    field, expected[i % len(grb)])
+
+
+@pytest.mark.parametrize('option', ['-ncep_opn', '-ncep_rean'])
+def test_options_do_not_leak_between_threads(tables_file, option):
+    '''per-run options (here the NCEP table) stay in their own call'''
+    plain = wgrib.call_wgrib(['wgrib', tables_file, '-s'])
+    chosen = wgrib.call_wgrib(['wgrib', tables_file, '-s', option])
+
+    def run(i):
+        if i % 2:
+            return i, wgrib.call_wgrib(['wgrib', tables_file, '-s', option])
+        return i, wgrib.call_wgrib(['wgrib', tables_file, '-s'])
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        for i, result in pool.map(run, range(64)):
+            assert result == (chosen if i % 2 else plain)
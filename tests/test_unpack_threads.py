@@ -0,0 +1,37 @@
+"""
+Fields unpacked over several native threads
+"""
+from __future__ import print_function, unicode_literals
+
+import pytest
+
+import wgrib
+
+
+@pytest.fixture
+def threads():
+    previous = wgrib.set_unpack_threads(4, min_points=1)
+    try:
+        yield
+    finally:
+        wgrib.set_unpack_threads(*previous)
+
+
+def _fields(path):
+    with wgrib.GribFile(path, index=False) as grb:
+        return [grb.read(i) for i in range(len(grb))]
+
+
+def test_threaded_unpack_is_bit_identical(path, threads):
+    wgrib.set_unpack_threads(1)
+    serial = _fields(path)
+    wgrib.set_unpack_threads(4, min_points=1)
+    for a, b in zip(serial, _fields(path)):
+        assert a.tobytes() == b.tobytes()
+
+
+def test_set_unpack_threads_returns_previous(threads):
+    assert wgrib.set_unpack_threads(2) == (4, 1)
+    assert wgrib.set_unpack_threads(1, min_points=1 << 20) == (2, 1)
+    with pytest.raises(ValueError):
+        wgrib.set_unpack_threads(-1)
@@ -0,0 +1,67 @@
+"""
+Windows and strides decoded without unpacking the whole field
+"""
+from __future__ import print_function, unicode_literals
+
+import numpy
+import pytest
+
+import wgrib
+from synthetic import grid_file
+
+WINDOWS = [
+    dict(step=(2, 3)),
+    dict(lat=(5, 12)),
+    dict(lon=(100, 200.5)),
+    dict(lon=(350, 10)),  # across the date line, west to east
+    dict(lat=(3, 17), lon=(300, 30), step=(3, 7)),
+    dict(lat=(30, 40)),   # empty
+]
+
+
+@pytest.fixture(scope='module', params=[
+    dict(n_bits=12), dict(n_bits=7, bitmap=0.5), dict(n_bits=25),
+    dict(n_bits=32, bitmap=0.9)])
+def global_file(request, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('window') / 'global.grb')
+    return grid_file(path, count=3, nx=360, ny=19, **request.param)
+
+
+@pytest.mark.parametrize('window', WINDOWS)
+def test_window_matches_full_field(global_file, window):
+    with wgrib.GribFile(global_file, index=False) as grb:
+        for i, rec in enumerate(grb):
+            full = grb.read(i)
+            lats, lons = rec.latlon()
+            wlats, wlons = rec.latlon(**window)
+            rows = [int(numpy.flatnonzero(lats == v)[0]) for v in wlats]
+            cols = [int(numpy.flatnonzero(lons == v)[0]) for v in wlons]
+            expected = full[numpy.ix_(rows, cols)]
+            field = grb.read(i, **window)
+            assert field.shape == (len(wlats), len(wlons))
+            assert field.tobytes() == expected.tobytes()
+            out = numpy.full(field.shape, -1, dtype=numpy.float32)
+            assert rec.decode(out=out, **window) is out
+            assert out.tobytes() == expected.tobytes()
+
+
+def test_window_coordinates(global_file):
+    with wgrib.GribFile(global_file, index=False) as grb:
+        rec = grb[0]
+        lats, lons = rec.latlon(lat=(5, 12), lon=(350, 10))
+        assert list(lats) == list(range(12, 4, -1))
+        assert list(lons) == list(range(350, 360)) + list(range(0, 11))
+        lats, lons = rec.latlon(step=(4, 90))
+        assert list(lats) == [19, 15, 11, 7, 3]
+        assert list(lons) == [0, 90, 180, 270]
+
+
+def test_window_errors(files):
+    with wgrib.GribFile(files['harmonic'], index=False) as grb:
+        with pytest.raises(ValueError):
+            grb.read(0, lat=(0, 10))  # not a lat/lon grid
+    with wgrib.GribFile(files['grid'], index=False) as grb:
+        with pytest.raises(ValueError):
+            grb.read(0, step=(0, 1))
+        with pytest.raises(ValueError):
+            grb.read(0, step=(2, 2), out=numpy.empty((3, 3), numpy.float32))
@@ -0,0 +1,83 @@
+"""
+Bulk writers and export()
+"""
+from __future__ import print_function, unicode_literals
+
+import json
+import os
+import zlib
+
+import numpy
+import pytest
+
+import wgrib
+from wgrib.writers import ZarrWriter
+
+
+def _fields(path):
+    with wgrib.GribFile(path, index=False) as grb:
+        return numpy.array([grb.read(i) for i in range(len(grb))])
+
+
+def _read_zarr(path):
+    '''The array of a zarr (v2, zlib) directory store, without zarr'''
+    with open(os.path.join(path, '.zarray')) as f:
+        meta = json.load(f)
+    shape, chunks = meta['shape'], meta['chunks']
+    grid = [-(-n // c) for n, c in zip(shape, chunks)]
+    out = numpy.full([g * c for g, c in zip(grid, chunks)], numpy.nan,
+                     dtype='<f4')
+    for pos in numpy.ndindex(*grid):
+        name = os.path.join(path, '.'.join(map(str, pos)))
+        if os.path.exists(name):
+            with open(name, 'rb') as f:
+                chunk = numpy.frombuffer(zlib.decompress(f.read()), '<f4')
+            out[tuple(slice(p * c, (p + 1) * c) for p, c in
+                      zip(pos, chunks))] = chunk.reshape(chunks)
+    return out[tuple(slice(0, n) for n in shape)]
+
+
+@pytest.mark.parametrize('name', ['grid', 'bitmap'])
+def test_npy_and_zarr_round_trip(files, tmp_path, name):
+    expected = _fields(files[name])
+    with wgrib.GribFile(files[name], index=False) as grb:
+        wgrib.export(grb, str(tmp_path / 'a.npy'), 'npy')
+        wgrib.export(grb, str(tmp_path / 'a.zarr'), 'zarr', chunks=(3, 8, 10))
+    numpy.testing.assert_array_equal(numpy.load(str(tmp_path / 'a.npy')),
+                                     expected)
+    numpy.testing.assert_array_equal(_read_zarr(str(tmp_path / 'a.zarr')),
+                                     expected)
+
+
+def test_zarr_replaces_previous_store(tmp_path):
+    path = str(tmp_path / 'z.zarr')
+    with ZarrWriter(path) as out:
+        out.write_many(numpy.ones((3, 4, 5), dtype=numpy.float32))
+    # all NaN chunks are not written, the old ones must not show through
+    with ZarrWriter(path) as out:
+        out.write(numpy.full((4, 5), numpy.nan, dtype=numpy.float32))
+        out.write(numpy.zeros((4, 5), dtype=numpy.float32))
+    data = _read_zarr(path)
+    assert data.shape == (2, 4, 5)
+    assert numpy.isnan(data[0]).all() and (data[1] == 0).all()
+    assert sorted(os.listdir(path)) == ['.zarray', '1.0.0']
+
+
+def test_zarr_refuses_other_directories(tmp_path):
+    (tmp_path / 'notes.txt').write_text('keep me')
+    with pytest.raises(ValueError):
+        ZarrWriter(str(tmp_path))
+    assert (tmp_path / 'notes.txt').exists()
+
+
+@pytest.mark.parametrize('name', ['grid', 'bitmap'])
+@pytest.mark.parametrize('fmt,options', [
+    ('ieee', ['-ieee']), ('bin', ['-bin']), ('bin', ['-bin', '-nh'])])
+def test_binary_matches_wgrib(files, tmp_path, name, fmt, options):
+    expected, out = str(tmp_path / 'wgrib.out'), str(tmp_path / 'export.out')
+    wgrib.call_wgrib(['wgrib', files[name], '-d', 'all'] + options +
+                     ['-o', expected])
+    with wgrib.GribFile(files[name], index=False) as grb:
+        wgrib.export(grb, out, fmt, header='-nh' not in options)
+    with open(expected, 'rb') as a, open(out, 'rb') as b:
+        assert a.read() == b.read()
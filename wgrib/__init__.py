@@ -1 +1,29 @@
 from .lib import check_wgrib_output as call_wgrib
+
+try:
+    from .inventory import scan, RECORD_DTYPE
+    from .gribfile import GribFile, Record, decode, set_unpack_threads
+    from .tables import param_name, level_text, time_text, \
+        load_user_table, TableRegistry
+    from .session import Session
+    from .stream import iter_records
+    from .dataset import open_dataset
+    from .writers import export
+    from .extract import extract
+    from .reduce import reduce
+    from . import instrument
+except ImportError:
+    # C extension or numpy not available
+    pass
+
+try:
+    from .batch import batch_decode
+except ImportError:
+    # needs multiprocessing.shared_memory (Python 3.8+)
+    pass
+
+try:
+    from . import aio
+except (ImportError, SyntaxError):
+    # needs asyncio with async generators (Python 3.6+)
+    pass
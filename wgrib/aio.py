@@ -0,0 +1,137 @@
+"""
+asyncio interface
+
+Scanning, reading and unpacking run on a thread pool (the extension
+releases the GIL while it works), so the event loop never waits for them.
+At most `limit` calls of a file are in flight at once; further calls wait
+for a slot.  Cancelling a call that has not started yet drops it, a call
+already unpacking finishes in its thread and keeps its slot until then.
+
+    async with wgrib.aio.open('gfs.grb') as grb:
+        async for rec in grb:
+            field = await grb.decode(rec)
+"""
+from __future__ import print_function, unicode_literals
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .gribfile import GribFile
+from .inventory import scan as _scan
+from .lib import check_wgrib_output
+
+
+class AsyncGribFile(object):
+    '''GribFile whose blocking calls are awaited on an executor
+
+    Without an `executor`, the file has its own pool of `max_workers`
+    threads (one per CPU by default), shut down by close().
+    '''
+
+    def __init__(self, path, index=None, executor=None, max_workers=None,
+                 limit=None):
+        self.path = path
+        self.index = index
+        self._own_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers or os.cpu_count() or 1)
+        self._executor = executor
+        self.limit = limit or getattr(executor, '_max_workers', None) or 4
+        self._slots = None
+        self._pending = set()
+        self._loop = None
+        self._grb = None
+
+    def __await__(self):
+        return self._open().__await__()
+
+    async def __aenter__(self):
+        return await self._open()
+
+    async def __aexit__(self, type, value, traceback):
+        await self.close()
+
+    def __len__(self):
+        return len(self._grb)
+
+    async def __aiter__(self):
+        for i in range(len(self._grb)):
+            yield self._grb[i]
+            if i % 256 == 255:
+                await asyncio.sleep(0)  # let other tasks run
+
+    @property
+    def records(self):
+        '''Inventory (see GribFile.records)'''
+        return self._grb.records
+
+    def select(self, *args, **kwargs):
+        '''GribFile.select, which only looks at the inventory'''
+        return self._grb.select(*args, **kwargs)
+
+    def __getitem__(self, i):
+        return self._grb[i]
+
+    async def _open(self):
+        if self._grb is None:
+            self._loop = asyncio.get_running_loop()
+            self._slots = asyncio.Semaphore(self.limit)
+            self._grb = await self._submit(GribFile, self.path, self.index)
+        return self
+
+    def _done(self, future):
+        '''Frees the slot of a finished (or cancelled) call'''
+        def release():
+            self._pending.discard(future)
+            self._slots.release()
+        try:
+            self._loop.call_soon_threadsafe(release)
+        except RuntimeError:
+            pass  # event loop already closed
+
+    async def _submit(self, func, *args):
+        await self._slots.acquire()
+        try:
+            future = self._executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        self._pending.add(future)
+        future.add_done_callback(self._done)
+        # cancelling the wrapper cancels the call if it has not started
+        return await asyncio.wrap_future(future)
+
+    async def decode(self, record, out=None, masked=False, lat=None,
+                     lon=None, step=None):
+        '''Decodes a record (index or Record), see GribFile.read'''
+        return await self._submit(self._grb.read, record, out, masked, lat,
+                                  lon, step)
+
+    read = decode
+
+    async def close(self):
+        '''Waits for running calls, then unmaps the file'''
+        if self._pending:
+            await asyncio.wait([asyncio.wrap_future(f) for f in self._pending])
+        if self._grb is not None:
+            self._grb.close()
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+
+def open(path, index=None, executor=None, max_workers=None, limit=None):
+    '''AsyncGribFile of path, for `async with` or `await`'''
+    return AsyncGribFile(path, index, executor, max_workers, limit)
+
+
+async def scan(path, executor=None):
+    '''wgrib.scan on an executor (the loop's default one if None)'''
+    return await asyncio.get_running_loop().run_in_executor(executor, _scan,
+                                                            path)
+
+
+async def call_wgrib(args, executor=None):
+    '''wgrib.call_wgrib on an executor, returns (stdout, stderr)'''
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, check_wgrib_output, list(args))
@@ -0,0 +1,201 @@
+"""
+Decoding many records on a process pool
+
+batch_decode() shards (file, record) requests over worker processes.  The
+parent allocates a single multiprocessing.shared_memory block sized from
+the inventories, the workers unpack straight into their slices of it and
+only send back record numbers, so no array is pickled or copied between
+processes.  Requires Python 3.8 or later.
+"""
+from __future__ import print_function, unicode_literals
+
+import mmap
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy
+
+from .gribfile import GribFile, _shape
+from .wgrib import unpack as _unpack
+
+_ALIGN = 64  # keep every field cache line aligned
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13, forked/spawned workers share the parent's tracker
+        return shared_memory.SharedMemory(name=name)
+
+
+class _Block(shared_memory.SharedMemory):
+    '''Shared memory whose fields may outlive close()'''
+
+    def close(self):
+        try:
+            super(_Block, self).close()
+        except BufferError:
+            # fields still alive keep the mapping, which is unmapped with
+            # the last of them; the descriptor is not needed any more
+            if getattr(self, '_fd', -1) >= 0:
+                os.close(self._fd)
+                self._fd = -1
+
+
+def _decode_chunk(task):
+    '''Worker: decodes [(i, offset, start, nxny), ...] of one file into shm'''
+    name, path, items = task
+    shm = _attach(name)
+    try:
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            view = memoryview(mapping)
+            try:
+                for i, offset, start, nxny in items:
+                    out = numpy.ndarray(nxny, dtype=numpy.float32,
+                                        buffer=shm.buf, offset=start)
+                    message = view[offset:]
+                    try:
+                        _unpack(message, out)
+                    finally:
+                        message.release()
+                    del out
+            finally:
+                view.release()
+        finally:
+            mapping.close()
+    finally:
+        shm.close()
+    return [item[0] for item in items]
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class BatchResult(object):
+    '''Fields decoded by batch_decode, views of one shared memory block
+
+    Work starts as soon as the result is created.  Iterating yields the
+    fields in request order, waiting for each one; as_completed() yields
+    (index, field) pairs in the order the workers finish them.  close()
+    removes the block; fields still referenced after it stay valid and
+    their memory is freed with the last of them.
+    '''
+
+    def __init__(self, requests, workers=None, chunksize=None):
+        layout, size, by_path = [], 0, {}
+        for i, (path, record) in enumerate(requests):
+            path = os.path.abspath(path)
+            if path not in by_path:
+                with GribFile(path) as grb:
+                    by_path[path] = (grb.records.copy(), [])
+            info = by_path[path][0][record]
+            nxny = int(info['nxny'])
+            layout.append((size, _shape(info)))
+            by_path[path][1].append((i, int(info['offset']), size, nxny))
+            size += -(-nxny * 4 // _ALIGN) * _ALIGN
+
+        self._shm = _Block(create=True, size=max(size, 1))
+        # frombuffer keeps the mapping exported while any field is alive
+        self.fields = [numpy.frombuffer(self._shm.buf, dtype=numpy.float32,
+                                        count=int(numpy.prod(shape)),
+                                        offset=start).reshape(shape)
+                       for start, shape in layout]
+        self._done = [False] * len(self.fields)
+        self._finished = []  # indices in the order their chunks came back
+        self._pending = len(self.fields)
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if chunksize is None:
+            chunksize = max(1, len(self.fields) // (4 * workers))
+        tasks = [(self._shm.name, path, chunk)
+                 for path, (_, items) in by_path.items()
+                 for chunk in _chunks(items, chunksize)]
+        processes = min(workers, max(len(tasks), 1))
+        try:
+            self._pool = multiprocessing.Pool(processes)
+        except BaseException:
+            # e.g. a process or descriptor limit: do not leak the block
+            self._pool = None
+            self.close()
+            raise
+        self._results = self._pool.imap_unordered(_decode_chunk, tasks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __getitem__(self, i):
+        '''i'th decoded field, waits until it is available'''
+        while not self._done[i]:
+            self._next()
+        return self.fields[i]
+
+    def __iter__(self):
+        for i in range(len(self.fields)):
+            yield self[i]
+
+    def _next(self):
+        done = next(self._results)
+        for i in done:
+            self._done[i] = True
+        self._finished.extend(done)
+        self._pending -= len(done)
+        if self._pending == 0:
+            self._pool.close()
+        return done
+
+    def as_completed(self):
+        '''Yields (index, field) as the workers finish them'''
+        # fields finished by self[i] or wait() in between are yielded too
+        n = 0
+        while True:
+            while n < len(self._finished):
+                i = self._finished[n]
+                n += 1
+                yield i, self.fields[i]
+            if not self._pending:
+                return
+            self._next()
+
+    def wait(self):
+        '''Blocks until all fields are decoded, returns self'''
+        while self._pending:
+            self._next()
+        return self
+
+    def close(self):
+        '''Stops the workers and removes the shared memory block'''
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        if self._shm is not None:
+            shm, self._shm = self._shm, None
+            self.fields = []
+            shm.unlink()
+            shm.close()
+
+
+def batch_decode(requests, workers=None, chunksize=None):
+    '''Decodes (path, record number) pairs on a pool of worker processes
+
+    Returns a BatchResult of float32 arrays (NaN where missing) in shared
+    memory, see GribFile.read for their layout.
+
+    >>> with batch_decode([('gfs.grb', 0), ('gfs.grb', 5)], workers=4) as res:
+    ...     for field in res:
+    ...         print(field.mean())
+    '''
+    return BatchResult(list(requests), workers, chunksize)
@@ -0,0 +1,251 @@
+"""
+Host-wide cache of decoded fields in shared memory
+
+Processes that enable the same cache (by name) share decoded fields: each
+field is a named shared memory block and a small directory block lists
+them with their size and last use, under a file lock.  GribFile.read and
+decode() look fields up by (device, inode, size, mtime, offset) before
+unpacking and publish them afterwards.  The least recently used fields are
+evicted to stay under the size limit; a process still copying out an
+evicted field keeps its mapping, so eviction never pulls memory from
+under a reader.  Requires Python 3.8+ on a POSIX system.
+"""
+from __future__ import print_function, unicode_literals
+
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy
+
+from . import gribfile
+
+_MAGIC = 0x77677269  # 'wgri'
+_HEADER = numpy.dtype([(str(name), numpy.int64) for name in (
+    'magic', 'capacity', 'max_bytes', 'nbytes', 'clock',
+    'hits', 'misses', 'inserts', 'evictions')])
+_SLOT = numpy.dtype([
+    (str('key'), 'S32'),      # blake2b hex digest of the key, empty if free
+    (str('nbytes'), numpy.int64),
+    (str('used'), numpy.int64),   # clock at last use
+    (str('shape'), numpy.int64, (2,)),  # (ny, nx), or (n, -1)
+])
+
+
+def _shm(name, size=0):
+    '''SharedMemory that outlives this process (not resource tracked)'''
+    create = size > 0
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size,
+                                          track=False)
+    except TypeError:
+        # Python < 3.13: stop the tracker from unlinking it at exit
+        shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _unlink(name):
+    try:
+        try:
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # registered here and unregistered again by unlink()
+            block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+class SharedCache(object):
+    '''Decoded fields shared by the processes of a host
+
+    `max_bytes` and `capacity` (number of fields) are fixed by the first
+    process to create the cache `name`; later ones attach to it.
+    '''
+
+    def __init__(self, name='wgrib', max_bytes=1 << 30, capacity=4096):
+        self.name = name
+        self._lock = threading.Lock()
+        lock_path = os.path.join(tempfile.gettempdir(),
+                                 '{}.cache.lock'.format(name))
+        self._lock_file = open(lock_path, 'a+b')
+        size = _HEADER.itemsize + capacity * _SLOT.itemsize
+        with self._locked():
+            try:
+                self._dir = _shm('{}_dir'.format(name))
+            except FileNotFoundError:
+                self._dir = _shm('{}_dir'.format(name), size)
+                header = numpy.ndarray((), _HEADER, self._dir.buf)
+                header[...] = 0
+                header['capacity'] = capacity
+                header['max_bytes'] = max_bytes
+                numpy.ndarray(capacity, _SLOT, self._dir.buf,
+                              _HEADER.itemsize)[...] = numpy.zeros(1, _SLOT)
+                header['magic'] = _MAGIC
+        self._header = numpy.ndarray((), _HEADER, self._dir.buf)
+        if int(self._header['magic']) != _MAGIC:
+            raise ValueError('{!r} is not a wgrib cache'.format(name))
+        self._slots = numpy.ndarray(int(self._header['capacity']), _SLOT,
+                                    self._dir.buf, _HEADER.itemsize)
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.blake2b(repr(key).encode('ascii'),
+                               digest_size=16).hexdigest().encode('ascii')
+
+    def _block(self, digest):
+        return '{}_{}'.format(self.name, digest.decode('ascii'))
+
+    def _find(self, digest):
+        found = numpy.flatnonzero(self._slots['key'] == digest)
+        return int(found[0]) if len(found) else -1
+
+    def _tick(self):
+        self._header['clock'] += 1
+        return self._header['clock']
+
+    def get(self, key, out=None):
+        '''Copy of the field of key (into out if given), or None'''
+        digest = self._digest(key)
+        with self._locked():
+            i = self._find(digest)
+            if i < 0:
+                self._header['misses'] += 1
+                return None
+            slot = self._slots[i]
+            # attach under the lock, the block may be unlinked right after
+            try:
+                block = _shm(self._block(digest))
+            except FileNotFoundError:
+                # removed behind the cache's back: free the slot so that
+                # the field can be published again
+                self._free(slot)
+                self._header['misses'] += 1
+                return None
+            slot['used'] = self._tick()
+            self._header['hits'] += 1
+            shape = tuple(int(n) for n in slot['shape'] if n >= 0)
+        try:
+            field = numpy.ndarray(shape, numpy.float32, block.buf)
+            if out is None:
+                out = field.copy()
+            else:
+                out[...] = field
+            del field
+        finally:
+            block.close()
+        return out
+
+    def put(self, key, field):
+        '''Publishes a decoded field, evicting old ones to make room'''
+        field = numpy.ascontiguousarray(field, dtype=numpy.float32)
+        nbytes = max(field.nbytes, 1)
+        digest = self._digest(key)
+        with self._locked():
+            if nbytes > self._header['max_bytes'] or self._find(digest) >= 0:
+                return False
+            free = numpy.flatnonzero(self._slots['key'] == b'')
+            while (self._header['nbytes'] + nbytes > self._header['max_bytes']
+                   or not len(free)):
+                self._evict()
+                free = numpy.flatnonzero(self._slots['key'] == b'')
+            name = self._block(digest)
+            try:
+                block = _shm(name, nbytes)
+            except FileExistsError:
+                # left over by a process that died while publishing
+                _unlink(name)
+                block = _shm(name, nbytes)
+            try:
+                numpy.ndarray(field.shape, numpy.float32, block.buf)[...] = field
+            finally:
+                block.close()
+            slot = self._slots[free[0]]
+            slot['shape'] = (field.shape + (-1, -1))[:2]
+            slot['nbytes'] = nbytes
+            slot['used'] = self._tick()
+            slot['key'] = digest
+            self._header['nbytes'] += nbytes
+            self._header['inserts'] += 1
+        return True
+
+    def _evict(self):
+        '''Drops the least recently used field (lock held)'''
+        used = numpy.flatnonzero(self._slots['key'] != b'')
+        if not len(used):
+            return
+        i = used[numpy.argmin(self._slots['used'][used])]
+        slot = self._slots[i]
+        _unlink(self._block(bytes(slot['key'])))
+        self._free(slot)
+        self._header['evictions'] += 1
+
+    def _free(self, slot):
+        '''Empties a slot (lock held)'''
+        self._header['nbytes'] -= slot['nbytes']
+        slot['key'] = b''
+        slot['nbytes'] = 0
+
+    def clear(self):
+        '''Evicts every field'''
+        with self._locked():
+            while (self._slots['key'] != b'').any():
+                self._evict()
+
+    @property
+    def stats(self):
+        '''Host-wide counters of the cache'''
+        with self._locked():
+            stats = dict((name, int(self._header[name])) for name in (
+                'max_bytes', 'nbytes', 'hits', 'misses', 'inserts',
+                'evictions'))
+            stats['fields'] = int((self._slots['key'] != b'').sum())
+        return stats
+
+    def close(self):
+        '''Detaches this process, the cached fields stay'''
+        self._header = self._slots = None
+        self._dir.close()
+        self._lock_file.close()
+
+    def destroy(self):
+        '''Evicts everything and removes the cache from the host'''
+        self.clear()
+        name = self._dir.name
+        self.close()
+        _unlink(name)
+
+
+def enable(name='wgrib', max_bytes=1 << 30, capacity=4096):
+    '''Makes GribFile.read and decode() use the shared cache `name`'''
+    disable()
+    gribfile.shared_cache = SharedCache(name, max_bytes, capacity)
+    return gribfile.shared_cache
+
+
+def disable():
+    '''Stops using the shared cache in this process'''
+    cache, gribfile.shared_cache = gribfile.shared_cache, None
+    if cache is not None:
+        cache.close()
+
+
+def stats():
+    '''Counters of the enabled cache, None if disabled'''
+    cache = gribfile.shared_cache
+    return None if cache is None else cache.stats
@@ -0,0 +1,269 @@
+"""
+Lazy multi-dimensional view of GRIB files
+
+open_dataset() groups the records of one or more files into variables,
+one per parameter (plus level type and time range indicator when a name
+is used with several), each a (time, level, member, y, x) array built
+from the inventory only.  Indexing a variable decodes just the records it
+touches; decoded fields are kept in an LRU cache bounded in bytes and
+shared by all variables of the dataset.
+"""
+from __future__ import print_function, unicode_literals
+
+import threading
+from collections import OrderedDict
+
+import numpy
+
+from .gribfile import GribFile
+from .tables import registry, forecast_hours
+
+DIMS = ('time', 'level', 'member', 'y', 'x')
+
+
+class FieldCache(object):
+    '''LRU of decoded fields holding at most `max_bytes`'''
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = self.misses = 0
+        self._fields = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        '''Cached field of key, or load() and cache it'''
+        with self._lock:
+            field = self._fields.pop(key, None)
+            if field is not None:
+                self._fields[key] = field
+                self.hits += 1
+                return field
+            self.misses += 1
+        field = load()
+        if field.nbytes <= self.max_bytes:
+            with self._lock:
+                if key not in self._fields:
+                    self._fields[key] = field
+                    self.nbytes += field.nbytes
+                while self.nbytes > self.max_bytes:
+                    self.nbytes -= self._fields.popitem(last=False)[1].nbytes
+        return field
+
+    def clear(self):
+        with self._lock:
+            self._fields.clear()
+            self.nbytes = 0
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'fields': len(self._fields), 'nbytes': self.nbytes}
+
+
+def _valid_times(records):
+    '''Verification time of records as datetime64[m] (as verf_time)'''
+    date = numpy.asarray(records['date'], dtype=numpy.int64)
+    year, month = date // 1000000, date // 10000 % 100
+    day, hour = date // 100 % 100, date % 100
+    months = (year - 1970) * 12 + month - 1
+    base = months.astype('datetime64[M]').astype('datetime64[m]')
+    minutes = numpy.nan_to_num(forecast_hours(records) * 60.0)
+    minutes = numpy.round(minutes).astype(numpy.int64) + \
+        ((day - 1) * 24 + hour) * 60 + numpy.asarray(records['minute'])
+    return base + minutes.astype('timedelta64[m]')
+
+
+class Variable(object):
+    '''Lazy float32 array of one parameter, dims (time, level, member, y, x)
+    or (time, level, member, point) for grids that are not regular
+
+    Integer, slice and integer-list indices are supported on every
+    dimension, lists index each dimension independently.  Times, levels or
+    members without a record read as NaN.
+    '''
+
+    def __init__(self, dataset, name, param, coords, index, shape):
+        self.name = name
+        self.description = param.description
+        self.units = param.units
+        self.coords = coords
+        self.dims = DIMS if len(shape) == 2 else DIMS[:3] + ('point',)
+        self.dtype = numpy.dtype(numpy.float32)
+        self.shape = tuple(len(coords[d]) for d in DIMS[:3]) + tuple(shape)
+        self._dataset = dataset
+        self._index = index  # (time, level, member) -> dataset record or -1
+
+    def __repr__(self):
+        return '<Variable {} {} [{}]>'.format(
+            self.name, dict(zip(self.dims, self.shape)), self.units)
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(numpy.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __array__(self, dtype=None):
+        data = self[...]
+        return data if dtype is None else data.astype(dtype)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + \
+                key[i + 1:]
+        if len(key) > self.ndim:
+            raise IndexError('too many indices for a {}-d variable'.format(
+                self.ndim))
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        axes = [numpy.arange(n)[k] for k, n in zip(key, self.shape)]
+        outer = [numpy.atleast_1d(a) for a in axes]
+        index = self._index[numpy.ix_(*outer[:3])]
+        field_key = numpy.ix_(*outer[3:])
+        out = numpy.empty(tuple(len(a) for a in outer), dtype=numpy.float32)
+        for pos in numpy.ndindex(*index.shape):
+            record = index[pos]
+            if record < 0:
+                out[pos] = numpy.nan
+            else:
+                out[pos] = self._dataset._field(record)[field_key]
+        # integer indices drop their dimension
+        drop = tuple(i for i, a in enumerate(axes) if numpy.ndim(a) == 0)
+        return out.reshape(tuple(n for i, n in enumerate(out.shape)
+                                 if i not in drop))
+
+
+class Dataset(object):
+    '''Variables of a set of GRIB files, see open_dataset'''
+
+    def __init__(self, paths, cache_bytes=256 << 20, index=None):
+        if isinstance(paths, (type(''), bytes)) or \
+                not hasattr(paths, '__iter__'):
+            paths = [paths]
+        self.files = [GribFile(path, index=index) for path in paths]
+        self.cache = FieldCache(cache_bytes)
+        self.variables = OrderedDict()
+        if not self.files:
+            return
+
+        self.records = numpy.concatenate([grb.records for grb in self.files])
+        self._file = numpy.concatenate([numpy.full(len(grb), i, dtype=numpy.intp)
+                                        for i, grb in enumerate(self.files)])
+        self._number = numpy.concatenate([numpy.arange(len(grb))
+                                          for grb in self.files])
+        self._group(self.records)
+
+    def _group(self, records):
+        names = registry.params(records)
+        times = _valid_times(records)
+        levels = registry.levels(records)
+        groups = OrderedDict()
+        columns = zip(names.tolist(), records['kpds6'].tolist(),
+                      records['time_range'].tolist(), records['nx'].tolist(),
+                      records['ny'].tolist(), records['nxny'].tolist())
+        for i, (name, kpds6, time_range, nx, ny, nxny) in enumerate(columns):
+            shape = (ny, nx) if nx > 0 and ny > 0 and nx * ny == nxny \
+                else (nxny,)
+            groups.setdefault((name, kpds6, time_range, shape), []).append(i)
+        # names shared by several groups get the level type and time
+        # range, then the grid shape
+        labels = [(key[0], '{}_{}_{}'.format(*key[:3]),
+                   '{}_{}_{}_{}'.format(key[0], key[1], key[2],
+                                        'x'.join(map(str, key[3]))))
+                  for key in groups]
+        counts = {}
+        for label in labels:
+            for name in label[:2]:
+                counts[name] = counts.get(name, 0) + 1
+
+        for label, (key, rows) in zip(labels, groups.items()):
+            shape = key[3]
+            name = next((n for n in label[:2] if counts[n] == 1), label[2])
+            rows = numpy.array(rows)
+            sub = records[rows]
+            time_axis, t = numpy.unique(times[rows], return_inverse=True)
+            level_axis, l = numpy.unique(sub['kpds7'], return_inverse=True)
+            member_axis, m = numpy.unique(sub['member'], return_inverse=True)
+            first = rows[numpy.unique(l.reshape(-1), return_index=True)[1]]
+            coords = {
+                'time': time_axis,
+                'level': numpy.array([levels[i] for i in first], dtype=object),
+                'member': member_axis,
+            }
+            index = numpy.full((len(time_axis), len(level_axis),
+                                len(member_axis)), -1, dtype=numpy.intp)
+            # duplicates keep the first record
+            for r, ti, li, mi in zip(rows[::-1], t.reshape(-1)[::-1],
+                                     l.reshape(-1)[::-1], m.reshape(-1)[::-1]):
+                index[ti, li, mi] = r
+            sample = records[rows[0]]
+            param = registry.param(sample['center'], sample['subcenter'],
+                                   sample['table'], sample['process'],
+                                   sample['kpds5'])
+            self.variables[name] = Variable(self, name, param, coords, index,
+                                            shape)
+
+    def _field(self, record):
+        '''Decoded field of a dataset record, through the cache'''
+        grb = self.files[self._file[record]]
+        number = int(self._number[record])
+        return self.cache.get((int(self._file[record]), number),
+                              lambda: grb.read(number))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __getitem__(self, name):
+        return self.variables[name]
+
+    def __iter__(self):
+        return iter(self.variables)
+
+    def __len__(self):
+        return len(self.variables)
+
+    def __contains__(self, name):
+        return name in self.variables
+
+    def __repr__(self):
+        return '<Dataset files={} variables={}>'.format(
+            len(self.files), list(self.variables))
+
+    def keys(self):
+        return self.variables.keys()
+
+    def close(self):
+        '''Drops the cache and closes the files'''
+        self.cache.clear()
+        for grb in self.files:
+            grb.close()
+
+
+def open_dataset(paths, cache_bytes=256 << 20, index=None):
+    '''Lazy Dataset of one or more GRIB files
+
+    >>> ds = wgrib.open_dataset(['gfs.f000.grb', 'gfs.f006.grb'])
+    >>> tmp = ds['TMP']                       # nothing decoded yet
+    >>> tmp.coords['level']
+    >>> field = tmp[1, 3, 0]                  # decodes one record
+    >>> box = tmp[:, 3, 0, 100:200, 300:400]  # one record per time
+
+    `cache_bytes` bounds the decoded fields kept between reads.
+    '''
+    return Dataset(paths, cache_bytes, index)
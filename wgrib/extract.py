@@ -0,0 +1,177 @@
+"""
+Copying the records that match a selection into a new GRIB file
+
+extract() does what `wgrib -s file | grep ... | wgrib -i -grib file`
+does, without the text round trip and the second pass over the data:
+the selection runs on the inventory (from the sidecar index when there is
+one), adjacent matching messages are merged into one byte range and the
+ranges are copied from file to file by the kernel (copy_file_range, or
+sendfile), so the data never pass through Python.  Only when neither
+call works on the files involved are the bytes read and written in
+chunks.
+"""
+from __future__ import print_function, unicode_literals
+
+import errno
+import os
+
+import numpy
+
+from .gribfile import _match
+from .index import read_index, write_index
+from .inventory import scan, RECORD_DTYPE
+
+_CHUNK = 1 << 20
+
+# errors meaning "not for these files", try the next way of copying
+_UNSUPPORTED = set(getattr(errno, name) for name in (
+    'EXDEV', 'ENOSYS', 'EINVAL', 'EOPNOTSUPP', 'ENOTSUP', 'EPERM', 'EBADF')
+    if hasattr(errno, name))
+
+
+def _copy_file_range(src, dst, offset, count):
+    return os.copy_file_range(src, dst, count, offset)
+
+
+def _sendfile(src, dst, offset, count):
+    return os.sendfile(dst, src, offset, count)
+
+
+def _pread(src, dst, offset, count):
+    data = memoryview(os.pread(src, min(count, _CHUNK), offset))
+    done = 0
+    while done < len(data):
+        done += os.write(dst, data[done:])
+    return done
+
+
+def _copies():
+    '''Ways of copying available here, fastest first'''
+    return [copy for name, copy in (('copy_file_range', _copy_file_range),
+                                    ('sendfile', _sendfile),
+                                    ('pread', _pread))
+            if hasattr(os, name)]
+
+
+def _ranges(offset, length):
+    '''(offset, length) of the runs of back to back messages'''
+    if not len(offset):
+        return []
+    end = offset + length
+    start = numpy.flatnonzero(numpy.r_[True, offset[1:] != end[:-1]])
+    stop = numpy.r_[start[1:], len(offset)] - 1
+    return list(zip(offset[start].tolist(), (end[stop] - offset[start]).tolist()))
+
+
+def _copy_ranges(src, dst, ranges, copies):
+    '''Appends the byte ranges of src (fd) at the position of dst (fd)'''
+    for offset, length in ranges:
+        while length:
+            try:
+                n = copies[0](src, dst, offset, length)
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED or len(copies) == 1:
+                    raise
+                copies.pop(0)
+                continue
+            if n == 0:
+                raise EOFError('GRIB file truncated at offset {}'.format(
+                    offset))
+            offset += n
+            length -= n
+
+
+def _inventory(path, index):
+    st = os.stat(path)
+    records = read_index(path, st) if index is None or index else None
+    if records is None:
+        records = scan(path)
+        if index:
+            write_index(path, records, st)
+    return records
+
+
+def extract(sources, dst, where=None, append=False, index=None, param=None,
+            level=None, fcst=None, **fields):
+    '''Copies the matching records of one or more GRIB files into dst
+
+    >>> wgrib.extract(sorted(glob.glob('gfs.*.grb')), 'tmp500.grb',
+    ...               param='TMP', level='500 mb')
+    >>> wgrib.extract('gfs.grb', 'uv.grb',
+    ...               where=lambda r: numpy.isin(r.kpds5, (33, 34)))
+
+    A record is copied if it matches all the keys (as GribFile.select)
+    and `where`, a function of the inventory of each file returning a
+    boolean mask or row numbers.  Records are written in file order,
+    sources in the order given.  `dst` is a path (truncated unless
+    `append`) or a binary file object open for writing.
+
+    Returns the inventory of the records written, with their offsets in
+    dst.  The sidecar indexes of the sources are used when up to date
+    (see GribFile); with `index` True missing ones are built and the
+    inventory is also saved as the sidecar index of dst.
+    '''
+    if isinstance(sources, (type(''), bytes)) or \
+            not hasattr(sources, '__iter__'):
+        sources = [sources]
+    sources = [os.path.abspath(path) for path in sources]
+
+    if hasattr(dst, 'fileno'):
+        dst.flush()
+        fd, path = dst.fileno(), None
+    else:
+        path = os.path.abspath(dst)
+        if os.path.exists(path) and \
+                any(os.path.samefile(path, src) for src in sources):
+            raise ValueError('{} is also a source'.format(dst))
+        flags = os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+        if not append:
+            flags |= os.O_TRUNC
+        # the index of dst is only kept up to date if it was before
+        previous = numpy.empty(0, dtype=RECORD_DTYPE)
+        if append and os.path.exists(path) and os.path.getsize(path):
+            previous = read_index(path) if index else None
+        fd = os.open(path, flags, 0o666)
+    copies = _copies()
+    written = []
+    try:
+        position = os.lseek(fd, 0, os.SEEK_END if path else os.SEEK_CUR)
+        for src in sources:
+            records = _inventory(src, index)
+            columns = {}
+
+            def key(name, func):
+                if name not in columns:
+                    columns[name] = func(records)
+                return columns[name]
+
+            match = _match(records, key, param, level, fcst, fields)
+            if where is not None:
+                selected = numpy.asarray(where(records))
+                if selected.dtype != bool:
+                    mask = numpy.zeros(len(records), dtype=bool)
+                    mask[selected] = True
+                    selected = mask
+                match &= selected
+            rows = numpy.array(records[match])
+            if not len(rows):
+                continue
+            offset = numpy.asarray(rows['offset'], dtype=numpy.int64)
+            length = numpy.asarray(rows['length'], dtype=numpy.int64)
+            with open(src, 'rb') as f:
+                _copy_ranges(f.fileno(), fd, _ranges(offset, length), copies)
+            rows['offset'] = position + numpy.r_[0, numpy.cumsum(length)[:-1]]
+            position += int(length.sum())
+            written.append(rows)
+    finally:
+        if path is None:
+            dst.seek(os.lseek(fd, 0, os.SEEK_CUR))
+        else:
+            os.close(fd)
+
+    records = numpy.concatenate(written) if written else \
+        numpy.empty(0, dtype=RECORD_DTYPE)
+    records = records.view(numpy.recarray)
+    if index and path is not None and previous is not None:
+        write_index(path, numpy.concatenate([previous, records]))
+    return records
@@ -0,0 +1,393 @@
+"""
+Memory-mapped GRIB file reader
+
+The file is mapped once and records are located by scanning the mapped
+bytes.  Every record and section handed out is a memoryview slice into the
+mapping, so nothing is copied and processes opening the same file share
+the page cache.  Data values are unpacked straight from the mapping into
+float32 arrays with the GIL released.
+"""
+from __future__ import print_function, unicode_literals
+
+import mmap
+import os
+
+import numpy
+
+from .index import read_index, write_index
+from .inventory import RECORD_DTYPE
+from .tables import param_names, level_texts, forecast_hours
+from .wgrib import scan_buffer as _scan_buffer, record_info as _record_info, \
+    unpack as _unpack, unpack_window as _unpack_window, \
+    latlon_grid as _latlon_grid, unpack_threads as _unpack_threads
+
+
+def _len24(section):
+    return (section[0] << 16) + (section[1] << 8) + section[2]
+
+
+def _shape(info):
+    '''(ny, nx) for regular grids, (nxny,) otherwise'''
+    nx, ny, nxny = int(info['nx']), int(info['ny']), int(info['nxny'])
+    if nx > 0 and ny > 0 and nx * ny == nxny:
+        return (ny, nx)
+    return (nxny,)
+
+
+def _latlons(message, shape):
+    '''Latitudes of the rows and longitudes of the columns (degrees)'''
+    grid = _latlon_grid(message)
+    if grid is None or len(shape) != 2:
+        raise ValueError('lat/lon windows need a regular lat/lon grid')
+    nx, ny, la1, lo1, la2, lo2, dx, dy, scan = grid
+    if scan & 32:
+        raise ValueError('lat/lon windows need grids stored by rows')
+    lats = numpy.linspace(la1, la2, ny) / 1000.0
+    if scan & 128:
+        span = -((lo1 - lo2) % 360000)
+    else:
+        span = (lo2 - lo1) % 360000
+    lons = (lo1 + numpy.linspace(0, span, nx)) / 1000.0
+    return lats, lons
+
+
+def _runs(cols):
+    '''Splits column numbers into (start, count, stride) runs'''
+    runs, i = [], 0
+    while i < len(cols):
+        stride = int(cols[i + 1] - cols[i]) if i + 1 < len(cols) else 1
+        if stride <= 0:
+            stride = 1
+            n = 1
+        else:
+            n = 1
+            while i + n < len(cols) and cols[i + n] - cols[i + n - 1] == stride:
+                n += 1
+        runs.append((int(cols[i]), n, stride))
+        i += n
+    return runs
+
+
+def _window(message, info, lat=None, lon=None, step=None):
+    '''(rows, cols) of a lat/lon box and/or stride, in storage order'''
+    shape = _shape(info)
+    if len(shape) != 2:
+        raise ValueError('windows need a regular grid')
+    ny, nx = shape
+    sy, sx = step if step is not None else (1, 1)
+    if sy <= 0 or sx <= 0:
+        raise ValueError('step must be positive')
+    rows, cols = numpy.arange(ny), numpy.arange(nx)
+    if lat is not None or lon is not None:
+        lats, lons = _latlons(message, shape)
+        if lat is not None:
+            south, north = min(lat), max(lat)
+            rows = rows[(lats >= south - 1e-6) & (lats <= north + 1e-6)]
+        if lon is not None:
+            west, east = lon
+            width = east - west
+            offset = (lons - west) % 360.0
+            if width < 360.0:
+                # (350, 10) wraps around, order columns from west to east
+                keep = offset <= width % 360.0 + 1e-6
+                cols = cols[keep][numpy.argsort(offset[keep], kind='stable')]
+    return rows[::sy], cols[::sx]
+
+
+def _decode_window(message, info, out, lat, lon, step):
+    rows, cols = _window(message, info, lat, lon, step)
+    shape = (len(rows), len(cols))
+    if out is None:
+        out = numpy.empty(shape, dtype=numpy.float32)
+    elif (out.dtype != numpy.float32 or not out.flags.c_contiguous
+            or out.shape != shape):
+        raise ValueError('out must be a C-contiguous float32 array '
+                         'of shape {}'.format(shape))
+    if not out.size:
+        return out
+    (j0, nj, sj), = _runs(rows)  # rows are always evenly spaced
+    nx = _shape(info)[1]
+    start = 0
+    for i0, ni, si in _runs(cols):
+        part = out if ni == len(cols) else \
+            numpy.empty((nj, ni), dtype=numpy.float32)
+        if _unpack_window(message, part, nx, j0, nj, sj, i0, ni, si) is None:
+            break
+        if part is not out:
+            out[:, start:start + ni] = part
+        start += ni
+    else:
+        return out
+    # spectral or wider than 32 bits: decode all and pick the points
+    out[...] = _decode(message, info)[numpy.ix_(rows, cols)]
+    return out
+
+
+def set_unpack_threads(threads, min_points=None):
+    '''Splits the unpacking of each field of at least `min_points` points
+    (default 2**20, or unchanged) over `threads` native threads, 0 for one
+    per CPU, 1 (the default) to always unpack on the calling thread
+
+    Applies to GribFile.read, decode() and everything built on them for
+    whole fields (not windows); the values are the same as unpacked
+    serially.  Returns the previous (threads, min_points).
+    '''
+    if threads == 0:
+        threads = (os.cpu_count() if hasattr(os, 'cpu_count') else None) or 1
+    elif threads < 0:
+        raise ValueError('threads must be >= 0')
+    return _unpack_threads(threads, -1 if min_points is None else min_points)
+
+
+# SharedCache used by GribFile.read and decode(), see wgrib.cache.enable
+shared_cache = None
+
+
+def _decode_shared(key, message, info, out=None, masked=False, lat=None,
+                   lon=None, step=None):
+    '''_decode through the shared cache of decoded fields, if enabled'''
+    cache = shared_cache
+    if cache is None or lat is not None or lon is not None or step is not None:
+        return _decode(message, info, out, masked, lat, lon, step)
+    out = _field_out(out, info)
+    field = out.reshape(_shape(info))
+    if cache.get(key, field) is None:
+        _unpack(message, out)
+        cache.put(key, field)
+    if masked:
+        return numpy.ma.masked_invalid(out, copy=False)
+    return out
+
+
+def _file_key(st):
+    '''Identity of an open file's contents'''
+    return (st.st_dev, st.st_ino, st.st_size,
+            getattr(st, 'st_mtime_ns', st.st_mtime))
+
+
+def _field_out(out, info):
+    '''Checks out for a whole field, or makes a new array'''
+    if out is None:
+        return numpy.empty(_shape(info), dtype=numpy.float32)
+    if (out.dtype != numpy.float32 or not out.flags.c_contiguous
+            or out.size != int(info['nxny'])):
+        raise ValueError('out must be a C-contiguous float32 array '
+                         'of {} points'.format(int(info['nxny'])))
+    return out
+
+
+def _decode(message, info, out=None, masked=False, lat=None, lon=None,
+            step=None):
+    '''Unpacks message (or a window of it) into out (float32) or a new array'''
+    if lat is not None or lon is not None or step is not None:
+        out = _decode_window(message, info, out, lat, lon, step)
+    else:
+        out = _field_out(out, info)
+        _unpack(message, out)
+    if masked:
+        return numpy.ma.masked_invalid(out, copy=False)
+    return out
+
+
+def _match(records, key, param=None, level=None, fcst=None, fields={}):
+    '''Mask of the inventory rows matching all keys (see GribFile.select),
+    key(name, func) returns the column func(records), maybe cached'''
+    match = numpy.ones(len(records), dtype=bool)
+    if param is not None:
+        match &= key('param', param_names) == param
+    if level is not None:
+        match &= key('level', level_texts) == level
+    if fcst is not None:
+        match &= numpy.isclose(key('fcst', forecast_hours), fcst)
+    for name, value in fields.items():
+        if name not in RECORD_DTYPE.names:
+            raise TypeError('unknown record field {!r}'.format(name))
+        match &= records[name] == value
+    return match
+
+
+class Record(object):
+    '''A single GRIB message inside a GribFile'''
+    __slots__ = ('info', 'message')
+
+    def __init__(self, info, message):
+        self.info = info
+        self.message = message
+
+    def __repr__(self):
+        return '<Record offset={} kpds={},{},{} d={}>'.format(
+            self.offset, self.info['kpds5'], self.info['kpds6'],
+            self.info['kpds7'], self.info['date'])
+
+    def __getattr__(self, name):
+        if name in RECORD_DTYPE.names:
+            return self.info[name]
+        raise AttributeError(name)
+
+    def decode(self, out=None, masked=False, lat=None, lon=None, step=None):
+        '''Unpacks the data into a float32 array, see GribFile.read'''
+        return _decode(self.message, self.info, out, masked, lat, lon, step)
+
+    def latlon(self, lat=None, lon=None, step=None):
+        '''(latitudes, longitudes) of the rows and columns decode() returns'''
+        rows, cols = _window(self.message, self.info, lat, lon, step)
+        lats, lons = _latlons(self.message, _shape(self.info))
+        return lats[rows], lons[cols]
+
+    @property
+    def pds(self):
+        '''Product definition section'''
+        return self.message[8:8 + _len24(self.message[8:11])]
+
+    @property
+    def gds(self):
+        '''Grid description section or None'''
+        start = self.info['gds_offset']
+        if not start:
+            return None
+        return self.message[start:start + _len24(self.message[start:start + 3])]
+
+    @property
+    def bms(self):
+        '''Bit map section or None'''
+        start = self.info['bms_offset']
+        if not start:
+            return None
+        return self.message[start:start + _len24(self.message[start:start + 3])]
+
+    @property
+    def bds(self):
+        '''Binary data section (length taken from the ECMWF large record hack if needed)'''
+        start = self.info['bds_offset']
+        return self.message[start:start + self.info['bds_length']]
+
+
+class GribFile(object):
+    '''Memory-mapped, zero-copy GRIB (edition 1) file
+
+    >>> with GribFile('gfs.grb') as grb:
+    ...     for rec in grb:
+    ...         print(rec.offset, len(rec.bds))
+
+    The inventory is read from the sidecar index (path + '.wgrib.idx') if
+    there is one for the file's current size and mtime, else the file is
+    scanned.  With `index` True the sidecar is also written when it is
+    missing or stale; with False it is not used at all.
+    '''
+
+    def __init__(self, path, index=None):
+        self.path = os.path.abspath(path)
+        with open(self.path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if st.st_size:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._mmap = None  # cannot map empty files
+        self._view = memoryview(self._mmap if self._mmap is not None else b'')
+        self._file_key = _file_key(st)
+        self.records = read_index(self.path, st) \
+            if index is None or index else None
+        if self.records is None:
+            self.records = numpy.frombuffer(
+                _scan_buffer(self._view), dtype=RECORD_DTYPE).view(numpy.recarray)
+            if index:
+                write_index(self.path, self.records, st)
+        self._keys = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        for i in range(len(self.records)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        '''Returns the i'th Record'''
+        info = self.records[i]
+        start = int(info['offset'])
+        return Record(info, self._view[start:start + int(info['length'])])
+
+    def __repr__(self):
+        return '<GribFile {!r} records={}>'.format(self.path, len(self))
+
+    @property
+    def closed(self):
+        return self._view is None
+
+    def read(self, record, out=None, masked=False, lat=None, lon=None,
+             step=None):
+        '''Decodes a record (index or Record) into a float32 array
+
+        Values are in the order stored in the file, shaped (ny, nx) for
+        regular grids.  Points missing from the bitmap are NaN, or masked if
+        `masked` is True.  `out` may be a preallocated float32 array.
+
+        Only part of a regular grid is unpacked when `lat` and/or `lon`
+        ((min, max) degrees, lat/lon grids) or `step` ((sy, sx), every sy'th
+        row and sx'th column) are given; Record.latlon() gives the
+        coordinates of the window.
+        '''
+        if not isinstance(record, Record):
+            record = self[record]
+        return _decode_shared(self._file_key + (int(record.info['offset']),),
+                              record.message, record.info, out, masked, lat,
+                              lon, step)
+
+    def _key(self, name, func):
+        if name not in self._keys:
+            self._keys[name] = func(self.records)
+        return self._keys[name]
+
+    def select(self, param=None, level=None, fcst=None, **fields):
+        '''Returns the inventory rows matching all of the given keys
+
+        `param` is the parameter name ('TMP'), `level` the level as printed
+        in the inventory ('500 mb'), `fcst` the forecast hour and any other
+        keyword a RECORD_DTYPE field (kpds5=11, date=2017010100, ...).
+        The data are not read; use the `offset` of the result with
+        record_at() or decode().
+        '''
+        match = _match(self.records, self._key, param, level, fcst, fields)
+        return self.records[match]
+
+    def record_at(self, offset):
+        '''Returns the Record starting at byte offset'''
+        i = numpy.searchsorted(self.records.offset, offset)
+        if i == len(self.records) or self.records.offset[i] != offset:
+            raise KeyError('no GRIB record at offset {}'.format(offset))
+        return self[i]
+
+    def close(self):
+        '''Unmaps the file, or lets the last Record still using it do so'''
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # unmapped when the exporting Records are freed
+            self._mmap = None
+
+
+def decode(path, offset=0, out=None, masked=False, lat=None, lon=None,
+           step=None):
+    '''Decodes the GRIB record at byte offset of path, see GribFile.read'''
+    with open(path, 'rb') as f:
+        key = _file_key(os.fstat(f.fileno())) + (offset,)
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        view = memoryview(mapping)[offset:]
+        try:
+            info = numpy.frombuffer(_record_info(view), dtype=RECORD_DTYPE)[0]
+            return _decode_shared(key, view, info, out, masked, lat, lon, step)
+        finally:
+            view.release()
+    finally:
+        mapping.close()
@@ -0,0 +1,80 @@
+"""
+Persistent sidecar index of a GRIB file
+
+The inventory of `name.grb` is stored next to it as `name.grb.wgrib.idx`
+(a numpy .npz holding the record array and the size/mtime of the file it
+was built from), so reopening a large file does not rescan it.  A stale
+or unreadable index is ignored, and rebuilt by the callers that were asked
+to write one; failing to write one is not an error.
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import tempfile
+
+import numpy
+
+from .inventory import RECORD_DTYPE
+
+INDEX_SUFFIX = '.wgrib.idx'
+INDEX_VERSION = 2
+
+
+def index_path(path):
+    '''Sidecar index file name of path'''
+    return path + INDEX_SUFFIX
+
+
+def _stamp(st):
+    mtime_ns = getattr(st, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(st.st_mtime * 1e9)
+    return numpy.array([INDEX_VERSION, st.st_size, mtime_ns], dtype=numpy.int64)
+
+
+def read_index(path, st=None):
+    '''Returns the indexed records of path, or None if missing or stale'''
+    if st is None:
+        st = os.stat(path)
+    try:
+        with numpy.load(index_path(path), allow_pickle=False) as npz:
+            stamp, records = npz['stamp'], npz['records']
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+    if not numpy.array_equal(stamp, _stamp(st)) or records.dtype != RECORD_DTYPE:
+        return None
+    return records.view(numpy.recarray)
+
+
+def write_index(path, records, st=None):
+    '''Writes the sidecar index of path, returns False if it could not'''
+    if st is None:
+        st = os.stat(path)
+    dirname, basename = os.path.split(index_path(path))
+    try:
+        fd, tmp = tempfile.mkstemp(prefix=basename, suffix='.tmp',
+                                   dir=dirname or '.')
+    except (IOError, OSError):
+        return False  # read-only directory
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            numpy.savez(f, stamp=_stamp(st),
+                        records=numpy.asarray(records, dtype=RECORD_DTYPE))
+        _replace(tmp, index_path(path))
+    except (IOError, OSError):
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def _replace(src, dst):
+    '''Atomic rename over an existing file where possible'''
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
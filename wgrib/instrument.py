@@ -0,0 +1,105 @@
+"""
+Timing and counters of the extension's hot paths
+
+The extension counts, for all threads of the process, the time spent in
+each phase (seek_grib window scanning, echack, read_grib, the structured
+scan, text inventory formatting, unpacking and the dump writers), bytes
+read and written, records and values processed and record buffer
+reallocations.  Counting is off by default; while off each probe costs
+one test of a flag.
+
+    with wgrib.instrument.trace() as t:
+        wgrib.call_wgrib(['wgrib', 'gfs.grb', '-d', 'all', '-ieee'])
+    print(t.stats['unpack_ns'], t.stats['bytes_written'])
+"""
+from __future__ import print_function, unicode_literals
+
+from collections import namedtuple
+from contextlib import contextmanager
+
+from .wgrib import stats as _stats, stats_reset as _stats_reset, \
+    stats_enable as _stats_enable, set_record_hook as _set_record_hook
+
+PHASES = ('seek', 'echack', 'read', 'scan', 'inventory', 'unpack', 'write')
+
+RecordTrace = namedtuple('RecordTrace', ('number', 'offset', 'length') +
+                         tuple(phase + '_ns' for phase in PHASES))
+
+
+def enable(on=True):
+    '''Turns the counters on (or off), returns the previous state'''
+    return _stats_enable(bool(on))
+
+
+def disable():
+    '''Turns the counters off, returns the previous state'''
+    return _stats_enable(False)
+
+
+def enabled():
+    '''Whether the counters are on'''
+    return _stats()['enabled']
+
+
+def stats():
+    '''Counters since the last reset: `<phase>_ns` and `<phase>_calls` for
+    each of PHASES, bytes_read, bytes_written, records (of the wgrib
+    command), records_scanned, fields and values (unpacked) and
+    buffer_reallocs'''
+    return _stats()
+
+
+def reset():
+    '''Zeroes the counters'''
+    _stats_reset()
+
+
+def _delta(before, after):
+    return dict((key, value - before[key]) if key != 'enabled'
+                else (key, value) for key, value in after.items())
+
+
+class Trace(object):
+    '''Counters of a trace() block, in `stats` once the block has ended'''
+
+    def __init__(self):
+        self.stats = None
+        self._start = _stats()
+
+    def _stop(self):
+        self.stats = _delta(self._start, _stats())
+
+    def __repr__(self):
+        if self.stats is None:
+            return '<Trace running>'
+        return '<Trace {}>'.format(', '.join(
+            '{}={:.3f} ms'.format(phase, self.stats[phase + '_ns'] / 1e6)
+            for phase in PHASES if self.stats[phase + '_calls']))
+
+
+@contextmanager
+def trace():
+    '''Counts what runs inside the block (in any thread)'''
+    previous = enable()
+    t = Trace()
+    try:
+        yield t
+    finally:
+        t._stop()
+        enable(previous)
+
+
+@contextmanager
+def on_record(callback):
+    '''Calls callback(RecordTrace) after each record processed by the
+    wgrib command (main, capture, call_wgrib, Session) inside the block'''
+    def hook(number, offset, length, ns):
+        callback(RecordTrace(number, offset, length, *ns))
+
+    previous = enable()
+    previous_hook = _set_record_hook(hook)
+    try:
+        yield
+    finally:
+        _set_record_hook(previous_hook)
+        enable(previous)
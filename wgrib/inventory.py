@@ -0,0 +1,58 @@
+"""
+Structured inventory of GRIB files
+
+Walks the file in-process with seek_grib() and returns one row per record,
+without formatting or parsing any text.
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+
+import numpy
+
+from .wgrib import scan as _scan, RECORD_SIZE
+
+# must match struct grib_record in src/wgrib.h
+RECORD_DTYPE = numpy.dtype([
+    (str('offset'), numpy.int64),
+    (str('length'), numpy.int64),
+    (str('date'), numpy.int64),
+    (str('kpds5'), numpy.int32),
+    (str('kpds6'), numpy.int32),
+    (str('kpds7'), numpy.int32),
+    (str('time_range'), numpy.int32),
+    (str('p1'), numpy.int32),
+    (str('p2'), numpy.int32),
+    (str('time_unit'), numpy.int32),
+    (str('center'), numpy.int32),
+    (str('subcenter'), numpy.int32),
+    (str('process'), numpy.int32),
+    (str('table'), numpy.int32),
+    (str('grid'), numpy.int32),
+    (str('nx'), numpy.int32),
+    (str('ny'), numpy.int32),
+    (str('nxny'), numpy.int32),
+    (str('n_bits'), numpy.int32),
+    (str('has_bitmap'), numpy.int32),
+    (str('minute'), numpy.int32),
+    (str('gds_offset'), numpy.int32),
+    (str('bms_offset'), numpy.int32),
+    (str('bds_offset'), numpy.int32),
+    (str('bds_length'), numpy.int32),
+    (str('member'), numpy.int32),
+], align=True)
+
+assert RECORD_DTYPE.itemsize == RECORD_SIZE, 'wgrib extension out of date'
+
+
+def scan(path):
+    '''Returns a numpy record array with one row per GRIB record in path
+
+    `date` is the initial time as YYYYMMDDHH, `offset` and `length` are
+    the byte position and size of each message and the `*_offset` fields
+    locate the GDS/BMS/BDS inside the message (0 if not present).
+    `member` is the ensemble member (NCEP/ECMWF extensions), 0 for the
+    control run and for other records.
+    '''
+    raw = _scan(os.path.abspath(path))
+    return numpy.frombuffer(raw, dtype=RECORD_DTYPE).view(numpy.recarray)
@@ -1,6 +1,6 @@
 """
 Simple wrapper around main function in wgrib.c
-Compile wgrib.c with GRIB_MAIN=wgrib_main defined using c preprocessor
+Compile wgrib.c with GRIB_MAIN=wgrib defined using c preprocessor
 """
 from __future__ import print_function, unicode_literals
 
@@ -9,8 +9,6 @@ import io
 import os
 import sys
 import threading
-import time
-import sys
 
 from glob import glob
 from functools import wraps
@@ -22,9 +20,14 @@ except ImportError:
 
 class WGribSharedLib(object):
         '''Mocks wgrib C extension using ctypes'''
-        @staticmethod
-        def wgrib(args=sys.argv, version=None):
-            '''Use shared library/DLL to call wgrib'''
+        _mains = {}  # loaded once per version
+
+        @classmethod
+        def load(cls, version=None):
+            '''Returns the main function of the shared library/DLL'''
+            if version in cls._mains:
+                return cls._mains[version]
+
             _dir = os.path.abspath(os.path.dirname(__file__))
 
             if sys.platform.startswith('win'):
@@ -53,6 +56,14 @@ class WGribSharedLib(object):
             _main = _lib.wgrib
             _main.restype = ctypes.c_int
             _main.argtypes = [ctypes.c_int,  LP_LP_c_char]
+            cls._mains[version] = _main
+            return _main
+
+        @staticmethod
+        def wgrib(args=sys.argv, version=None):
+            '''Use shared library/DLL to call wgrib'''
+            _main = WGribSharedLib.load(version)
+            LP_c_char = ctypes.POINTER(ctypes.c_char)
 
             argc = len(args)
             argv = (LP_c_char * (argc + 1))()
@@ -74,22 +85,29 @@ try:
 except ImportError:
     WGRIB2_SUPPORT = False
 
-# Note: OutputGrabber class taken from: 
+try:
+    from .wgrib import capture as _capture
+except ImportError:
+    _capture = None
+
+# Note: OutputGrabber class adapted from:
 # https://stackoverflow.com/questions/24277488/in-python-how-to-capture-the-stdout-from-a-c-shared-library-to-a-variable
 class OutputGrabber(object):
     """
     Class used to grab standard output or another stream.
+
+    The stream's file descriptor is pointed at a pipe that a reader thread
+    drains while the capture is running, so large outputs cannot fill the
+    pipe and block the writer.
     """
-    escape_char = "\b"
+    chunk_size = 65536
 
-    def __init__(self, stream=None, threaded=False):
-        self.sleep = time.sleep
+    def __init__(self, stream=None, threaded=True):
         self.origstream = stream or sys.stdout
         self.threaded = threaded
         self.origstreamfd = self.origstream.fileno()
         self.capturedtext = ""
-        # Create a pipe so the stream can be captured:
-        self.pipe_out, self.pipe_in = os.pipe()
+        self._chunks = []
 
     def __enter__(self):
         self.start()
@@ -103,47 +121,51 @@ class OutputGrabber(object):
         Start capturing the stream data.
         """
         self.capturedtext = ""
+        self._chunks = []
+        self.origstream.flush()
+        # Create a pipe so the stream can be captured:
+        self.pipe_out, self.pipe_in = os.pipe()
         # Save a copy of the stream:
         self.streamfd = os.dup(self.origstreamfd)
         # Replace the original stream with our write pipe:
         os.dup2(self.pipe_in, self.origstreamfd)
         if self.threaded:
-            # Start thread that will read the stream:
+            # Start thread that will drain the pipe
             self.workerThread = threading.Thread(target=self.readOutput)
+            self.workerThread.daemon = True
             self.workerThread.start()
-            # Make sure that the thread is running and os.read() has executed:
-            time.sleep(0.5)
 
     def stop(self):
         """
         Stop capturing the stream data and save the text in `capturedtext`.
         """
-        # Print the escape character to make the readOutput method stop:
-        self.origstream.write(self.escape_char)
-        # Flush the stream to make sure all our data goes in before
-        # the escape character:
+        # Flush what C and python have buffered into the pipe:
         self.origstream.flush()
+        try:
+            ctypes.CDLL(None).fflush(None)
+        except (OSError, AttributeError, TypeError):
+            pass
+        # Restore the original stream and close both write ends, so the
+        # reader sees end of file:
+        os.dup2(self.streamfd, self.origstreamfd)
+        os.close(self.streamfd)
+        os.close(self.pipe_in)
         if self.threaded:
-            # wait until the thread finishes so we are sure that
-            # we have until the last character:
             self.workerThread.join()
         else:
             self.readOutput()
-        # Close the pipe:
         os.close(self.pipe_out)
-        # Restore the original stream:
-        os.dup2(self.streamfd, self.origstreamfd)
+        self.capturedtext = b''.join(self._chunks).decode('utf-8', 'replace')
 
     def readOutput(self):
         """
-        Read the stream data (one byte at a time)
-        and save the text in `capturedtext`.
+        Read the stream data until end of file.
         """
         while True:
-            char = os.read(self.pipe_out, 1)
-            if not char or self.escape_char in char:
+            data = os.read(self.pipe_out, self.chunk_size)
+            if not data:
                 break
-            self.capturedtext += str(char)
+            self._chunks.append(data)
 
 def grab_output(func, out_stream=sys.stdout, err_stream=sys.stderr):
     '''Captures low-level (C level) stdout/stderr'''
@@ -152,17 +174,17 @@ def grab_output(func, out_stream=sys.stdout, err_stream=sys.stderr):
         with OutputGrabber(out_stream) as stdout, \
             OutputGrabber(err_stream) as stderr:
             func(*args, **kwargs)
-        try:
-            out, err = stdout.capturedtext, stderr.capturedtext
-            time.sleep(0.5)
-        except TypeError:
-            pass
-        return out, err
+        return stdout.capturedtext, stderr.capturedtext
     return wrapper
-        
-@grab_output
-def check_wgrib_output(args=sys.argv, wgrib=WGribSharedLib.wgrib):
-    '''Returns tuple of (stdout, stderr) from wgrib CLI call'''
+
+def check_wgrib_output(args=sys.argv, wgrib=None):
+    '''Returns tuple of (stdout, stderr) from wgrib CLI call
+
+    wgrib 1 output is written to memory by the extension itself; wgrib2 and
+    the ctypes fallback have their file descriptors captured instead.
+    '''
     if (wgrib == 2 or wgrib == 'wgrib2') and WGRIB2_SUPPORT:
-        return wgrib2(args)
-    return wgrib(args)  # default fallback
+        return grab_output(wgrib2)(*args)
+    if wgrib is None and _capture is not None:
+        return _capture(*args)[1:]
+    return grab_output(wgrib or WGribSharedLib.wgrib)(args)  # default fallback
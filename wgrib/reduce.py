@@ -0,0 +1,158 @@
+"""
+Statistics of GRIB records computed while unpacking
+
+reduce() never stores a field: each record is unpacked a couple of
+thousand points at a time into a block that stays in the CPU cache, and
+every block is folded into running accumulators (count, min, max, mean
+and sum of squared deviations, histogram counts) before the next one is
+unpacked.  Over records (axis='time') the accumulators have one element
+per grid point, so a climatology of hundreds of time steps takes the
+memory of a few fields; per record (axis='record') they are scalars.
+"""
+from __future__ import print_function, unicode_literals
+
+import numpy
+
+from .gribfile import GribFile, _match, _shape
+from .wgrib import unpack_reduce as _unpack_reduce
+
+OPS = ('count', 'missing', 'min', 'max', 'mean', 'sum', 'var', 'std', 'hist')
+
+
+class _Accumulators(object):
+    '''Running statistics of `points` points'''
+
+    def __init__(self, ops, points, edges):
+        ops = set(ops)
+        self.count = numpy.zeros(points, dtype=numpy.int64)
+        self.min = numpy.full(points, numpy.inf) if 'min' in ops else None
+        self.max = numpy.full(points, -numpy.inf) if 'max' in ops else None
+        moments = ops & set(('mean', 'sum', 'var', 'std'))
+        self.mean = numpy.zeros(points) if moments else None
+        self.m2 = numpy.zeros(points) if moments & set(('var', 'std')) \
+            else None
+        self.edges = edges
+        self.hist = numpy.zeros((points, len(edges) - 1), dtype=numpy.int64) \
+            if 'hist' in ops else None
+
+    def fold(self, message, per_point):
+        _unpack_reduce(message, per_point, self.count, self.mean, self.m2,
+                       self.min, self.max, self.hist, self.edges)
+
+    def results(self, ops, total):
+        '''Statistics of a total of `total` points or records'''
+        empty = self.count == 0
+        out = {}
+        for op in ops:
+            if op == 'count':
+                value = self.count
+            elif op == 'missing':
+                value = total - self.count
+            elif op == 'sum':
+                value = self.mean * self.count
+            elif op in ('var', 'std'):
+                value = self.m2 / numpy.maximum(self.count, 1)
+                if op == 'std':
+                    value = numpy.sqrt(value)
+            elif op == 'hist':
+                value = self.hist
+            else:
+                value = getattr(self, op)
+            if op in ('min', 'max', 'mean', 'var', 'std'):
+                value = numpy.where(empty, numpy.nan, value)
+            out[op] = value
+        return out
+
+
+def _edges(bins, range):
+    if bins is None:
+        raise ValueError('hist needs bins')
+    if numpy.ndim(bins) == 0:
+        if range is None:
+            raise ValueError('hist with a number of bins needs a range')
+        return numpy.linspace(range[0], range[1], int(bins) + 1)
+    edges = numpy.ascontiguousarray(bins, dtype=numpy.float64)
+    if edges.ndim != 1 or len(edges) < 2 or (numpy.diff(edges) < 0).any():
+        raise ValueError('bins must be at least 2 increasing edges')
+    return edges
+
+
+def _records(sources, keys):
+    '''Records of GribFiles, paths or Records, selected by keys in files'''
+    if isinstance(sources, (type(''), bytes, GribFile)):
+        sources = [sources]
+    for source in sources:
+        if isinstance(source, GribFile):
+            grb = source
+        elif isinstance(source, (type(''), bytes)):
+            grb = GribFile(source)
+        else:
+            yield source
+            continue
+        try:
+            rows = numpy.flatnonzero(_match(grb.records, grb._key, **keys))
+            for i in rows:
+                yield grb[i]
+        finally:
+            if grb is not source:
+                grb.close()
+
+
+def reduce(records, ops=('min', 'max', 'mean'), axis='time', bins=None,
+           range=None, param=None, level=None, fcst=None, **fields):
+    '''Statistics of GRIB records computed while unpacking them
+
+    >>> stats = wgrib.reduce(sorted(glob.glob('gfs.*.grb')),
+    ...                      ops=['mean', 'std', 'hist'], param='TMP',
+    ...                      level='2 m above gnd', bins=numpy.arange(200, 331, 5))
+    >>> stats['mean'].shape, stats['hist'].shape
+    ((181, 360), (181, 360, 26))
+
+    `records` is a path, a GribFile or an iterable of them and/or of
+    Records; records of files are selected with the keys of
+    GribFile.select.  `ops` are any of OPS: count and missing (points
+    missing from the bitmap), min, max, mean, sum, var and std (population
+    variance), and hist, the counts in the bins of numpy.histogram given
+    by `bins` edges, or by a number of `bins` over `range`.
+
+    With axis='time' every statistic is over the records, one per grid
+    point (shaped as the field, plus the bins for hist); all records must
+    have the same number of points.  With axis='record' it is over the
+    points of each record, one per record.  Returns a dict of arrays, NaN
+    where no value was defined.
+    '''
+    ops = list(ops)
+    for op in ops:
+        if op not in OPS:
+            raise ValueError('unknown reduction {!r}'.format(op))
+    if axis not in ('time', 'record'):
+        raise ValueError("axis must be 'time' or 'record'")
+    edges = _edges(bins, range) if 'hist' in ops else None
+    keys = dict(param=param, level=level, fcst=fcst, fields=fields)
+
+    if axis == 'record':
+        results = []
+        for record in _records(records, keys):
+            acc = _Accumulators(ops, 1, edges)
+            acc.fold(record.message, False)
+            results.append(acc.results(ops, int(record.info['nxny'])))
+        return dict((op, numpy.array([r[op][0] for r in results]))
+                    for op in ops)
+
+    acc = shape = None
+    n = 0
+    for record in _records(records, keys):
+        if acc is None:
+            shape = _shape(record.info)
+            acc = _Accumulators(ops, int(record.info['nxny']), edges)
+        elif int(record.info['nxny']) != len(acc.count):
+            raise ValueError('record of {} points, expected {}'.format(
+                int(record.info['nxny']), len(acc.count)))
+        acc.fold(record.message, True)
+        n += 1
+    if acc is None:
+        raise ValueError('no records to reduce')
+    out = acc.results(ops, n)
+    for op in out:
+        out[op] = out[op].reshape(shape + out[op].shape[1:])
+    return out
@@ -0,0 +1,129 @@
+"""
+Long-lived wgrib session
+
+A Session pays the setup costs of wgrib once instead of on every call: it
+keeps one wgrib context (record buffer grown to the largest record seen,
+parsed user parameter table) and an LRU pool of open files, both as C
+handles for run() and as memory-mapped GribFiles for open()/read().
+Files are reopened when their size, mtime or inode change.
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import threading
+from collections import OrderedDict
+
+from .gribfile import GribFile
+from .wgrib import context as _context, context_stats as _context_stats, \
+    open_input as _open_input, run as _run
+
+
+class _Handle(object):
+    '''Open views of one file in the pool'''
+    __slots__ = ('key', 'input', 'gribfile')
+
+    def __init__(self, key):
+        self.key = key
+        self.input = None
+        self.gribfile = None
+
+    def close(self):
+        self.input = None  # fclose'd with the capsule
+        if self.gribfile is not None:
+            self.gribfile.close()
+            self.gribfile = None
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return (st.st_ino, st.st_size, getattr(st, 'st_mtime_ns', st.st_mtime))
+
+
+class Session(object):
+    '''Cached wgrib state for processes that make many calls
+
+    >>> with Session(max_files=32) as session:
+    ...     out, err = session.run('gfs.grb', '-s')
+    ...     field = session.read('gfs.grb', 0)
+    ...     print(session.stats)
+
+    A session can be shared between threads, calls are serialized.
+    '''
+
+    def __init__(self, max_files=16, index=None):
+        self.max_files = max_files
+        self.index = index
+        self.returncode = None
+        self._ctx = _context()
+        self._files = OrderedDict()
+        self._lock = threading.RLock()
+        self._counts = dict.fromkeys(
+            ('files_opened', 'files_reused', 'files_evicted'), 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _handle(self, path):
+        '''Pooled handle of path, reopened if the file changed'''
+        path = os.path.abspath(path)
+        key = _stat_key(path)
+        handle = self._files.pop(path, None)
+        if handle is not None and handle.key != key:
+            handle.close()
+            handle = None
+        if handle is None:
+            handle = _Handle(key)
+            self._counts['files_opened'] += 1
+        else:
+            self._counts['files_reused'] += 1
+        self._files[path] = handle
+        while len(self._files) > self.max_files:
+            self._files.popitem(last=False)[1].close()
+            self._counts['files_evicted'] += 1
+        return path, handle
+
+    def run(self, path, *options):
+        '''Runs wgrib on path, returns (stdout, stderr) like call_wgrib
+
+        The exit code is left in `returncode`.
+        '''
+        with self._lock:
+            path, handle = self._handle(path)
+            if handle.input is None:
+                handle.input = _open_input(path)
+            self.returncode, out, err = _run(self._ctx, handle.input, 'wgrib',
+                                             path, *options)
+            return out, err
+
+    def open(self, path):
+        '''Pooled GribFile of path, stays open until evicted or close()'''
+        with self._lock:
+            path, handle = self._handle(path)
+            if handle.gribfile is None:
+                handle.gribfile = GribFile(path, index=self.index)
+            return handle.gribfile
+
+    def read(self, path, record, out=None, masked=False):
+        '''Decodes record (number) of path, see GribFile.read'''
+        # under the lock, so no other call evicts the file while it is read
+        with self._lock:
+            return self.open(path).read(record, out, masked)
+
+    @property
+    def stats(self):
+        '''Counts of cached resources reused versus (re)built'''
+        with self._lock:
+            stats = dict(self._counts)
+            stats.update(_context_stats(self._ctx))
+            stats['open_files'] = len(self._files)
+            return stats
+
+    def close(self):
+        '''Closes all pooled files and frees the context'''
+        with self._lock:
+            while self._files:
+                self._files.popitem()[1].close()
+            self._ctx = None
@@ -0,0 +1,111 @@
+"""
+Reading GRIB records from a stream
+
+seek_grib/read_grib in wgrib.c need a seekable FILE *.  iter_records()
+instead reads forward only, from any binary file object (pipes, sockets,
+decompressors, sys.stdin.buffer) or iterable of byte chunks, through a
+rolling buffer that holds at most one message plus one chunk.  A message
+is handed out as soon as its end section has arrived.
+"""
+from __future__ import print_function, unicode_literals
+
+import select
+
+import numpy
+
+from .gribfile import Record
+from .inventory import RECORD_DTYPE
+from .wgrib import message_length as _message_length, \
+    record_info as _record_info
+
+CHUNK_SIZE = 1 << 16
+
+
+def _wait(source):
+    '''Blocks until a non-blocking file has data to read (or ends)'''
+    try:
+        fd = source.fileno()
+    except (AttributeError, OSError, ValueError):
+        raise ValueError('non-blocking stream without a file descriptor '
+                         'to wait on')
+    select.select([fd], [], [])
+
+
+def _chunks(source, chunk_size):
+    '''Byte chunks of a file object or an iterable of chunks'''
+    read = getattr(source, 'read', None)
+    if read is None:
+        for chunk in source:
+            yield chunk
+        return
+    while True:
+        chunk = read(chunk_size)
+        if chunk is None:
+            _wait(source)  # non-blocking file without data yet
+            continue
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_records(source, chunk_size=CHUNK_SIZE, max_length=None):
+    '''Yields the Records of a GRIB stream as they arrive
+
+    >>> for rec in wgrib.iter_records(sys.stdin.buffer):
+    ...     print(rec.offset, rec.kpds5, rec.decode().mean())
+
+    Each Record owns a copy of its message; `offset` is the byte position
+    in the stream.  Data between messages is skipped as wgrib does.  A
+    non-blocking file is waited on with select(), so it needs a fileno().
+    Raises ValueError for a message longer than `max_length` or without an
+    end section and EOFError if the stream ends inside a message.
+    '''
+    buf = bytearray()
+    base = 0    # stream offset of buf[0]
+    start = 0   # where to look for the next message in buf
+    chunks = _chunks(source, chunk_size)
+    exhausted = False
+
+    while True:
+        # find 'GRIB', then enough of the message to know its length
+        length = 0
+        while True:
+            i = buf.find(b'GRIB', start)
+            if i < 0:
+                start = max(start, len(buf) - 3)
+            else:
+                start = i
+                length = _message_length(memoryview(buf)[start:])
+                if length < 0:
+                    start += 1
+                    continue
+                if length > 0 and len(buf) - start >= length:
+                    break
+            if exhausted:
+                if i < 0:
+                    return
+                raise EOFError('GRIB message at offset {} is truncated'.format(
+                    base + start))
+            if max_length is not None and length > max_length:
+                raise ValueError('GRIB message at offset {} is {} bytes, '
+                                 'more than max_length'.format(base + start,
+                                                                length))
+            # drop what has been consumed before growing the buffer
+            if start:
+                del buf[:start]
+                base += start
+                start = 0
+            try:
+                buf += next(chunks)
+            except StopIteration:
+                exhausted = True
+
+        end = start + length
+        if buf[end - 4:end] != b'7777':
+            raise ValueError('GRIB message at offset {} has no end '
+                             'section'.format(base + start))
+        message = memoryview(bytes(buf[start:end]))
+        info = numpy.frombuffer(_record_info(message), dtype=RECORD_DTYPE)[0]
+        info['offset'] = base + start
+        start = end
+        yield Record(info, message)
@@ -0,0 +1,261 @@
+"""
+Names for the numeric PDS keys of an inventory
+
+Parameter names and level descriptions come from the same tables and
+code as the text inventory (k5toa, levels and PDStimes in wgrib.c), so
+`param_name(...)`, `level_text(...)` and `time_text(...)` match the `-s`
+output.  A TableRegistry fetches each parameter table from C once, as 256
+interned entries, and memoizes level and time range descriptions, so
+looking up a whole inventory costs one dictionary access per distinct key.
+"""
+from __future__ import print_function, unicode_literals
+
+import io
+import re
+from collections import namedtuple
+
+import numpy
+
+from .wgrib import param_table as _param_table, level_text as _level_text, \
+    time_text as _time_text
+
+# hours per forecast time unit (code table 4)
+_UNIT_HOURS = {
+    0: 1.0 / 60.0,      # minute
+    1: 1.0,             # hour
+    2: 24.0,            # day
+    10: 3.0,            # 3 hours
+    11: 6.0,            # 6 hours
+    12: 12.0,           # 12 hours
+    13: 0.25,           # 15 minutes
+    14: 0.5,            # 30 minutes
+    254: 1.0 / 3600.0,  # second
+}
+
+# gribtab lines starting a table: -1:center:subcenter:ptable
+_GRIBTAB_START = -1
+
+_UNITS = re.compile(r'^(.*?)\s*\[(.*)\]\s*$')
+
+Param = namedtuple('Param', 'name description units')
+
+
+class TableRegistry(object):
+    '''Interned parameter, level and time range descriptions
+
+    Parameter tables are resolved like wgrib does: a built-in table of
+    the center and table version, else the tables given to
+    load_user_table() or override() (merged entry by entry over the
+    gribtab file named by $GRIBTAB, or the NCEP opn table).  Tables added
+    with first=True are merged over the built-in tables too, as wgrib
+    compiled with P_TABLE_FIRST does.  Everything is built lazily, on the
+    first lookup of each key.
+    '''
+
+    def __init__(self):
+        self._strings = {}
+        self._builtin = {}  # table id -> 256 Params, shared between keys
+        self._tables = {}   # (center, subcenter, table, process) -> 256 Params
+        self._columns = {}  # (key, field) -> object array of 256
+        self._user = []     # ((center, subcenter, table), entries, first)
+        self._levels = {}
+        self._times = {}
+
+    def _intern(self, text):
+        return self._strings.setdefault(text, text)
+
+    def _param(self, name, comment):
+        name, comment = name or '', comment or ''
+        match = _UNITS.match(comment)
+        description, units = match.groups() if match else (comment, '')
+        return Param(self._intern(name), self._intern(description),
+                     self._intern(units))
+
+    def table(self, center, subcenter, table, process=0):
+        '''The 256 Params (indexed by kpds5) of a parameter table'''
+        key = (int(center), int(subcenter), int(table), int(process))
+        try:
+            return self._tables[key]
+        except KeyError:
+            pass
+        table_id, names, comments, builtin = _param_table(*key)
+        params = self._builtin.get(table_id)
+        if params is None:
+            params = tuple(self._param(name, comment)
+                           for name, comment in zip(names, comments))
+            if table_id is not None:
+                self._builtin[table_id] = params
+        for (c, s, t), entries, first in self._user:
+            if builtin and not first:
+                continue
+            if c in (-1, key[0]) and s in (-1, key[1]) and t in (-1, key[2]):
+                params = list(params)
+                for kpds5, param in entries.items():
+                    params[kpds5] = param
+                params = tuple(params)
+        self._tables[key] = params
+        return params
+
+    def param(self, center, subcenter, table, process, kpds5):
+        '''Param (name, description, units) of a parameter'''
+        return self.table(center, subcenter, table, process)[int(kpds5)]
+
+    def level(self, kpds6, kpds7, center=7):
+        '''Level description, e.g. '500 mb' '''
+        key = (int(kpds6), int(kpds7), int(center))
+        try:
+            return self._levels[key]
+        except KeyError:
+            text = self._levels[key] = self._intern(_level_text(*key))
+            return text
+
+    def time_range(self, time_range, p1, p2, time_unit):
+        '''Time range description, e.g. '0-6hr acc:' '''
+        key = (int(time_range), int(p1), int(p2), int(time_unit))
+        try:
+            return self._times[key]
+        except KeyError:
+            text = self._times[key] = self._intern(_time_text(*key))
+            return text
+
+    def override(self, center, subcenter, table, entries, first=False):
+        '''Replaces entries ({kpds5: (name, comment)}) of the parameter
+        tables matching center, subcenter and table (-1 matches any) that
+        have no built-in table, or of all of them if `first`'''
+        params = dict((int(kpds5), self._param(name, comment))
+                      for kpds5, (name, comment) in entries.items())
+        self._user.append(((int(center), int(subcenter), int(table)), params,
+                           bool(first)))
+        self._tables.clear()
+        self._columns.clear()
+
+    def load_user_table(self, path, first=False):
+        '''Merges a gribtab file (see setup_user_table in wgrib.c), over
+        the built-in tables too if `first`'''
+        current, entries = None, {}
+        with io.open(path, encoding='latin-1') as f:
+            for line in f:
+                fields = line.rstrip('\r\n').split(':', 3)
+                try:
+                    number = int(fields[0])
+                except ValueError:
+                    continue
+                if number == _GRIBTAB_START:
+                    if current is not None:
+                        self.override(*current, entries=entries, first=first)
+                    current = tuple(int(v) for v in fields[1:4])
+                    entries = {}
+                elif current is not None and len(fields) >= 3:
+                    entries[number] = (fields[1], ':'.join(fields[2:]))
+        if current is not None:
+            self.override(*current, entries=entries, first=first)
+
+    def _column(self, key, field):
+        try:
+            return self._columns[key, field]
+        except KeyError:
+            column = numpy.array([getattr(param, field)
+                                  for param in self.table(*key)], dtype=object)
+            self._columns[key, field] = column
+            return column
+
+    def params(self, records, field='name'):
+        '''`field` of the Param of every row of an inventory'''
+        out = numpy.empty(len(records), dtype=object)
+        if len(records) == 0:
+            return out
+        unique, inverse = _unique_keys(records, ('center', 'subcenter', 'table',
+                                                 'process'))
+        kpds5 = numpy.asarray(records['kpds5'], dtype=numpy.intp)
+        order = numpy.argsort(inverse, kind='stable')
+        bounds = numpy.cumsum(numpy.bincount(inverse))[:-1]
+        for key, rows in zip(unique.tolist(), numpy.split(order, bounds)):
+            out[rows] = self._column(tuple(key), field)[kpds5[rows]]
+        return out
+
+    def levels(self, records):
+        '''Level description of every row of an inventory'''
+        return _map_unique(records, ('kpds6', 'kpds7', 'center'), self.level)
+
+    def time_ranges(self, records):
+        '''Time range description of every row of an inventory'''
+        return _map_unique(records, ('time_range', 'p1', 'p2', 'time_unit'),
+                           self.time_range)
+
+
+def _unique_keys(records, fields):
+    '''Distinct rows of (up to four 16 bit) fields and the inverse index'''
+    keys = numpy.zeros(len(records), dtype=numpy.uint64)
+    for f in fields:
+        keys <<= numpy.uint64(16)
+        keys |= numpy.asarray(records[f]).astype(numpy.uint64) & \
+            numpy.uint64(0xffff)
+    unique, inverse = numpy.unique(keys, return_inverse=True)
+    rows = numpy.empty((len(unique), len(fields)), dtype=numpy.int64)
+    for i in range(len(fields)):
+        shift = numpy.uint64(16 * (len(fields) - 1 - i))
+        rows[:, i] = (unique >> shift) & numpy.uint64(0xffff)
+    return rows, inverse.reshape(-1)
+
+
+def _map_unique(records, fields, func):
+    '''Applies func once per distinct combination of fields'''
+    if len(records) == 0:
+        return numpy.empty(0, dtype=object)
+    unique, inverse = _unique_keys(records, fields)
+    values = numpy.array([func(*row) for row in unique.tolist()], dtype=object)
+    return values[inverse]
+
+
+# shared by the module level functions and GribFile.select
+registry = TableRegistry()
+
+
+def param_name(center, subcenter, table, process, kpds5):
+    '''Abbreviated parameter name, e.g. 'TMP' '''
+    return registry.param(center, subcenter, table, process, kpds5).name
+
+
+def level_text(kpds6, kpds7, center=7):
+    '''Level description, e.g. '500 mb' '''
+    return registry.level(kpds6, kpds7, center)
+
+
+def time_text(time_range, p1, p2, time_unit):
+    '''Time range description, e.g. 'anl:' '''
+    return registry.time_range(time_range, p1, p2, time_unit)
+
+
+def load_user_table(path, first=False):
+    '''Merges a gribtab file into the shared registry'''
+    registry.load_user_table(path, first)
+
+
+def param_names(records):
+    '''Parameter name of every row of an inventory'''
+    return registry.params(records)
+
+
+def level_texts(records):
+    '''Level description of every row of an inventory'''
+    return registry.levels(records)
+
+
+def time_texts(records):
+    '''Time range description of every row of an inventory'''
+    return registry.time_ranges(records)
+
+
+def forecast_hours(records):
+    '''Forecast time in hours (as in verf_time), NaN for unknown units'''
+    tr = numpy.asarray(records['time_range'])
+    p1 = numpy.asarray(records['p1'], dtype=numpy.float64)
+    p2 = numpy.asarray(records['p2'], dtype=numpy.float64)
+    dtime = numpy.where(tr == 10, p1 * 256 + p2, p1)
+    dtime = numpy.where((tr > 1) & (tr < 6), p2, dtime)
+    dtime = numpy.where((tr == 6) | (tr == 7), -p1, dtime)
+    unit = numpy.asarray(records['time_unit'])
+    scale = numpy.full(unit.shape, numpy.nan)
+    for code, hours in _UNIT_HOURS.items():
+        scale[unit == code] = hours
+    return dtime * scale
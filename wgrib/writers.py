@@ -0,0 +1,274 @@
+"""
+Writing decoded fields in bulk
+
+The writers take whole float32 fields and convert them with one numpy
+cast each (byte swapping included), into a buffer reused from field to
+field, so nothing is done value by value.  Output goes through large
+file buffers and export() writes any number of records of a GribFile in
+one pass:
+
+    ieee    big endian IEEE floats, f77 record markers (wgrib -ieee)
+    bin     native floats, native record markers (wgrib -bin)
+    npy     one (records, ...) array in a .npy file
+    zarr    chunked, zlib compressed zarr (v2) directory store
+
+Missing points are NaN in npy and zarr; the flat binary formats write
+them as `undefined`, 9.999e20 like wgrib unless set (None for NaN).
+"""
+from __future__ import print_function, unicode_literals
+
+import json
+import os
+import re
+import struct
+import zlib
+
+import numpy
+
+BUFFER_SIZE = 1 << 22
+UNDEFINED = 9.999e20
+
+_NPY_MAGIC = b'\x93NUMPY\x01\x00'
+_NPY_HEADER = 128  # room for any (records, ny, nx) shape
+_CHUNK = re.compile(r'^\d+(\.\d+)*$')  # chunk file names of a zarr store
+
+
+class _Writer(object):
+    '''Fields appended to one output, base of the writers'''
+
+    count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def write_many(self, fields):
+        '''Writes every field of an iterable'''
+        for field in fields:
+            self.write(field)
+        return self
+
+
+class BinaryWriter(_Writer):
+    '''Flat float32 records, as written by wgrib -bin or -ieee
+
+    `dtype` is '>f4' for IEEE big endian or '=f4' for native floats; the
+    f77 record markers (byte count before and after each field, if
+    `header`) have the same byte order.  Missing points are written as
+    `undefined`, or NaN if it is None.
+    '''
+
+    def __init__(self, path, dtype='>f4', header=True, undefined=UNDEFINED,
+                 buffer_size=BUFFER_SIZE):
+        self.dtype = numpy.dtype(dtype)
+        self.header = header
+        self.undefined = undefined
+        self._marker = numpy.dtype(self.dtype.byteorder + 'u4')
+        self._buffer = numpy.empty(0, dtype=self.dtype)
+        self._file = open(path, 'wb', buffering=buffer_size)
+
+    def write(self, field):
+        '''Appends one field (any shape, written in C order)'''
+        field = numpy.asarray(field)
+        n = field.size
+        if len(self._buffer) < n:
+            self._buffer = numpy.empty(n, dtype=self.dtype)
+        out = self._buffer[:n]
+        out[...] = field.reshape(-1)
+        if self.undefined is not None:
+            out[numpy.isnan(out)] = self.undefined
+        if self.header:
+            marker = numpy.array(4 * n, dtype=self._marker).tobytes()
+            self._file.write(marker)
+            self._file.write(memoryview(out))
+            self._file.write(marker)
+        else:
+            self._file.write(memoryview(out))
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+
+class NpyWriter(_Writer):
+    '''Fields of one shape stacked into a .npy file
+
+    The header is rewritten by close() with the number of fields written.
+    '''
+
+    def __init__(self, path, buffer_size=BUFFER_SIZE):
+        self.shape = None
+        self._file = open(path, 'wb', buffering=buffer_size)
+        self._file.write(self._header(0, ()))
+
+    @staticmethod
+    def _header(count, shape):
+        text = "{{'descr': '<f4', 'fortran_order': False, 'shape': {}, }}" \
+            .format(tuple((count,) + shape)).encode('latin-1')
+        size = _NPY_HEADER - len(_NPY_MAGIC) - 2
+        if len(text) + 1 > size:
+            raise ValueError('shape {} too long for the npy header'.format(
+                shape))
+        return _NPY_MAGIC + struct.pack('<H', size) + text + \
+            b' ' * (size - len(text) - 1) + b'\n'
+
+    def write(self, field):
+        '''Appends one field, all fields must have the same shape'''
+        field = numpy.asarray(field)
+        if self.shape is None:
+            self.shape = field.shape
+        elif field.shape != self.shape:
+            raise ValueError('field of shape {}, expected {}'.format(
+                field.shape, self.shape))
+        self._file.write(memoryview(numpy.ascontiguousarray(field,
+                                                            dtype='<f4')))
+        self.count += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.seek(0)
+        self._file.write(self._header(self.count, self.shape or ()))
+        self._file.close()
+
+
+class ZarrWriter(_Writer):
+    '''Fields of one shape stacked into a zarr (v2) directory store
+
+    The array is float32 with NaN fill, `chunks` (records, ...) defaults
+    to one chunk per field, each compressed with zlib at `level`.  Chunks
+    only holding NaN are not written.  An array already at `path` is
+    replaced.  Readable with zarr or xarray:
+
+        zarr.open('t2m.zarr')[10, 100:200, 300:400]
+    '''
+
+    def __init__(self, path, chunks=None, level=1):
+        self.path = path
+        self.shape = None
+        self.chunks = None if chunks is None else tuple(chunks)
+        self.level = level
+        self._pending = None
+        self._rows = 0
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+            self._clear()
+
+    def _clear(self):
+        '''Removes the array already at path, chunks left would show through'''
+        names = os.listdir(self.path)
+        other = [name for name in names if not _CHUNK.match(name)
+                 and name not in ('.zarray', '.zattrs')]
+        if other:
+            raise ValueError('{} is not a zarr array ({})'.format(
+                self.path, other[0]))
+        for name in names:
+            os.remove(os.path.join(self.path, name))
+
+    def _start(self, shape):
+        self.shape = shape
+        if self.chunks is None:
+            self.chunks = (1,) + shape
+        if len(self.chunks) != 1 + len(shape):
+            raise ValueError('chunks {} do not match fields of shape {}'.format(
+                self.chunks, shape))
+        self._pending = numpy.full(self.chunks[:1] + shape, numpy.nan,
+                                   dtype='<f4')
+
+    def write(self, field):
+        '''Appends one field, all fields must have the same shape'''
+        field = numpy.asarray(field)
+        if self.shape is None:
+            self._start(field.shape)
+        elif field.shape != self.shape:
+            raise ValueError('field of shape {}, expected {}'.format(
+                field.shape, self.shape))
+        self._pending[self._rows] = field
+        self._rows += 1
+        self.count += 1
+        if self._rows == self.chunks[0]:
+            self._flush()
+
+    def _flush(self):
+        block = self._pending
+        first = (self.count - self._rows) // self.chunks[0]
+        if self._rows < len(block):
+            block[self._rows:] = numpy.nan  # edge chunks are full size
+        grid = [range(0, n, c) for n, c in zip(self.shape, self.chunks[1:])]
+        for starts in numpy.ndindex(*[len(g) for g in grid]):
+            index = tuple(slice(g[i], g[i] + c)
+                          for g, i, c in zip(grid, starts, self.chunks[1:]))
+            chunk = block[(slice(None),) + index]
+            if numpy.isnan(chunk).all():
+                continue
+            if chunk.shape[1:] != self.chunks[1:]:
+                full = numpy.full(self.chunks, numpy.nan, dtype='<f4')
+                full[tuple(slice(0, n) for n in chunk.shape)] = chunk
+                chunk = full
+            name = '.'.join(str(i) for i in (first,) + starts)
+            with open(os.path.join(self.path, name), 'wb') as f:
+                f.write(zlib.compress(numpy.ascontiguousarray(chunk).tobytes(),
+                                      self.level))
+        self._rows = 0
+
+    def close(self):
+        if self.shape is None:
+            return
+        if self._rows:
+            self._flush()
+        meta = {
+            'zarr_format': 2,
+            'shape': [self.count] + list(self.shape),
+            'chunks': list(self.chunks),
+            'dtype': '<f4',
+            'compressor': {'id': 'zlib', 'level': self.level},
+            'fill_value': 'NaN',
+            'order': 'C',
+            'filters': None,
+        }
+        with open(os.path.join(self.path, '.zarray'), 'w') as f:
+            json.dump(meta, f, indent=4, sort_keys=True)
+
+
+def writer(path, format='ieee', **options):
+    '''Writer of a format (see the module doc) to path'''
+    if format == 'ieee':
+        return BinaryWriter(path, '>f4', **options)
+    if format == 'bin':
+        return BinaryWriter(path, '=f4', **options)
+    if format == 'npy':
+        return NpyWriter(path, **options)
+    if format == 'zarr':
+        return ZarrWriter(path, **options)
+    raise ValueError('unknown format {!r}'.format(format))
+
+
+def export(grb, path, format='ieee', records=None, **options):
+    '''Decodes records (all by default) of a GribFile and writes them
+
+    >>> with wgrib.GribFile('gfs.grb') as grb:
+    ...     wgrib.export(grb, 'tmp.ieee', records=grb.select(param='TMP'))
+
+    `records` may be record numbers, Records or inventory rows.  Each
+    field is decoded into a buffer reused for records of the same grid.
+    Returns the number of records written.
+    '''
+    if records is None:
+        records = range(len(grb))
+    elif isinstance(records, numpy.ndarray) and records.dtype.names:
+        records = [grb.record_at(offset) for offset in records['offset']]
+    buffers = {}
+    with writer(path, format, **options) as out:
+        for record in records:
+            if not hasattr(record, 'info'):
+                record = grb[record]
+            key = (int(record.info['nx']), int(record.info['ny']),
+                   int(record.info['nxny']))
+            buffers[key] = field = grb.read(record, buffers.get(key))
+            out.write(field)
+    return out.count